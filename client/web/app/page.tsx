@@ -17,6 +17,8 @@ import { fetchStacks, createStack } from "./utils/actions";
 export default function Home() {
   const [stacks, setStacks] = useState<Stack[]>([]);
   const [isLoading, setIsLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [isCreateModalOpen, setIsCreateModalOpen] = useState(false);
   const [newStackName, setNewStackName] = useState("");
   const [newStackDescription, setNewStackDescription] = useState("");
@@ -25,8 +27,9 @@ export default function Home() {
     const loadStacks = async () => {
       try {
         setIsLoading(true);
-        const data = await fetchStacks();
-        setStacks(data);
+        const page = await fetchStacks();
+        setStacks(page.stacks);
+        setNextCursor(page.nextCursor);
       } catch (error) {
         console.error("Failed to fetch stacks:", error);
       } finally {
@@ -36,6 +39,24 @@ export default function Home() {
     loadStacks();
   }, []);
 
+  const loadMoreStacks = async () => {
+    if (!nextCursor) return;
+    try {
+      setIsLoadingMore(true);
+      const page = await fetchStacks(nextCursor);
+      // Stacks created here meanwhile can show up again on a later page.
+      setStacks((current) => [
+        ...current,
+        ...page.stacks.filter((stack: Stack) => !current.some((s) => s.id === stack.id)),
+      ]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Failed to fetch stacks:", error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleCreateStack = async () => {
     if (!newStackName.trim()) return;
 
@@ -133,6 +154,19 @@ export default function Home() {
             ))}
           </div>
         )}
+        {!isLoading && nextCursor && (
+          <div className="flex justify-center py-8">
+            <Button
+              onClick={loadMoreStacks}
+              disabled={isLoadingMore}
+              variant="outline"
+              className="flex items-center gap-2 text-gray-700 border-gray-300 hover:bg-gray-50"
+            >
+              {isLoadingMore && <Loader2 className="w-4 h-4 animate-spin" />}
+              Load more
+            </Button>
+          </div>
+        )}
       </main>
       <Dialog open={isCreateModalOpen} onOpenChange={setIsCreateModalOpen}>
         <DialogContent className="sm:max-w-md">
@@ -1,5 +1,7 @@
-export const fetchStacks = async () => {
-  const response = await fetch(`${process.env.NEXT_PUBLIC_SERVER_URL}/stacks`, {
+export const fetchStacks = async (cursor?: string | null) => {
+  // One page of the stack list; nextCursor is null on the last page.
+  const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+  const response = await fetch(`${process.env.NEXT_PUBLIC_SERVER_URL}/stacks/${query}`, {
     method: "GET",
     headers: {
       "Content-Type": "application/json",
@@ -10,7 +12,10 @@ export const fetchStacks = async () => {
     throw new Error("Failed to fetch stacks");
   }
 
-  return response.json();
+  return {
+    stacks: await response.json(),
+    nextCursor: response.headers.get("X-Next-Cursor"),
+  };
 };
 
 export const createStack = async (name: string, description: string) => {
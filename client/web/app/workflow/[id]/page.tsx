@@ -502,6 +502,26 @@ const CustomNode = ({ data, selected }: any) => {
                   </SelectContent>
                 </Select>
               </div>
+              <div>
+                <label className="text-xs font-medium text-gray-700">
+                  Embedding Backend
+                </label>
+                <Select
+                  value={data.nodeData?.embeddingBackend || "torch"}
+                  onValueChange={(value: any) =>
+                    data.updateNodeData?.(data.nodeId, "embeddingBackend", value)
+                  }
+                >
+                  <SelectTrigger className="mt-1 h-8 text-xs">
+                    <SelectValue />
+                  </SelectTrigger>
+                  <SelectContent>
+                    <SelectItem value="torch">PyTorch</SelectItem>
+                    <SelectItem value="onnx">ONNX</SelectItem>
+                    <SelectItem value="onnx-int8">ONNX (int8)</SelectItem>
+                  </SelectContent>
+                </Select>
+              </div>
               <div>
                 <label className="text-xs font-medium text-gray-700">
                   API Key
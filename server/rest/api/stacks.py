@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from models.document import Document
 from models.stack import Stack
 from db import SessionLocal
+from services.content_store import content_store
+from services.indexing import drop_knowledge_base
+from services.plan import plan_cache
+from utils.pagination import finish_page, keyset_page, page_size
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
@@ -43,10 +48,15 @@ async def create_stack(stack: StackCreate, db: AsyncSession = Depends(get_db)):
     return new_stack
 
 @router.get("/", response_model=List[StackRead])
-async def list_stacks(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Stack))
-    stacks = result.scalars().all()
-    return stacks
+async def list_stacks(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    limit = page_size(limit)
+    result = await db.execute(keyset_page(select(Stack), Stack.created_at, Stack.id, cursor, limit))
+    return finish_page(result.scalars().all(), limit, response)
 
 @router.get("/{stack_id}", response_model=StackRead)
 async def get_stack(stack_id: str, db: AsyncSession = Depends(get_db)):
@@ -74,6 +84,11 @@ async def delete_stack(stack_id: str, db: AsyncSession = Depends(get_db)):
     db_stack = result.scalar_one_or_none()
     if not db_stack:
         raise HTTPException(status_code=404, detail="Stack not found")
+    result = await db.execute(select(Document.content_hash).where(Document.stack_id == stack_id))
+    content_hashes = set(result.scalars().all())
     await db.delete(db_stack)
     await db.commit()
+    plan_cache.invalidate(stack_id)
+    await drop_knowledge_base(stack_id)
+    await content_store.release_unreferenced(db, content_hashes)
     return {"detail": "Stack deleted"}
\ No newline at end of file
@@ -0,0 +1,62 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+from services.admission import admission, builds
+from services.content_store import content_store
+from services.embeddings import embedding_registry
+from services.embedding_batcher import embedding_batcher
+from services.executor import pool_stats
+from services.http_clients import http_clients
+from services.metrics import render_metrics
+from services.ingestion import ingestion_queue
+from services.lexical_index import lexical_index
+from services.plan import plan_cache
+from services.readiness import readiness
+from services.search_cache import search_cache
+from services.semantic_cache import semantic_cache
+from services.vector_store import vector_store
+
+router = APIRouter(prefix="/system", tags=["system"])
+# Prometheus scrapes /metrics by default, so it lives outside the /system prefix.
+metrics_router = APIRouter(tags=["system"])
+
+
+def component_stats():
+    return {
+        "embedding_models": embedding_registry.stats(),
+        "embedding_batches": embedding_batcher.stats(),
+        "pools": pool_stats(),
+        "ingestion": ingestion_queue.stats(),
+        "plans": plan_cache.stats(),
+        "search_cache": search_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "content_store": content_store.stats(),
+        "vector_store": vector_store.stats(),
+        "lexical_index": lexical_index.stats(),
+        "upstreams": http_clients.stats(),
+        "admission": admission.stats(),
+        "builds": builds.stats(),
+    }
+
+
+@router.get("/stats")
+async def get_stats():
+    return component_stats()
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        render_metrics(component_stats()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@router.get("/health")
+async def get_health():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def get_ready():
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
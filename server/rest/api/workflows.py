@@ -1,29 +1,74 @@
-import httpx
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.routing import APIRoute
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update
 from sqlalchemy.future import select
+from models.document import Document
 from models.workflow import Workflow
+from models.ingestion_job import IngestionJob
 from db import SessionLocal
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, List, Optional, Dict, Any
 from datetime import datetime
 import os
+import time
 import uuid
+import hashlib
+import asyncio
+import weakref
+from contextlib import aclosing, asynccontextmanager
 from fastapi import UploadFile, File
-from fastapi.responses import FileResponse
-import google.generativeai as genai
-from sentence_transformers import SentenceTransformer
-import chromadb
-import fitz
+from fastapi.responses import FileResponse, StreamingResponse
 import logging
-from serpapi import GoogleSearch
 import json
+from services.admission import Overloaded, Ticket, admission, builds
+from services.content_store import content_store
+from services.executor import run_cpu, run_io
+from services.indexing import reconcile_knowledge_base
+from services.ingestion import ingestion_queue
+from services.llm import stream as llm_stream
+from services.graph import GraphRun, execute_plan, prefetch_batch
+from services.pipeline import sse_event
+from services.semantic_cache import semantic_cache
+from services.plan import ExecutionPlan, PlanError, get_plan, load_documents, plan_cache
+from utils.documents import UPLOAD_DIR, pdf_page_count
+from utils.pagination import finish_page, keyset_page, page_size
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 
-router = APIRouter(prefix="/workflows", tags=["workflows"])
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "512")) * 1024 * 1024
+# Room for the multipart boundaries and part headers around the file.
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit"
+    )
+
+
+class UploadLimitRoute(APIRoute):
+    """Turns a request away on its Content-Length alone when the body can't
+    fit under MAX_UPLOAD_BYTES. FastAPI receives (and spools to disk) the
+    whole multipart form before the endpoint runs, so save_upload's own
+    check only catches bodies sent without a length."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def limited(request: Request):
+            length = request.headers.get("content-length", "")
+            if length.isdigit() and int(length) > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD:
+                raise upload_too_large()
+            return await handler(request)
+
+        return limited
+
+
+router = APIRouter(prefix="/workflows", tags=["workflows"], route_class=UploadLimitRoute)
 
 class WorkflowCreate(BaseModel):
     stack_id: str
@@ -39,6 +84,17 @@ class WorkflowRead(BaseModel):
     nodes: List[Dict[str, Any]]
     edges: List[Dict[str, Any]]
     data: Dict[str, Any]
+    version: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class WorkflowSummary(BaseModel):
+    id: str
+    stack_id: str
+    version: Optional[int] = None
+    created_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
@@ -54,300 +110,378 @@ class WorkflowData(BaseModel):
 class ChatRequest(BaseModel):
     message: str
 
+class ChatBatchRequest(BaseModel):
+    messages: List[str]
+    concurrency: Optional[int] = None
+
 class ChatResponse(BaseModel):
     response: str
     context_used: dict
+    cached: bool = False
+    prompt_tokens: Optional[int] = None
+    timings: Dict[str, float] = {}
 
+class IngestionJobRead(BaseModel):
+    id: str
+    stack_id: str
+    document_id: str
+    file_name: Optional[str]
+    status: str
+    stage: Optional[str]
+    progress: float
+    chunks: int
+    error: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
 
+    class Config:
+        orm_mode = True
 
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
-
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-chroma_client = chromadb.PersistentClient(path="chroma_db")
 
-def parse_pdf(path: str) -> str:
-    doc = fitz.open(path)
-    text = ""
-    for page in doc:
-        text += page.get_text("text")
-    return text
+class DocumentRead(BaseModel):
+    id: str
+    stack_id: str
+    file_name: Optional[str]
+    size: Optional[int]
+    content_hash: Optional[str]
+    page_count: Optional[int]
+    status: str
+    chunks: int
+    error: Optional[str]
+    created_at: Optional[datetime]
 
+    class Config:
+        orm_mode = True
 
-def chunk_text(text: str, chunk_size=500, overlap=50):
-    words = text.split()
-    chunks = []
-    start = 0
-    while start < len(words):
-        end = min(start + chunk_size, len(words))
-        chunks.append(" ".join(words[start:end]))
-        start += chunk_size - overlap
-    return chunks
+async def get_db():
+    async with SessionLocal() as session:
+        yield session
 
-@router.post("/{stack_id}/build")
-async def build_workflow(stack_id: str, db: AsyncSession = Depends(get_db)):
-    # 1. Fetch workflow from DB
-    result = await db.execute(select(Workflow).where(Workflow.stack_id == stack_id))
-    workflow = result.scalar_one_or_none()
-    if not workflow:
+CHAT_BATCH_MAX_MESSAGES = int(os.getenv("CHAT_BATCH_MAX_MESSAGES", "1000"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+
+async def save_upload(file: UploadFile, file_path: str) -> tuple[int, str]:
+    # Copy the upload to disk one chunk at a time so large PDFs never sit in
+    # memory whole; partial files are removed if the size limit is hit. The
+    # content hash is computed on the way through.
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                digest.update(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise upload_too_large()
+                await run_io(f.write, chunk)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return size, digest.hexdigest()
+
+async def load_plan(stack_id: str, db: AsyncSession) -> ExecutionPlan:
+    try:
+        plan = await get_plan(stack_id, db)
+    except PlanError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid workflow: {e}")
+    if plan is None:
         logger.error("❌ Workflow not found")
         raise HTTPException(status_code=404, detail="Workflow not found")
-    logger.info("✅ Workflow loaded from DB")
+    return plan
 
-    nodes = workflow.nodes or []
-    node_types = {n["data"]["type"]: n for n in nodes}
-    logger.info(f"📦 Found {len(nodes)} nodes: {list(node_types.keys())}")
+
+async def prepare_build(stack_id: str, db: AsyncSession, stream: bool = False) -> Dict[str, Any]:
+    # 1. Load the compiled workflow plan (from cache when hot)
+    plan = await load_plan(stack_id, db)
+    logger.info(f"📦 Workflow v{plan.version} nodes: {list(plan.node_types)}")
 
     # 2. Validate workflow
-    if "llm" not in node_types or "output" not in node_types:
+    if plan.llm is None or not plan.has_output:
         logger.error("❌ Missing required nodes (llm/output)")
         raise HTTPException(
             status_code=400,
             detail="Workflow must include both an LLM node and an Output node"
         )
 
-    context_chunks: list[str] = []   # <-- now declared here
-    model = None
-    collection = None
+    kb = plan.knowledge_base
+    kb_ready = False
+    pending_jobs: list[str] = []
 
     # 3. Knowledge Base (optional)
-    if "knowledge-base" in node_types:
-        logger.info("📖 Processing knowledge base node")
-        kb_node = node_types["knowledge-base"]
-        embedding_model_name = (
-            kb_node["data"].get("nodeData", {}).get("embeddingModel", "all-MiniLM-L6-v2")
-        )
-        logger.info(f"🔑 Using embedding model: {embedding_model_name}")
-        model = SentenceTransformer(embedding_model_name)
-
-        # 🔍 Ensure workflow.data is a dict
-        raw_data = workflow.data or {}
-        print("Raw workflow data:", raw_data)
-        if isinstance(raw_data, str):
-            try:
-                raw_data = json.loads(raw_data)
-                logger.info("🪣 Parsed workflow.data from JSON string")
-            except Exception as e:
-                logger.error(f"❌ Failed to parse workflow.data JSON: {e}")
-                raw_data = {}
-
-        logger.info(f"📂 Workflow data keys: {list(raw_data.keys())}")
-        documents = raw_data.get("documents", [])
-        if not documents:
-            for key, value in raw_data.items():
-                if key.startswith("knowledge-base") and isinstance(value, dict):
-                    doc_meta = {
-                        "id": value.get("documentId"),
-                        "file_name": value.get("fileName"),
-                        "path": os.path.join(UPLOAD_DIR, f"{value.get('documentId')}_{value.get('fileName')}")
-                    }
-                    documents.append(doc_meta)
-        logger.info(f"📄 Found {len(documents)} documents for KB: {documents}")
-
-        for doc in documents:
-            file_path = doc.get("path")
-            logger.info(f"➡️ Looking for document at: {file_path}")
-            if file_path and os.path.exists(file_path):
-                logger.info(f"📥 Parsing {file_path}")
-                text = parse_pdf(file_path)
-                chunks = chunk_text(text)
-                logger.info(f"   ✅ {len(chunks)} chunks extracted")
-                context_chunks.extend(chunks)
+    if kb:
+        logger.info(f"📖 Processing knowledge base node (embedding model: {kb.embedding_model})")
+        # Reconcile deletes the chunks of every document it isn't given, so
+        # read the list fresh: a cached plan (up to PLAN_CACHE_TTL old, per
+        # worker) can predate an upload handled by another worker.
+        documents = await load_documents(stack_id, db)
+        logger.info(f"📄 Found {len(documents)} documents for KB")
+
+        summary = await reconcile_knowledge_base(stack_id, documents, kb.embedding_model)
+        logger.info(f"🪣 KB index has {summary['chunks']} chunks ({summary['removed']} documents removed)")
+
+        # Documents that were never ingested (e.g. uploaded before background
+        # ingestion existed) are queued rather than parsed inline.
+        active = await ingestion_queue.active_document_ids(db, stack_id)
+        for doc in summary["missing"]:
+            if doc["id"] in active:
+                pending_jobs.append(doc["id"])
+            elif doc.get("path") and os.path.exists(doc["path"]):
+                job = await ingestion_queue.submit(db, stack_id, doc)
+                pending_jobs.append(doc["id"])
+                logger.info(f"📥 Queued ingestion job {job.id} for {doc.get('file_name')}")
             else:
-                logger.warning(f"⚠️ File not found: {file_path}")
-
-        if context_chunks:
-            logger.info(f"🪣 Adding {len(context_chunks)} chunks to Chroma collection")
-            collection_name = f"kb-{stack_id}"
-            existing_collections = [c.name for c in chroma_client.list_collections()]
-            if collection_name in existing_collections:
-                chroma_client.delete_collection(name=collection_name)
-
-            # Create a fresh collection
-            collection = chroma_client.get_or_create_collection(name=collection_name)
-            embeddings = model.encode(context_chunks).tolist()
-            collection.add(
-                documents=context_chunks,
-                embeddings=embeddings,
-                ids=[f"{stack_id}-doc-{i}" for i in range(len(context_chunks))]
-            )
-        else:
-            logger.info("⚠️ No context chunks extracted from KB")
+                logger.warning(f"⚠️ File not found: {doc.get('path')}")
+
+        kb_ready = summary["chunks"] > 0
+        if not kb_ready:
+            logger.info("⚠️ Knowledge base index is empty")
 
     # 4. User Input
-    user_query = node_types.get("user-input", {}).get("data", {}).get("nodeData", {}).get("query")
+    user_query = plan.user_query
     if not user_query:
         logger.error("❌ Missing user query in input node")
         raise HTTPException(status_code=400, detail="User input node must contain a query")
     logger.info(f"🙋 User query: {user_query}")
 
-    retrieved_docs = []
-    if collection and model:
-        logger.info("🔎 Querying knowledge base for context")
-        query_embedding = model.encode(user_query).tolist()
-        results = collection.query(query_embeddings=[query_embedding], n_results=3)
-        retrieved_docs = results["documents"][0]
-        logger.info(f"   Retrieved {len(retrieved_docs)} docs from Chroma")
+    # 5. LLM Node Config
+    if any(not llm.api_key for llm in plan.configs("llm")):
+        logger.error("❌ Gemini API key missing in workflow")
+        raise HTTPException(status_code=400, detail="Gemini API key missing in workflow")
 
+    # 6. Run the workflow graph (retrieval, web search and LLM nodes)
+    result = await execute_plan(GraphRun(
+        plan=plan, query=user_query, use_knowledge_base=kb_ready, defer_final_llm=stream
+    ))
+    logger.info(f"⏱️ Node timings (ms): {result['timings']}")
+    result["pending_documents"] = pending_jobs
+    return result
 
-    # 5. LLM Node Config
-    llm_node = node_types["llm"]
-    node_data = llm_node["data"].get("nodeData", {})
 
-    gemini_key = node_data.get("apiKey")
-    gemini_model = node_data.get("model", "gemini-2.0-flash")
-    serpapi_key = node_data.get("serpApi")   # renamed for clarity
-    use_web = node_data.get("webSearch", False)
+async def prepare_chat(
+    stack_id: str, user_query: str, db: AsyncSession, stream: bool = False
+) -> Dict[str, Any]:
+    plan = await load_plan(stack_id, db)
 
-    if not gemini_key:
-        logger.error("❌ Gemini API key missing in workflow")
-        raise HTTPException(status_code=400, detail="Gemini API key missing in workflow")
+    if plan.llm is None:
+        raise HTTPException(status_code=400, detail="Workflow missing LLM node")
 
-    genai.configure(api_key=gemini_key)
-    logger.info(f"🤖 Configured Gemini with model={gemini_model}")
+    if any(not llm.api_key for llm in plan.configs("llm")):
+        raise HTTPException(status_code=400, detail="Gemini API key missing")
 
-    # 6. Web Search (SerpAPI integration)
-    web_context = ""
-    if use_web and serpapi_key:
-        logger.info("🌐 Performing web search with SerpAPI")
-        try:
-            search = GoogleSearch({
-                "engine": "google",
-                "q": user_query,
-                "api_key": serpapi_key
-            })
-            results = search.get_dict()
-
-            snippets = []
-            for item in results.get("organic_results", [])[:3]:
-                title = item.get("title", "")
-                link = item.get("link", "")
-                snippet = item.get("snippet", "")
-                snippets.append(f"{title} ({link}): {snippet}")
-
-            web_context = "\n".join(snippets)
-            logger.info(f"   Retrieved {len(snippets)} web snippets")
-
-        except Exception as e:
-            logger.error(f"❌ SerpAPI search failed: {e}")
-
-    # 7. Build final prompt
-    kb_context = "\n".join(retrieved_docs) if retrieved_docs else ""
-    combined_context = "\n\n".join([c for c in [kb_context, web_context] if c.strip()])
-
-    output_node = node_types.get("output")
-    output_data_str = ""
-    if output_node:
-        output_node_data = output_node.get("data", {}).get("nodeData", {})
-        if output_data_data := output_node_data.get("outputText"):
-            output_data_str = f"\n\nOutput: {output_data_data}"
-
-
-    logger.info(f"📝 Building prompt (context length={len(combined_context)})")
-    prompt = f"Context:\n{combined_context}{output_data_str}\n\nUser Query: {user_query}\nAnswer:"
-
-    # 8. Call Gemini
-    llm = genai.GenerativeModel(gemini_model)
-    logger.info("🚀 Sending prompt to Gemini")
-    response = llm.generate_content(prompt)
-    logger.info("✅ Gemini response received")
+    return await execute_plan(GraphRun(plan=plan, query=user_query, defer_final_llm=stream))
 
-    return {
-        "stack_id": stack_id,
-        "answer": response.text,
-        "context_used": {
-            "knowledge_base": retrieved_docs,
-            "web_search": web_context.split("\n") if web_context else []
-        }
-    }
 
-@router.post("/{stack_id}/chat", response_model=ChatResponse)
-async def chat_with_workflow(stack_id: str, req: ChatRequest, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Workflow).where(Workflow.stack_id == stack_id))
-    workflow = result.scalar_one_or_none()
-    if not workflow:
-        raise HTTPException(status_code=404, detail="Workflow not found")
+async def stream_answer(request: Request, prepared: Dict[str, Any], **extra) -> AsyncIterator[str]:
+    # Context goes out first so the client has something to render while the
+    # model is still thinking; deltas follow as Gemini produces them.
+    yield sse_event("context", {
+        "context_used": prepared["context_used"],
+        "timings": prepared["timings"],
+        "cached": prepared["cached"],
+        "prompt_tokens": prepared["prompt_tokens"],
+        **extra
+    })
+    if prepared["cached"]:
+        yield sse_event("delta", {"text": prepared["answer"]})
+        yield sse_event("done", {"response": prepared["answer"], "cached": True})
+        return
+
+    answer = []
+    started = time.perf_counter()
+    try:
+        async with aclosing(llm_stream(prepared["llm"], prepared["prompt"])) as deltas:
+            async for delta in deltas:
+                if await request.is_disconnected():
+                    logger.info("🔌 Client disconnected, cancelling LLM stream")
+                    return
+                answer.append(delta)
+                yield sse_event("delta", {"text": delta})
+    except Exception as e:
+        logger.error(f"❌ LLM stream failed: {e}")
+        yield sse_event("error", {"detail": str(e)})
+        return
+    if cache_entry := prepared.get("cache_entry"):
+        semantic_cache.store(
+            **cache_entry, answer="".join(answer), llm_seconds=time.perf_counter() - started
+        )
+    yield sse_event("done", {"response": "".join(answer), "cached": False})
 
-    nodes = workflow.nodes or []
-    print(nodes)
-    node_types = {n["data"]["type"]: n for n in nodes}
 
-    if "llm" not in node_types:
-        raise HTTPException(status_code=400, detail="Workflow missing LLM node")
+async def admit(stack_id: str) -> Ticket:
+    try:
+        return await admission.acquire(stack_id)
+    except Overloaded as e:
+        logger.warning(f"🚦 Turned away request for stack {stack_id}: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
 
-    user_query = req.message
 
-    retrieved_docs = []
-    model = None
-    collection = None
+@asynccontextmanager
+async def admitted(stack_id: str):
+    ticket = await admit(stack_id)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
 
-    if "knowledge-base" in node_types:
-        kb_node = node_types["knowledge-base"]
-        embedding_model_name = (
-            kb_node["data"].get("nodeData", {}).get("embeddingModel", "all-MiniLM-L6-v2")
-        )
-        model = SentenceTransformer(embedding_model_name)
 
+def holding(ticket: Ticket, events: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Keep ``ticket`` until the streamed body is done (or dropped unsent)."""
+    async def body():
         try:
-            collection = chroma_client.get_collection(name=f"kb-{stack_id}")
-            query_embedding = model.encode(user_query).tolist()
-            results = collection.query(query_embeddings=[query_embedding], n_results=3)
-            retrieved_docs = results["documents"][0]
-        except Exception as e:
-            logger.warning(f"⚠️ No existing Chroma collection for {stack_id}: {e}")
-
-    # 4. LLM Node Config
-    llm_node = node_types["llm"]
-    node_data = llm_node["data"].get("nodeData", {})
-
-    gemini_key = node_data.get("apiKey")
-    gemini_model = node_data.get("model", "gemini-2.0-flash")
-    serpapi_key = node_data.get("serpApi")
-    use_web = node_data.get("webSearch", False)
-
-    if not gemini_key:
-        raise HTTPException(status_code=400, detail="Gemini API key missing")
+            async for event in events:
+                yield event
+        finally:
+            ticket.release()
 
-    genai.configure(api_key=gemini_key)
+    wrapped = body()
+    # A body that never starts (client gone before the first send) never
+    # runs its finally; release when it is garbage collected instead.
+    weakref.finalize(wrapped, ticket.release)
+    return wrapped
 
-    web_context = ""
-    if use_web and serpapi_key:
-        try:
-            search = GoogleSearch({"engine": "google", "q": user_query, "api_key": serpapi_key})
-            results = search.get_dict()
-            snippets = []
-            for item in results.get("organic_results", [])[:3]:
-                snippets.append(f"{item.get('title')} ({item.get('link')}): {item.get('snippet')}")
-            web_context = "\n".join(snippets)
-        except Exception as e:
-            logger.error(f"SerpAPI search failed: {e}")
-
-    kb_context = "\n".join(retrieved_docs) if retrieved_docs else ""
-
-    output_node = node_types.get("output")
-    output_data_str = ""
-    if output_node:
-        output_node_data = output_node.get("data", {}).get("nodeData", {})
-        if output_data_data := output_node_data.get("outputText"):
-            output_data_str = f"\n\nOutput: {output_data_data}"
-    
-    print("Output Node Data:", output_data_str)
 
-    combined_context = "\n\n".join([c for c in [kb_context, web_context] if c.strip()])
-    prompt = f"Context:\n{combined_context}{output_data_str}\n\nUser Query: {user_query}\nAnswer:"
+async def build_once(stack_id: str, db: AsyncSession, stream: bool = False) -> Dict[str, Any]:
+    # Concurrent builds of the same workflow version (double-clicks, several
+    # tabs) share one run. It uses its own session so it outlives any single
+    # caller's request.
+    plan = await load_plan(stack_id, db)
+
+    async def run():
+        async with SessionLocal() as session:
+            return await prepare_build(stack_id, session, stream=stream)
+
+    return await builds.do((stack_id, plan.version, stream), run)
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/{stack_id}/build")
+async def build_workflow(stack_id: str, db: AsyncSession = Depends(get_db)):
+    async with admitted(stack_id):
+        prepared = await build_once(stack_id, db)
+    logger.info("✅ Gemini response received")
+
+    return {
+        "stack_id": stack_id,
+        "answer": prepared["answer"],
+        "context_used": prepared["context_used"],
+        "pending_documents": prepared["pending_documents"],
+        "cached": prepared["cached"],
+        "prompt_tokens": prepared["prompt_tokens"],
+        "timings": prepared["timings"]
+    }
+
+@router.post("/{stack_id}/build/stream")
+async def build_workflow_stream(stack_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    ticket = await admit(stack_id)
+    try:
+        prepared = await build_once(stack_id, db, stream=True)
+    except BaseException:
+        ticket.release()
+        raise
+    return sse_response(holding(ticket, stream_answer(
+        request, prepared, stack_id=stack_id, pending_documents=prepared["pending_documents"]
+    )))
 
-    llm = genai.GenerativeModel(gemini_model)
-    response = llm.generate_content(prompt)
+@router.post("/{stack_id}/chat", response_model=ChatResponse)
+async def chat_with_workflow(stack_id: str, req: ChatRequest, db: AsyncSession = Depends(get_db)):
+    async with admitted(stack_id):
+        prepared = await prepare_chat(stack_id, req.message, db)
 
     return ChatResponse(
-        response=response.text,
-        context_used={
-            "knowledge_base": retrieved_docs,
-            "web_search": web_context.split("\n") if web_context else []
+        response=prepared["answer"],
+        context_used=prepared["context_used"],
+        cached=prepared["cached"],
+        prompt_tokens=prepared["prompt_tokens"],
+        timings=prepared["timings"]
+    )
+
+@router.post("/{stack_id}/chat/stream")
+async def chat_with_workflow_stream(
+    stack_id: str,
+    req: ChatRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    ticket = await admit(stack_id)
+    try:
+        prepared = await prepare_chat(stack_id, req.message, db, stream=True)
+    except BaseException:
+        ticket.release()
+        raise
+    return sse_response(holding(ticket, stream_answer(request, prepared)))
+
+@router.post("/{stack_id}/chat/batch")
+async def chat_with_workflow_batch(
+    stack_id: str,
+    req: ChatBatchRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    if not req.messages:
+        raise HTTPException(status_code=400, detail="messages must not be empty")
+    if len(req.messages) > CHAT_BATCH_MAX_MESSAGES:
+        raise HTTPException(status_code=413, detail=f"At most {CHAT_BATCH_MAX_MESSAGES} messages per batch")
+
+    plan = await load_plan(stack_id, db)
+    if plan.llm is None:
+        raise HTTPException(status_code=400, detail="Workflow missing LLM node")
+    if any(not llm.api_key for llm in plan.configs("llm")):
+        raise HTTPException(status_code=400, detail="Gemini API key missing")
+
+    # The whole batch holds one admission slot; its own fan-out is bounded
+    # by CHAT_BATCH_CONCURRENCY below.
+    ticket = await admit(stack_id)
+    try:
+        # One encode per embedding model and one multi-query vector store
+        # call for the whole batch; only the LLM calls run per message.
+        prefetched = await prefetch_batch(plan, req.messages)
+    except BaseException:
+        ticket.release()
+        raise
+    concurrency = max(1, min(req.concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(index: int, message: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result = await execute_plan(GraphRun(plan=plan, query=message, **prefetched[index]))
+            except Exception as e:
+                logger.error(f"❌ Batch chat item {index} failed: {e}")
+                return {"index": index, "error": str(e)}
+        return {
+            "index": index,
+            "response": result["answer"],
+            "context_used": result["context_used"],
+            "cached": result["cached"],
+            "prompt_tokens": result["prompt_tokens"],
+            "timings": result["timings"],
         }
+
+    async def lines() -> AsyncIterator[str]:
+        tasks = [asyncio.create_task(answer(i, m)) for i, m in enumerate(req.messages)]
+        try:
+            # Results go out in completion order; "index" ties them back.
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                if await request.is_disconnected():
+                    logger.info("🔌 Client disconnected, cancelling batch chat")
+                    return
+                yield json.dumps(item) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        holding(ticket, lines()), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"}
     )
 
 
@@ -359,51 +493,84 @@ async def upload_document(
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db)
 ):
-    file_id = str(uuid.uuid4())
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}_{file.filename}")
-
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
-
-    result = await db.execute(select(Workflow).where(Workflow.stack_id == stack_id))
-    workflow = result.scalar_one_or_none()
-    if not workflow:
+    result = await db.execute(select(Workflow.id).where(Workflow.stack_id == stack_id))
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
-    if not isinstance(workflow.data, dict):
+    file_id = str(uuid.uuid4())
+    tmp_path = os.path.join(UPLOAD_DIR, f".{file_id}.part")
+    size, content_hash = await save_upload(file, tmp_path)
+    # Identical bytes are stored once, whichever stack uploads them. The
+    # blob is held until the row referencing it is committed, so a stack
+    # deletion can't release it in between.
+    async with content_store.hold(content_hash):
+        file_path = await run_io(content_store.adopt, tmp_path, content_hash, file.filename)
         try:
-            workflow.data = json.loads(workflow.data) if workflow.data else {}
+            page_count = await run_cpu(pdf_page_count, file_path)
         except Exception:
-            workflow.data = {}
+            page_count = None
+
+        # One row insert plus a version bump; the workflow JSON is not rewritten.
+        document = Document(
+            stack_id=stack_id,
+            id=file_id,
+            file_name=file.filename,
+            path=file_path,
+            size=size,
+            content_hash=content_hash,
+            page_count=page_count,
+            status="queued",
+        )
+        db.add(document)
+        result = await db.execute(
+            update(Workflow)
+            .where(Workflow.stack_id == stack_id)
+            .values(version=Workflow.version + 1)
+            .returning(Workflow.version)
+        )
+        version = result.scalar_one()
+        await db.commit()
+    plan_cache.invalidate(stack_id, version)
 
-    workflow.data.setdefault("documents", [])
-    workflow.data["documents"].append({
-        "id": file_id,
-        "file_name": file.filename,
-        "path": file_path
-    })
+    logger.info(f"📂 Document {file.filename} added to workflow {stack_id}")
 
-    db.add(workflow)
-    await db.commit()
-    await db.refresh(workflow)
+    job = await ingestion_queue.submit(db, stack_id, document.as_source())
 
-    logger.info(f"📂 Document added to workflow {stack_id}: {workflow.data}")
+    return {"id": file_id, "file_name": file.filename, "job_id": job.id}
 
-    return {"id": file_id, "file_name": file.filename}
+
+@router.get("/{stack_id}/jobs/{job_id}", response_model=IngestionJobRead)
+async def get_ingestion_job(stack_id: str, job_id: str, db: AsyncSession = Depends(get_db)):
+    job = await db.get(IngestionJob, job_id)
+    if not job or job.stack_id != stack_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{stack_id}/documents", response_model=List[DocumentRead])
+async def list_documents(
+    stack_id: str,
+    response: Response,
+    status: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    query = select(Document).where(Document.stack_id == stack_id)
+    if status:
+        query = query.where(Document.status == status)
+    limit = page_size(limit)
+    result = await db.execute(keyset_page(query, Document.created_at, Document.id, cursor, limit))
+    return finish_page(result.scalars().all(), limit, response)
 
 
 @router.get("/{stack_id}/documents/{doc_id}")
 async def download_document(stack_id: str, doc_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Workflow).where(Workflow.stack_id == stack_id))
-    workflow = result.scalar_one_or_none()
-    if not workflow or "documents" not in workflow.data:
-        raise HTTPException(status_code=404, detail="Document not found")
-
-    doc = next((d for d in workflow.data["documents"] if d["id"] == doc_id), None)
+    doc = await db.get(Document, {"stack_id": stack_id, "id": doc_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    return FileResponse(doc["path"], filename=doc["file_name"])
+    return FileResponse(doc.path, filename=doc.file_name)
 
 
 
@@ -419,11 +586,33 @@ async def create_workflow(workflow: WorkflowCreate, db: AsyncSession = Depends(g
     return db_workflow
 
 @router.get("/{stack_id}/list", response_model=List[WorkflowRead])
-async def list_workflows(stack_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Workflow).where(Workflow.stack_id == stack_id)
+async def list_workflows(
+    stack_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    query = select(Workflow).where(Workflow.stack_id == stack_id)
+    limit = page_size(limit)
+    result = await db.execute(keyset_page(query, Workflow.created_at, Workflow.id, cursor, limit))
+    return finish_page(result.scalars().all(), limit, response)
+
+@router.get("/{stack_id}/summary", response_model=List[WorkflowSummary])
+async def list_workflow_summaries(
+    stack_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    # Leaves the nodes/edges/data JSON columns out of the query entirely.
+    query = select(Workflow.id, Workflow.stack_id, Workflow.version, Workflow.created_at).where(
+        Workflow.stack_id == stack_id
     )
-    return result.scalars().all()
+    limit = page_size(limit)
+    result = await db.execute(keyset_page(query, Workflow.created_at, Workflow.id, cursor, limit))
+    return finish_page(result.all(), limit, response)
 
 @router.get("/{stack_id}", response_model=WorkflowRead)
 async def get_workflow(stack_id: str, db: AsyncSession = Depends(get_db)):
@@ -431,7 +620,6 @@ async def get_workflow(stack_id: str, db: AsyncSession = Depends(get_db)):
         select(Workflow).where(Workflow.stack_id == stack_id)
     )
     workflow = result.scalar_one_or_none()
-    print("Fetched workflow:", workflow)
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     return workflow
@@ -459,9 +647,11 @@ async def update_workflow(
     else:
         for key, value in workflow_data.dict().items():
             setattr(db_workflow, key, value)
+        db_workflow.version = (db_workflow.version or 1) + 1
     
     await db.commit()
     await db.refresh(db_workflow)
+    plan_cache.invalidate(stack_id, db_workflow.version)
     return db_workflow
 
 @router.delete("/{workflow_id}")
@@ -475,5 +665,6 @@ async def delete_workflow(workflow_id: str, db: AsyncSession = Depends(get_db)):
     
     await db.delete(workflow)
     await db.commit()
+    plan_cache.invalidate(workflow.stack_id)
     return {"detail": "Workflow deleted"}
 
@@ -0,0 +1,218 @@
+"""End-to-end latency benchmark for /upload, ingestion, /build and /chat.
+
+Runs the FastAPI app from main.py in-process against local stand-ins: the
+fake LLM backend instead of Gemini, the fake web-search backend instead of
+SerpAPI, SQLite through aiosqlite instead of Postgres, and throwaway Chroma,
+index and upload directories. A corpus of generated PDFs of varying size is
+uploaded, ingested, and then queried under concurrency.
+
+    python -m bench.api --pages 10,40,160 --requests 200 --concurrency 16 --output run.json
+    python -m bench.api --output new.json --compare run.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.corpus import generate_corpus, sample_queries  # noqa: E402
+from bench.stats import summarize, parse_server_timing, peak_rss_mb, compare  # noqa: E402
+
+
+def configure_environment(workdir: str, args):
+    # Must run before the app is imported: its modules read these at import.
+    os.environ.update({
+        "PG_CONNECTION": f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}",
+        "CHROMA_PATH": os.path.join(workdir, "chroma"),
+        "INDEX_DIR": os.path.join(workdir, "index"),
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_DELAY_MS": str(args.llm_delay_ms),
+        "WEB_SEARCH_BACKEND": "fake",
+        "FAKE_SEARCH_DELAY_MS": str(args.search_delay_ms),
+        "SEARCH_CACHE_PATH": "",
+        "EMBEDDING_WARMUP_MODELS": args.embedding_model,
+    })
+
+
+def workflow_payload(args) -> Dict[str, Any]:
+    def node(node_id, node_type, node_data):
+        return {"id": node_id, "type": "custom", "position": {"x": 0, "y": 0},
+                "data": {"type": node_type, "nodeData": node_data}}
+
+    nodes = [
+        node("user-input-1", "user-input", {"query": "What does error code module42 mean?"}),
+        node("knowledge-base-1", "knowledge-base", {"embeddingModel": args.embedding_model}),
+        node("llm-1", "llm", {
+            "apiKey": "bench", "model": "fake", "webSearch": args.web_search, "serpApi": "bench",
+            "semanticCache": args.semantic_cache,
+        }),
+        node("output-1", "output", {"outputText": "Answer concisely."}),
+    ]
+    edges = [
+        {"id": "e1", "source": "user-input-1", "target": "knowledge-base-1"},
+        {"id": "e2", "source": "knowledge-base-1", "target": "llm-1"},
+        {"id": "e3", "source": "llm-1", "target": "output-1"},
+    ]
+    return {"nodes": nodes, "edges": edges, "data": {}}
+
+
+async def timed(coro):
+    started = time.perf_counter()
+    response = await coro
+    return response, (time.perf_counter() - started) * 1000
+
+
+async def run(args, workdir: str) -> Dict[str, Any]:
+    import httpx
+
+    import_started = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - import_started) * 1000
+
+    startup_started = time.perf_counter()
+    await main.startup()
+    startup_ms = (time.perf_counter() - startup_started) * 1000
+    # Warm-ups run in the background; wait so they don't skew the first requests.
+    from services.readiness import readiness
+
+    while not readiness.ready:
+        await asyncio.sleep(0.05)
+    ready_ms = (time.perf_counter() - startup_started) * 1000
+
+    report: Dict[str, Any] = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "startup": {"import_ms": round(import_ms, 1), "startup_ms": round(startup_ms, 1), "ready_ms": round(ready_ms, 1)},
+    }
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            stack = (await client.post("/stacks/", json={"name": "bench"})).json()
+            stack_id = stack["id"]
+            (await client.put(f"/workflows/{stack_id}", json=workflow_payload(args))).raise_for_status()
+
+            # Uploads + background ingestion
+            pages = [int(p) for p in args.pages.split(",")] * args.docs
+            paths = generate_corpus(os.path.join(workdir, "corpus"), pages)
+            upload_ms, jobs = [], {}
+            for path in paths:
+                with open(path, "rb") as f:
+                    body = f.read()
+                response, elapsed = await timed(client.post(
+                    f"/workflows/{stack_id}/upload",
+                    files={"file": (os.path.basename(path), body, "application/pdf")},
+                ))
+                response.raise_for_status()
+                upload_ms.append(elapsed)
+                jobs[response.json()["job_id"]] = time.perf_counter()
+
+            ingest_ms = []
+            pending = dict(jobs)
+            while pending:
+                await asyncio.sleep(0.05)
+                for job_id, started in list(pending.items()):
+                    job = (await client.get(f"/workflows/{stack_id}/jobs/{job_id}")).json()
+                    if job["status"] in ("succeeded", "failed"):
+                        if job["status"] == "failed":
+                            raise RuntimeError(f"Ingestion failed: {job['error']}")
+                        ingest_ms.append((time.perf_counter() - started) * 1000)
+                        del pending[job_id]
+
+            # Builds (sequential, like a user pressing Build)
+            build_ms = []
+            for _ in range(args.builds):
+                response, elapsed = await timed(client.post(f"/workflows/{stack_id}/build"))
+                response.raise_for_status()
+                build_ms.append(elapsed)
+
+            # Chat under concurrency
+            queries = sample_queries(args.requests)
+            chat_ms: List[float] = []
+            stage_ms: Dict[str, List[float]] = defaultdict(list)
+            node_ms: Dict[str, List[float]] = defaultdict(list)
+            cached = 0
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def chat(query: str):
+                nonlocal cached
+                async with semaphore:
+                    response, elapsed = await timed(
+                        client.post(f"/workflows/{stack_id}/chat", json={"message": query})
+                    )
+                response.raise_for_status()
+                body = response.json()
+                chat_ms.append(elapsed)
+                cached += bool(body.get("cached"))
+                # Per pipeline stage (embed, vector_query, web_search,
+                # llm_call, ...) as recorded by the server, and per node.
+                for name, ms in parse_server_timing(response.headers.get("server-timing", "")).items():
+                    stage_ms[name].append(ms)
+                for node_id, ms in body.get("timings", {}).items():
+                    node_ms[node_id].append(ms)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(chat(q) for q in queries))
+            wall = time.perf_counter() - started
+
+            report.update({
+                "upload": summarize(upload_ms),
+                "ingestion": summarize(ingest_ms),
+                "build": summarize(build_ms),
+                "chat": {
+                    **summarize(chat_ms),
+                    "throughput_rps": round(len(chat_ms) / wall, 2),
+                    "cached_responses": cached,
+                },
+                "chat_stages": {name: summarize(values) for name, values in sorted(stage_ms.items())},
+                "chat_nodes": {node_id: summarize(values) for node_id, values in sorted(node_ms.items())},
+                "server_stats": (await client.get("/system/stats")).json(),
+            })
+    finally:
+        await main.shutdown()
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,40,160", help="Comma-separated page counts per document")
+    parser.add_argument("--docs", type=int, default=1, help="How many times to repeat the --pages set")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--builds", type=int, default=5)
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--web-search", action="store_true")
+    parser.add_argument("--semantic-cache", action="store_true")
+    parser.add_argument("--llm-delay-ms", type=float, default=20)
+    parser.add_argument("--search-delay-ms", type=float, default=300)
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ai-planet-bench-")
+    configure_environment(workdir, args)
+    try:
+        report = asyncio.run(run(args, workdir))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        print("\n".join(compare(report, args.compare)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import random
+from typing import List
+
+WORDS = [
+    "pump", "valve", "pressure", "torque", "sensor", "calibration", "error", "code",
+    "manual", "assembly", "bearing", "housing", "voltage", "firmware", "reset", "module",
+]
+
+
+def generate_pdf(path: str, pages: int, words_per_page: int, seed: int = 0):
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = " ".join(rng.choice(WORDS) + str(rng.randint(0, 999)) for _ in range(words_per_page))
+        page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=6)
+    doc.save(path)
+    doc.close()
+
+
+def generate_corpus(directory: str, page_counts: List[int], words_per_page: int = 400) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, pages in enumerate(page_counts):
+        path = os.path.join(directory, f"doc-{i:03d}-{pages}p.pdf")
+        generate_pdf(path, pages, words_per_page, seed=i)
+        paths.append(path)
+    return paths
+
+
+def sample_queries(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        f"How do I fix {rng.choice(WORDS)}{rng.randint(0, 999)} on the {rng.choice(WORDS)}?"
+        for _ in range(n)
+    ]
@@ -0,0 +1,123 @@
+"""Embedding backend benchmark: torch vs ONNX vs int8-quantized ONNX on CPU.
+
+Encodes the same synthetic passages with every backend and reports encode
+throughput, plus how far each backend drifts from the torch baseline: the
+cosine similarity of matching vectors and the overlap of top-k retrieval
+results for a set of queries.
+
+    python -m bench.embeddings --model all-MiniLM-L6-v2 --passages 2000 --output embeddings.json
+
+The first ONNX run includes export/quantization into EMBEDDING_ONNX_DIR;
+that is reported separately as load time.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from bench.corpus import WORDS, sample_queries  # noqa: E402
+
+
+def sample_passages(n: int, words: int = 90, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) + str(rng.randint(0, 999)) for _ in range(words))
+        for _ in range(n)
+    ]
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.clip(np.linalg.norm(x, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(queries: np.ndarray, passages: np.ndarray, k: int) -> np.ndarray:
+    scores = normalize(queries) @ normalize(passages).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def run_backend(key: str, passages, queries, batch_size: int, repeats: int) -> dict:
+    from services.embeddings import _load_model
+
+    started = time.perf_counter()
+    model = _load_model(key)
+    load_s = time.perf_counter() - started
+
+    model.encode(passages[:batch_size], batch_size=batch_size)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        embeddings = np.asarray(model.encode(passages, batch_size=batch_size))
+        timings.append(time.perf_counter() - started)
+    query_embeddings = np.asarray(model.encode(queries, batch_size=batch_size))
+    best = min(timings)
+    return {
+        "load_s": round(load_s, 2),
+        "encode_s": round(best, 3),
+        "passages_per_s": round(len(passages) / best, 1),
+        "_passages": embeddings,
+        "_queries": query_embeddings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--passages", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from services.embeddings import model_key
+
+    passages = sample_passages(args.passages)
+    queries = sample_queries(args.queries)
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" not in backends:
+        backends.insert(0, "torch")
+
+    runs = {}
+    for backend in backends:
+        runs[backend] = run_backend(model_key(args.model, backend), passages, queries, args.batch_size, args.repeats)
+        print(f"{backend:10s} {runs[backend]['passages_per_s']:>10.1f} passages/s", file=sys.stderr)
+
+    baseline = runs["torch"]
+    baseline_top = top_k(baseline["_queries"], baseline["_passages"], args.top_k)
+    results = {
+        "model": args.model,
+        "passages": args.passages,
+        "queries": args.queries,
+        "batch_size": args.batch_size,
+        "onnx_threads": int(os.getenv("EMBEDDING_ONNX_THREADS", "0")),
+        "backends": {},
+    }
+    for backend, run in runs.items():
+        cosine = np.sum(normalize(run["_passages"]) * normalize(baseline["_passages"]), axis=1)
+        top = top_k(run["_queries"], run["_passages"], args.top_k)
+        overlap = np.mean([len(set(a) & set(b)) / args.top_k for a, b in zip(top, baseline_top)])
+        results["backends"][backend] = {
+            **{k: v for k, v in run.items() if not k.startswith("_")},
+            "speedup_vs_torch": round(run["passages_per_s"] / baseline["passages_per_s"], 2),
+            "cosine_vs_torch_mean": round(float(cosine.mean()), 5),
+            "cosine_vs_torch_min": round(float(cosine.min()), 5),
+            f"recall_at_{args.top_k}_vs_torch": round(float(overlap), 4),
+        }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
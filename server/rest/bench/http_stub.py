@@ -0,0 +1,90 @@
+"""Local stand-in for the Gemini and SerpAPI HTTP APIs.
+
+Serves just enough of both for services.llm and services.pipeline, with
+injectable latency and failures, so the pooled clients (retries, deadlines,
+hedging) can be exercised without network access or keys:
+
+    uvicorn bench.http_stub:app --port 8900
+    GEMINI_BASE_URL=http://127.0.0.1:8900 SERPAPI_BASE_URL=http://127.0.0.1:8900 uvicorn main:app
+
+STUB_LATENCY_MS is the normal response time; STUB_TAIL_RATE of requests
+take STUB_TAIL_MS instead, and STUB_ERROR_RATE answer 503.
+"""
+import os
+import json
+import random
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+settings = {
+    "latency_ms": float(os.getenv("STUB_LATENCY_MS", "20")),
+    "tail_ms": float(os.getenv("STUB_TAIL_MS", "500")),
+    "tail_rate": float(os.getenv("STUB_TAIL_RATE", "0")),
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),
+}
+counts = {"requests": 0, "errors": 0, "tails": 0}
+
+app = FastAPI()
+
+
+async def misbehave():
+    counts["requests"] += 1
+    if random.random() < settings["error_rate"]:
+        counts["errors"] += 1
+        return JSONResponse({"error": "stub overloaded"}, status_code=503)
+    delay = settings["latency_ms"]
+    if random.random() < settings["tail_rate"]:
+        counts["tails"] += 1
+        delay = settings["tail_ms"]
+    await asyncio.sleep(delay / 1000)
+    return None
+
+
+def answer_for(body: dict) -> str:
+    parts = body.get("contents", [{}])[0].get("parts", [{}])
+    prompt = parts[0].get("text", "")
+    return f"Stub answer to: {prompt[-60:]}"
+
+
+def candidate(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, request: Request):
+    body = await request.json()
+    if error := await misbehave():
+        return error
+    return candidate(answer_for(body))
+
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate_content(model: str, request: Request):
+    body = await request.json()
+    if error := await misbehave():
+        return error
+    words = answer_for(body).split(" ")
+
+    async def events():
+        for word in words:
+            yield f"data: {json.dumps(candidate(word + ' '))}\r\n\r\n"
+            await asyncio.sleep(settings["latency_ms"] / 1000 / len(words))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/search.json")
+async def search(q: str = ""):
+    if error := await misbehave():
+        return error
+    return {"organic_results": [
+        {"title": f"Stub result {i} for {q}", "link": f"https://example.com/{i}", "snippet": f"Snippet {i} about {q}."}
+        for i in range(3)
+    ]}
+
+
+@app.get("/stub/stats")
+async def stub_stats():
+    return counts
@@ -0,0 +1,100 @@
+"""Lexical (BM25) index benchmark.
+
+Indexes synthetic chunks (Zipf-distributed words, each chunk carrying one
+unique error code such as "ERR-04211"), then reports build time, query
+latency percentiles and how often the chunk holding a queried code ranks
+first, for exact-code queries and for codes inside a sentence.
+
+    python -m bench.lexical --chunks 100000 --output lexical.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from bench.corpus import WORDS  # noqa: E402
+from bench.stats import summarize  # noqa: E402
+
+
+def make_chunks(count: int, words_per_chunk: int, vocabulary: int, rng) -> list:
+    words = WORDS + [f"w{i}" for i in range(vocabulary)]
+    ranks = np.arange(1, len(words) + 1)
+    picks = rng.choice(len(words), size=(count, words_per_chunk), p=(1 / ranks) / (1 / ranks).sum())
+    return [
+        " ".join(words[w] for w in row[:words_per_chunk // 2]) + f" ERR-{i:05d} " + " ".join(words[w] for w in row[words_per_chunk // 2:])
+        for i, row in enumerate(picks)
+    ]
+
+
+def run_queries(index, queries, expected, k: int) -> dict:
+    latencies, hits = [], 0
+    for query, chunk_id in zip(queries, expected):
+        started = time.perf_counter()
+        found = index.query("bench", query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += bool(found) and found[0] == chunk_id
+    return {"query": summarize(latencies), "top1_hit_rate": round(hits / len(queries), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--words-per-chunk", type=int, default=120)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    chunks = make_chunks(args.chunks, args.words_per_chunk, args.vocabulary, rng)
+    ids = [f"id-{i}" for i in range(args.chunks)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LEXICAL_DIR"] = os.path.join(directory, "default")
+        from services.lexical_index import LexicalIndex
+
+        index = LexicalIndex(directory)
+        started = time.perf_counter()
+        for start in range(0, args.chunks, args.batch_size):
+            index.upsert("bench", ids[start:start + args.batch_size], chunks[start:start + args.batch_size])
+        build_s = time.perf_counter() - started
+
+        # A second instance loads the persisted log, like another worker would.
+        started = time.perf_counter()
+        reloaded = LexicalIndex(directory)
+        reloaded.query("bench", "warm up", 1)
+        load_s = time.perf_counter() - started
+
+        targets = rng.choice(args.chunks, size=args.queries, replace=False)
+        codes = [f"ERR-{i:05d}" for i in targets]
+        expected = [ids[i] for i in targets]
+        results = {
+            "chunks": args.chunks,
+            "build_s": round(build_s, 3),
+            "load_s": round(load_s, 3),
+            **reloaded.stats(),
+            "exact_code": run_queries(reloaded, codes, expected, args.top_k),
+            "code_in_sentence": run_queries(
+                reloaded, [f"what does {code} mean on the pump module" for code in codes], expected, args.top_k
+            ),
+        }
+        index.close()
+        reloaded.close()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
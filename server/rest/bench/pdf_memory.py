@@ -0,0 +1,133 @@
+"""Peak-memory benchmark for PDF ingestion.
+
+Generates a large synthetic PDF and runs the old whole-document pipeline
+(``text += page`` → full word list → embed everything) and the streaming
+pipeline (page windows → incremental chunker → fixed-size embedding batches)
+in separate subprocesses, reporting peak RSS and wall time for each.
+
+    python -m bench.pdf_memory --pages 3000 --output pdf_memory.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import resource
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.corpus import generate_pdf  # noqa: E402
+
+EMBED_DIM = 384
+
+
+def fake_encode(batch):
+    import numpy as np
+
+    return np.zeros((len(batch), EMBED_DIM), dtype="float32")
+
+
+def rss_mb() -> float:
+    # ru_maxrss is KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_legacy(path: str) -> dict:
+    import fitz
+
+    doc = fitz.open(path)
+    text = ""
+    for page in doc:
+        text += page.get_text("text")
+    words = text.split()
+    chunks = []
+    start = 0
+    while start < len(words):
+        chunks.append(" ".join(words[start:start + 500]))
+        start += 450
+    embeddings = fake_encode(chunks).tolist()
+    return {"chunks": len(chunks), "embedded": len(embeddings)}
+
+
+def run_streaming(path: str, batch_size: int, page_window: int) -> dict:
+    from utils.documents import Chunker, pdf_page_count, read_pages, iter_batches
+
+    def chunks():
+        chunker = Chunker()
+        for first in range(0, pdf_page_count(path), page_window):
+            for text in read_pages(path, first, page_window):
+                yield from chunker.feed(text)
+        yield from chunker.flush()
+
+    count = embedded = 0
+    for batch in iter_batches(chunks(), batch_size):
+        count += len(batch)
+        embedded += len(fake_encode(batch).tolist())
+    return {"chunks": count, "embedded": embedded}
+
+
+def child(args) -> dict:
+    # Load the heavy modules up front so their import cost is excluded from the delta.
+    for module in ("fitz", "numpy"):
+        importlib.import_module(module)
+
+    baseline = rss_mb()
+    started = time.perf_counter()
+    if args.mode == "legacy":
+        result = run_legacy(args.pdf)
+    else:
+        result = run_streaming(args.pdf, args.batch_size, args.page_window)
+    result.update({
+        "mode": args.mode,
+        "seconds": round(time.perf_counter() - started, 3),
+        "peak_rss_mb": round(rss_mb(), 1),
+        "peak_rss_delta_mb": round(rss_mb() - baseline, 1),
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--words-per-page", type=int, default=1500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--page-window", type=int, default=16)
+    parser.add_argument("--pdf", help="Use an existing PDF instead of generating one")
+    parser.add_argument("--mode", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(child(args)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = args.pdf
+        if not pdf:
+            pdf = os.path.join(tmp, "synthetic.pdf")
+            generate_pdf(pdf, args.pages, args.words_per_page)
+        report = {
+            "pdf_mb": round(os.path.getsize(pdf) / 1e6, 1),
+            "pages": args.pages,
+            "runs": [],
+        }
+        for mode in ("legacy", "streaming"):
+            out = subprocess.run(
+                [sys.executable, "-m", "bench.pdf_memory", "--mode", mode, "--pdf", pdf,
+                 "--batch-size", str(args.batch_size), "--page-window", str(args.page_window)],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                capture_output=True, text=True, check=True,
+            )
+            report["runs"].append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
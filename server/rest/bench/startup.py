@@ -0,0 +1,151 @@
+"""Cold-start benchmark: import time, startup, readiness and first requests.
+
+Each run is a fresh subprocess (so nothing is already imported) using the
+same local stand-ins as bench.api: SQLite, the fake LLM and fake web search,
+throwaway index/upload directories. Reported per run:
+
+- import_ms / rss_after_import_mb, and which heavy modules the import pulled in
+- startup_ms (lifespan startup) and ready_ms (optional warm-ups finished)
+- first and second latency of GET /stacks/ and POST /workflows/{id}/chat
+
+    python -m bench.startup --runs 5 --output startup.json
+    python -m bench.startup --warmup-imports --output startup-warm.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.stats import summarize  # noqa: E402
+
+HEAVY_MODULES = ("torch", "sentence_transformers", "chromadb", "fitz", "google.generativeai", "serpapi")
+
+
+def workflow_payload():
+    def node(node_id, node_type, node_data):
+        return {"id": node_id, "type": "custom", "position": {"x": 0, "y": 0},
+                "data": {"type": node_type, "nodeData": node_data}}
+
+    return {
+        "nodes": [
+            node("user-input-1", "user-input", {"query": "ping"}),
+            node("llm-1", "llm", {"apiKey": "bench", "model": "fake"}),
+            node("output-1", "output", {}),
+        ],
+        "edges": [
+            {"id": "e1", "source": "user-input-1", "target": "llm-1"},
+            {"id": "e2", "source": "llm-1", "target": "output-1"},
+        ],
+        "data": {},
+    }
+
+
+async def child():
+    import httpx
+    from bench.stats import peak_rss_mb
+
+    started = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - started) * 1000
+    rss_after_import = peak_rss_mb()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    started = time.perf_counter()
+    await main.startup()
+    startup_ms = (time.perf_counter() - started) * 1000
+    from services.readiness import readiness
+
+    while not readiness.ready:
+        await asyncio.sleep(0.01)
+    ready_ms = (time.perf_counter() - started) * 1000
+
+    async def timed(request):
+        t = time.perf_counter()
+        response = await request
+        response.raise_for_status()
+        return response, (time.perf_counter() - t) * 1000
+
+    result = {
+        "import_ms": import_ms,
+        "rss_after_import_mb": rss_after_import,
+        "heavy_modules_after_import": loaded,
+        "startup_ms": startup_ms,
+        "ready_ms": ready_ms,
+    }
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            _, result["first_list_ms"] = await timed(client.get("/stacks/"))
+            _, result["second_list_ms"] = await timed(client.get("/stacks/"))
+            stack, _ = await timed(client.post("/stacks/", json={"name": "startup"}))
+            stack_id = stack.json()["id"]
+            await timed(client.put(f"/workflows/{stack_id}", json=workflow_payload()))
+            _, result["first_chat_ms"] = await timed(client.post(f"/workflows/{stack_id}/chat", json={"message": "hi"}))
+            _, result["second_chat_ms"] = await timed(client.post(f"/workflows/{stack_id}/chat", json={"message": "hi"}))
+    finally:
+        await main.shutdown()
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+def run_once(warmup_imports: bool) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ)
+        env.update({
+            "PG_CONNECTION": f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}",
+            "CHROMA_PATH": os.path.join(workdir, "chroma"),
+            "INDEX_DIR": os.path.join(workdir, "index"),
+            "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+            "LLM_BACKEND": "fake",
+            "FAKE_LLM_DELAY_MS": "0",
+            "WEB_SEARCH_BACKEND": "fake",
+            "SEARCH_CACHE_PATH": "",
+            "EMBEDDING_WARMUP_MODELS": "",
+            "WARMUP_IMPORTS": "true" if warmup_imports else "false",
+            "LOG_LEVEL": "WARNING",
+        })
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.startup", "--child"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warmup-imports", action="store_true", help="Preload heavy modules after startup")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child())
+        return
+
+    runs = [run_once(args.warmup_imports) for _ in range(args.runs)]
+    timings = ("import_ms", "startup_ms", "ready_ms", "first_list_ms", "second_list_ms", "first_chat_ms", "second_chat_ms")
+    report = {
+        "runs": args.runs,
+        "warmup_imports": args.warmup_imports,
+        "heavy_modules_after_import": runs[-1]["heavy_modules_after_import"],
+        "rss_after_import_mb": max(r["rss_after_import_mb"] for r in runs),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        **{name: summarize(r[name] for r in runs) for name in timings},
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import json
+import resource
+from typing import Any, Dict, Iterable, List
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(values_ms: Iterable[float]) -> Dict[str, float]:
+    values = sorted(values_ms)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2),
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+        "max_ms": round(values[-1], 2),
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """``{stage: milliseconds}`` from a Server-Timing header value such as
+    ``embed;dur=12.5;desc="1x", vector_query;dur=3.1;desc="2x"``."""
+    timings = {}
+    for metric in filter(None, (part.strip() for part in header.split(","))):
+        name, *params = metric.split(";")
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                timings[name.strip()] = timings.get(name.strip(), 0.0) + float(value)
+    return timings
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _flatten(report: Any, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    if isinstance(report, dict):
+        for key, value in report.items():
+            flat.update(_flatten(value, f"{prefix}{key}."))
+    elif isinstance(report, (int, float)) and not isinstance(report, bool):
+        flat[prefix.rstrip(".")] = float(report)
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> List[str]:
+    """Render every numeric metric present in both reports with its change."""
+    with open(baseline_path) as f:
+        baseline = _flatten(json.load(f))
+    lines = []
+    for key, value in _flatten(current).items():
+        if key in baseline and baseline[key]:
+            change = (value - baseline[key]) / baseline[key] * 100
+            lines.append(f"{key:60s} {baseline[key]:>12.2f} → {value:>12.2f}  ({change:+.1f}%)")
+    return lines
@@ -0,0 +1,126 @@
+"""Upstream client benchmark against the local HTTP stub (bench.http_stub).
+
+Starts the stub on a free port, then sends the same Gemini generateContent
+calls through each client setup and reports latency percentiles, failures
+and retry/hedge counts:
+
+- fresh: a new httpx client per call (no connection reuse, no retries)
+- pooled: the shared pooled client, no retries
+- pooled-retry: pooled with jittered retries
+- pooled-hedge: pooled with retries and hedging after --hedge-ms
+
+    python -m bench.upstreams --calls 500 --concurrency 16 --tail-rate 0.05 --error-rate 0.02
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.stats import summarize  # noqa: E402
+
+
+def start_stub(port: int):
+    import uvicorn
+    from bench.http_stub import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_scenario(name: str, base_url: str, args) -> dict:
+    import httpx
+    from services.http_clients import RetryPolicy, http_clients
+    from services.llm import GeminiLLM
+
+    retries = 0 if name in ("fresh", "pooled") else args.retries
+    hedge_after = args.hedge_ms / 1000 if name == "pooled-hedge" else 0.0
+    http_clients.register(
+        "gemini", base_url, RetryPolicy(deadline=args.deadline, retries=retries, backoff=0.05, hedge_after=hedge_after),
+        key_header="x-goog-api-key",
+    )
+    llm = GeminiLLM("bench-key", "stub")
+    body = {"contents": [{"parts": [{"text": "ping"}]}]}
+
+    async def fresh_call():
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            response = await client.post("/v1beta/models/stub:generateContent", json=body)
+            response.raise_for_status()
+
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with slots:
+            started = time.perf_counter()
+            try:
+                await (fresh_call() if name == "fresh" else llm.generate("ping"))
+            except Exception:
+                failures += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(args.calls)))
+    upstream = http_clients.stats()["gemini"]
+    await http_clients.aclose()
+    return {"latency": summarize(latencies), "failures": failures, **{k: upstream[k] for k in ("retries", "hedges", "hedge_wins")}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="fresh,pooled,pooled-retry,pooled-hedge")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--tail-ms", type=float, default=500)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--hedge-ms", type=float, default=60)
+    parser.add_argument("--deadline", type=float, default=10)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from bench import http_stub
+
+    http_stub.settings.update(
+        latency_ms=args.latency_ms, tail_ms=args.tail_ms, tail_rate=args.tail_rate, error_rate=args.error_rate
+    )
+    port = free_port()
+    server, thread = start_stub(port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    results = {"stub": dict(http_stub.settings), "calls": args.calls, "concurrency": args.concurrency, "scenarios": {}}
+    try:
+        for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            results["scenarios"][name] = asyncio.run(run_scenario(name, base_url, args))
+            print(f"{name}: {json.dumps(results['scenarios'][name])}", file=sys.stderr)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
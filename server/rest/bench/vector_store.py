@@ -0,0 +1,105 @@
+"""Vector store benchmark: Chroma vs the NumPy memmap index.
+
+Loads the same random (normalised) vectors into every backend, then reports
+upsert throughput, query latency percentiles and recall@k against an exact
+search. Each backend gets its own temp directory.
+
+    python -m bench.vector_store --rows 20000 --dim 384 --output vector_store.json
+
+Backends: chroma, numpy (float32), numpy-f16 (float16), numpy-ivf (float32
+with IVF partitioning forced on).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from bench.stats import summarize  # noqa: E402
+
+
+def make_store(backend: str, directory: str):
+    # Importing the module builds the default store; keep that one throwaway.
+    os.environ["VECTOR_STORE"] = "numpy"
+    os.environ["VECTOR_DIR"] = os.path.join(directory, "default")
+    from services import vector_store as vs
+
+    if backend == "chroma":
+        return vs.ChromaVectorStore(directory)
+    if backend == "numpy-ivf":
+        vs.VECTOR_IVF_MIN_ROWS = 1
+        return vs.NumpyVectorStore(directory, "float32")
+    vs.VECTOR_IVF_MIN_ROWS = 0
+    return vs.NumpyVectorStore(directory, "float16" if backend == "numpy-f16" else "float32")
+
+
+def run_backend(backend: str, vectors: np.ndarray, queries: np.ndarray, k: int, batch: int) -> dict:
+    texts = [f"chunk-{i}" for i in range(len(vectors))]
+    ids = [f"id-{i}" for i in range(len(vectors))]
+    with tempfile.TemporaryDirectory() as directory:
+        store = make_store(backend, directory)
+        started = time.perf_counter()
+        for start in range(0, len(vectors), batch):
+            store.upsert("bench", ids[start:start + batch], texts[start:start + batch], vectors[start:start + batch])
+        upsert_s = time.perf_counter() - started
+
+        store.query("bench", queries[0], k)  # warm-up (and IVF build)
+        latencies, results = [], []
+        for query in queries:
+            started = time.perf_counter()
+            results.append(store.query("bench", query, k))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    recall = np.mean([
+        len({f"chunk-{i}" for i in truth} & set(got)) / k for truth, got in zip(exact, results)
+    ])
+    return {
+        "upsert_s": round(upsert_s, 3),
+        "upserts_per_s": round(len(vectors) / upsert_s, 1),
+        "query": summarize(latencies),
+        f"recall_at_{k}": round(float(recall), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="chroma,numpy,numpy-f16,numpy-ivf")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.rows, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries near stored rows, like a question close to one chunk.
+    picks = rng.choice(args.rows, size=args.queries, replace=False)
+    queries = vectors[picks] + rng.normal(scale=0.05, size=(args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    results = {"rows": args.rows, "dim": args.dim, "queries": args.queries, "backends": {}}
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        try:
+            results["backends"][backend] = run_backend(backend, vectors, queries, args.top_k, args.batch_size)
+        except ImportError as e:
+            results["backends"][backend] = {"skipped": str(e)}
+        print(f"{backend}: {json.dumps(results['backends'][backend])}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,27 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("PG_CONNECTION")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+
+def engine_options(url: str) -> dict:
+    options = {"echo": os.getenv("SQL_ECHO", "false").lower() == "true"}
+    if url.startswith("sqlite"):
+        # SQLite (used by the local benchmark) picks its own pool class.
+        return options
+    options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    )
+    statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+    if statement_timeout_ms > 0:
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(statement_timeout_ms)}}
+    return options
+
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 Base = declarative_base()
\ No newline at end of file
@@ -1,13 +1,71 @@
 # main.py
-from fastapi import FastAPI, Depends
+import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from db import SessionLocal, engine, Base
+from migrations import run_migrations
 from api.stacks import router as stacks_router
 from api.workflows import router as workflows_router
+from api.system import router as system_router, metrics_router
+from services.embedding_batcher import embedding_batcher
+from services.embeddings import embedding_registry, warmup_model_names
+from services.executor import shutdown_pools
+from services.http_clients import http_clients
+from services.ingestion import ingestion_queue
+from services.lexical_index import LEXICAL_WARMUP, lexical_index
+from services.metrics import begin_request, end_request, request_seconds, setup_tracing
+from services.readiness import preload_modules, readiness, warmup_imports_enabled
+from services.search_cache import search_cache
+from services.vector_store import vector_store
+import asyncio
 
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 
-app = FastAPI()
+
+async def startup():
+    setup_tracing()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
+
+    await asyncio.to_thread(vector_store.open)
+    await ingestion_queue.start()
+    readiness.mark_started()
+
+    # Optional warm-ups run after startup so the process comes up (and passes
+    # liveness checks) right away; /system/ready reports when they are done.
+    if warmup_imports_enabled():
+        readiness.spawn("imports", preload_modules)
+    if names := warmup_model_names():
+        readiness.spawn("embedding_models", embedding_registry.warm_up, names)
+    if LEXICAL_WARMUP:
+        readiness.spawn("lexical_index", lexical_index.warm_up)
+
+
+async def shutdown():
+    await readiness.stop()
+    await ingestion_queue.stop()
+    await embedding_batcher.stop()
+    search_cache.flush()
+    shutdown_pools()
+    await http_clients.aclose()
+    vector_store.close()
+    lexical_index.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    yield
+    await shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS setup
 app.add_middleware(
@@ -16,16 +74,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 app.include_router(stacks_router)
 app.include_router(workflows_router)
+app.include_router(system_router)
+app.include_router(metrics_router)
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    token = begin_request()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        end_request(token)
+        raise
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    request_seconds.observe(time.perf_counter() - start, request.method, path, str(response.status_code))
+    server_timing = end_request(token)
+    if server_timing:
+        response.headers["Server-Timing"] = server_timing
+    return response
 
 async def get_db():
     async with SessionLocal() as session:
         yield session
 
-@app.on_event("startup")
-async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,130 @@
+import os
+import json
+import logging
+from sqlalchemy import inspect, select, text
+
+from models.document import Document
+from models.ingestion_job import IngestionJob
+from models.workflow import Workflow
+from services.plan import legacy_documents
+
+logger = logging.getLogger(__name__)
+
+# create_all only creates missing tables, so columns added to existing
+# tables are listed here and added in place on startup.
+ADDED_COLUMNS = [
+    ("workflows", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ("workflows", "created_at", "TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP"),
+    ("ingestion_jobs", "worker_id", "VARCHAR"),
+    ("ingestion_jobs", "heartbeat_at", "TIMESTAMP WITH TIME ZONE"),
+]
+
+# Likewise for indexes declared on tables that already exist.
+ADDED_INDEXES = [
+    ("ix_stacks_created", "stacks", "created_at, id"),
+    ("ix_workflows_stack_created", "workflows", "stack_id, created_at, id"),
+]
+
+
+# Foreign keys created before they had ON DELETE CASCADE: (table, column,
+# referenced table). SQLite can't alter constraints; the ORM cascade on
+# Stack covers deletes there.
+CASCADE_FOREIGN_KEYS = [
+    ("ingestion_jobs", "stack_id", "stacks"),
+]
+
+
+def _cascade_foreign_keys(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    for table, column, referred in CASCADE_FOREIGN_KEYS:
+        if table not in tables:
+            continue
+        for fk in inspector.get_foreign_keys(table):
+            if fk["constrained_columns"] != [column] or fk["referred_table"] != referred:
+                continue
+            if (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE":
+                continue
+            name = fk["name"]
+            logger.info(f"🛠️ Adding ON DELETE CASCADE to {table}.{column}")
+            conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+            conn.execute(text(
+                f'ALTER TABLE {table} ADD CONSTRAINT "{name}" FOREIGN KEY ({column}) '
+                f"REFERENCES {referred} (id) ON DELETE CASCADE"
+            ))
+
+
+# Keyset pagination orders by (created_at, id) and assumes no NULLs.
+TIMESTAMPED_TABLES = ["stacks", "workflows", "documents"]
+
+
+def _backfill_created_at(conn):
+    tables = set(inspect(conn).get_table_names())
+    for table in TIMESTAMPED_TABLES:
+        if table in tables:
+            conn.execute(text(f"UPDATE {table} SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+
+
+def _add_missing_columns(conn):
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    for table, column, ddl in ADDED_COLUMNS:
+        if table not in tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        if column not in existing:
+            logger.info(f"🛠️ Adding column {table}.{column}")
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+    for name, table, columns in ADDED_INDEXES:
+        if table not in tables:
+            continue
+        if name not in {i["name"] for i in inspector.get_indexes(table)}:
+            logger.info(f"🛠️ Adding index {name}")
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def _backfill_documents(conn):
+    # One-off copy of workflow.data["documents"] into the documents table; it
+    # only runs while the table is still empty. The JSON is left in place.
+    if conn.execute(select(Document.id).limit(1)).first() is not None:
+        return
+    succeeded = {
+        (row.stack_id, row.document_id): row.chunks
+        for row in conn.execute(
+            select(IngestionJob.stack_id, IngestionJob.document_id, IngestionJob.chunks)
+            .where(IngestionJob.status == "succeeded")
+        )
+    }
+    rows = {}
+    for stack_id, data in conn.execute(select(Workflow.stack_id, Workflow.data)):
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                continue
+        for doc in legacy_documents(data or {}):
+            if not doc.get("id") or not doc.get("path") or (stack_id, doc["id"]) in rows:
+                continue
+            chunks = succeeded.get((stack_id, doc["id"]))
+            rows[(stack_id, doc["id"])] = {
+                "stack_id": stack_id,
+                "id": doc["id"],
+                "file_name": doc.get("file_name"),
+                "path": doc["path"],
+                "size": os.path.getsize(doc["path"]) if os.path.exists(doc["path"]) else None,
+                "status": "indexed" if chunks is not None else "uploaded",
+                "chunks": chunks or 0,
+            }
+    if rows:
+        logger.info(f"🛠️ Moving {len(rows)} documents out of workflow JSON")
+        conn.execute(Document.__table__.insert(), list(rows.values()))
+
+
+async def run_migrations(conn):
+    await conn.run_sync(_add_missing_columns)
+    await conn.run_sync(_cascade_foreign_keys)
+    await conn.run_sync(_backfill_created_at)
+    await conn.run_sync(_backfill_documents)
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, Text, Integer, BigInteger, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from db import Base
+
+class Document(Base):
+    __tablename__ = "documents"
+
+    stack_id = Column(String, ForeignKey("stacks.id"), primary_key=True)
+    id = Column(String, primary_key=True)
+    file_name = Column(String, nullable=True)
+    path = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=True)
+    content_hash = Column(String(64), nullable=True, index=True)
+    page_count = Column(Integer, nullable=True)
+    # uploaded → queued → running → indexed | failed
+    status = Column(String(20), nullable=False, default="uploaded", server_default="uploaded")
+    chunks = Column(Integer, nullable=False, default=0, server_default="0")
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_documents_stack_created", "stack_id", "created_at", "id"),
+    )
+
+    def as_source(self) -> dict:
+        # Shape used by the execution plan and the indexing pipeline.
+        return {"id": self.id, "file_name": self.file_name, "path": self.path, "content_hash": self.content_hash}
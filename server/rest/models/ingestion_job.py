@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Text, Integer, Float, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from db import Base
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    stack_id = Column(String, ForeignKey("stacks.id", ondelete="CASCADE"), index=True)
+    document_id = Column(String, nullable=False)
+    file_name = Column(String, nullable=True)
+    path = Column(String, nullable=False)
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    stage = Column(String(20), nullable=True)
+    progress = Column(Float, nullable=False, default=0.0)
+    chunks = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    # Lease of the worker process running the job, renewed while it runs.
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
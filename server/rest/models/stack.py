@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime
+from sqlalchemy import Column, String, Text, DateTime, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from db import Base
@@ -13,4 +13,10 @@ class Stack(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Add this relationship
-    workflows = relationship("Workflow", back_populates="stack", cascade="all, delete-orphan")
\ No newline at end of file
+    workflows = relationship("Workflow", back_populates="stack", cascade="all, delete-orphan")
+    documents = relationship("Document", cascade="all, delete-orphan")
+    ingestion_jobs = relationship("IngestionJob", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_stacks_created", "created_at", "id"),
+    )
\ No newline at end of file
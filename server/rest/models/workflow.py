@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, JSON, ForeignKey
+from sqlalchemy import Column, String, JSON, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from db import Base
 
@@ -10,5 +11,14 @@ class Workflow(Base):
     nodes = Column(JSON, default=list)
     edges = Column(JSON, default=list) 
     data = Column(JSON, default=dict)
+    # Bumped on every change to nodes/edges/data; compiled execution plans
+    # are cached against it.
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    stack = relationship("Stack", back_populates="workflows")
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    stack = relationship("Stack", back_populates="workflows")
+
+    __table_args__ = (
+        Index("ix_workflows_stack_created", "stack_id", "created_at", "id"),
+    )
\ No newline at end of file
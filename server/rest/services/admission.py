@@ -0,0 +1,181 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+# Requests running at once, over all stacks and per stack, and how many may
+# wait for a slot before new ones are turned away.
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_MAX_ACTIVE_PER_STACK = int(os.getenv("ADMISSION_MAX_ACTIVE_PER_STACK", "8"))
+ADMISSION_MAX_QUEUE_PER_STACK = int(os.getenv("ADMISSION_MAX_QUEUE_PER_STACK", "16"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "10"))
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing: 429 when one stack is over its share,
+    503 when the whole process is over capacity."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _Slots:
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+
+    def full(self) -> bool:
+        return self.active >= self.limit
+
+
+class Ticket:
+    """An admitted request; ``release`` is idempotent so both a streaming
+    body and its fallback cleanup can call it."""
+
+    def __init__(self, control: "AdmissionControl", stack_id: str):
+        self._control = control
+        self.stack_id = stack_id
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._control._release(self)
+
+
+class AdmissionControl:
+    """Global and per-stack concurrency limits with bounded wait queues.
+
+    A request first waits for a slot of its own stack, then for a global
+    slot, so a stack stuck behind its own limit never holds global capacity.
+    When the relevant queue is already full it is rejected immediately.
+    """
+
+    def __init__(self, max_active: int, max_queue: int, max_active_per_stack: int, max_queue_per_stack: int, queue_timeout: float):
+        self.max_queue = max_queue
+        self.max_active_per_stack = max_active_per_stack
+        self.max_queue_per_stack = max_queue_per_stack
+        self.queue_timeout = queue_timeout
+        self._global = _Slots(max_active)
+        self._stacks: Dict[str, _Slots] = {}
+        # Moving average of how long a slot is held, for Retry-After.
+        self._hold_seconds = 1.0
+        self.admitted = 0
+        self.rejected_stack = 0
+        self.rejected_global = 0
+        self.timed_out = 0
+
+    def _retry_after(self, slots: _Slots) -> int:
+        waits = (slots.waiting + 1) / max(slots.limit, 1)
+        return max(1, min(60, math.ceil(self._hold_seconds * waits)))
+
+    async def acquire(self, stack_id: str) -> Ticket:
+        stack = self._stacks.get(stack_id)
+        if stack is not None and stack.full() and stack.waiting >= self.max_queue_per_stack:
+            self.rejected_stack += 1
+            raise Overloaded(429, "Too many concurrent requests for this stack", self._retry_after(stack))
+        if self._global.full() and self._global.waiting >= self.max_queue:
+            self.rejected_global += 1
+            raise Overloaded(503, "Server is at capacity", self._retry_after(self._global))
+        if stack is None:
+            stack = self._stacks[stack_id] = _Slots(self.max_active_per_stack)
+
+        deadline = time.monotonic() + self.queue_timeout
+        held = []
+        try:
+            for slots in (stack, self._global):
+                slots.waiting += 1
+                try:
+                    await asyncio.wait_for(slots.semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+                finally:
+                    slots.waiting -= 1
+                slots.active += 1
+                held.append(slots)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded(503, "Timed out waiting for capacity", self._retry_after(self._global))
+        finally:
+            if len(held) < 2:
+                for slots in held:
+                    slots.active -= 1
+                    slots.semaphore.release()
+                self._forget(stack_id, stack)
+        self.admitted += 1
+        return Ticket(self, stack_id)
+
+    def _release(self, ticket: Ticket):
+        self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * (time.monotonic() - ticket.started)
+        stack = self._stacks[ticket.stack_id]
+        for slots in (self._global, stack):
+            slots.active -= 1
+            slots.semaphore.release()
+        self._forget(ticket.stack_id, stack)
+
+    def _forget(self, stack_id: str, stack: _Slots):
+        if stack.active == 0 and stack.waiting == 0 and self._stacks.get(stack_id) is stack:
+            del self._stacks[stack_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._global.active,
+            "waiting": self._global.waiting,
+            "stacks_active": len(self._stacks),
+            "admitted": self.admitted,
+            "rejected_stack": self.rejected_stack,
+            "rejected_global": self.rejected_global,
+            "timed_out": self.timed_out,
+            "hold_seconds_avg": round(self._hold_seconds, 3),
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The call runs as its own task, so callers that give up (e.g. a client
+    disconnecting) don't cancel it for the others still waiting.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._flights.get(key)
+        if task is None:
+            self.executions += 1
+            task = self._flights[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # every waiter may be gone; don't warn about it
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._flights), "executions": self.executions, "coalesced": self.coalesced}
+
+
+admission = AdmissionControl(
+    ADMISSION_MAX_ACTIVE,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_ACTIVE_PER_STACK,
+    ADMISSION_MAX_QUEUE_PER_STACK,
+    ADMISSION_QUEUE_TIMEOUT_S,
+)
+builds = SingleFlight()
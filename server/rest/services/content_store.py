@@ -0,0 +1,230 @@
+import os
+import glob
+import gzip
+import json
+import shutil
+import uuid
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+
+from models.document import Document
+from services.executor import run_io
+from utils.documents import CHUNK_OVERLAP, CHUNK_SIZE, UPLOAD_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single worker only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(UPLOAD_DIR, "blobs"))
+PARSED_CACHE_DIR = os.getenv("PARSED_CACHE_DIR", os.path.join(os.getenv("INDEX_DIR", "kb_index"), "parsed"))
+
+
+def _slug(value: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in value)
+
+
+class CacheWriter:
+    """Appends chunks and/or their embeddings for one document as batches are
+    produced, and publishes them atomically on ``commit``."""
+
+    def __init__(self, chunks_path: Optional[str], embeddings_path: Optional[str]):
+        self.chunks_path = chunks_path
+        self.embeddings_path = embeddings_path
+        self._chunks = None
+        self._embeddings = None
+        self.count = 0
+        self.dim = None
+        # Two stacks may ingest the same bytes at once; each writes its own
+        # temp files and the last rename wins with identical content.
+        self._suffix = f".{uuid.uuid4().hex}.tmp"
+        for path in (chunks_path, embeddings_path):
+            if path:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        if chunks_path:
+            self._chunks = gzip.open(chunks_path + self._suffix, "wt", encoding="utf-8", compresslevel=5)
+        if embeddings_path:
+            self._embeddings = open(embeddings_path + self._suffix, "wb")
+
+    def add(self, chunks: List[str], embeddings: Optional[np.ndarray]):
+        if self._chunks is not None:
+            for chunk in chunks:
+                self._chunks.write(json.dumps(chunk) + "\n")
+        if self._embeddings is not None and embeddings is not None:
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            self.dim = embeddings.shape[1]
+            self._embeddings.write(embeddings.tobytes())
+        self.count += len(chunks)
+
+    def commit(self):
+        if self._chunks is not None:
+            self._chunks.close()
+            os.replace(self.chunks_path + self._suffix, self.chunks_path)
+        if self._embeddings is not None:
+            self._embeddings.close()
+            if self.dim is None:
+                # Nothing was encoded (empty document); keep no embedding file.
+                os.remove(self.embeddings_path + self._suffix)
+                return
+            meta_tmp = f"{self.embeddings_path}.json{self._suffix}"
+            with open(meta_tmp, "w") as f:
+                json.dump({"count": self.count, "dim": self.dim}, f)
+            os.replace(meta_tmp, f"{self.embeddings_path}.json")
+            os.replace(self.embeddings_path + self._suffix, self.embeddings_path)
+
+    def abort(self):
+        for handle, path in ((self._chunks, self.chunks_path), (self._embeddings, self.embeddings_path)):
+            if handle is None:
+                continue
+            handle.close()
+            if os.path.exists(path + self._suffix):
+                os.remove(path + self._suffix)
+
+
+class ContentStore:
+    """Content-addressed storage for uploads plus per-hash parse/embed caches.
+
+    Blobs are stored once per sha256 no matter how many stacks attach them;
+    the documents table is the reference count, and a blob is removed with
+    its caches once no document row points at it. Chunk lists are cached per
+    hash (and chunking parameters), embeddings per hash and model, so a
+    document already seen by any stack is indexed without parsing or
+    encoding it again.
+
+    Adopting a blob until its document row is committed, and counting the
+    rows of a hash before removing its blob, both happen under ``hold``;
+    otherwise an upload could be handed a blob that a stack deletion is
+    about to remove.
+    """
+
+    def __init__(self, blob_dir: str, parsed_dir: str):
+        self.blob_dir = blob_dir
+        self.parsed_dir = parsed_dir
+        os.makedirs(blob_dir, exist_ok=True)
+        os.makedirs(parsed_dir, exist_ok=True)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self.blob_hits = 0
+        self.chunk_hits = 0
+        self.embedding_hits = 0
+
+    # Blobs
+
+    def blob_path(self, content_hash: str, file_name: Optional[str] = None) -> str:
+        ext = os.path.splitext(file_name or "")[1].lower() or ".bin"
+        return os.path.join(self.blob_dir, content_hash[:2], f"{content_hash}{_slug(ext)}")
+
+    def _lock_file(self, content_hash: str):
+        # One lock file per hash prefix, so they never pile up.
+        path = os.path.join(self.blob_dir, ".locks", f"{content_hash[:2]}.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, "a")
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    @asynccontextmanager
+    async def hold(self, content_hash: str) -> AsyncIterator[None]:
+        """Exclusive access to one hash's blob, across requests and worker
+        processes."""
+        lock = self._locks.setdefault(content_hash, asyncio.Lock())
+        self._lock_users[content_hash] = self._lock_users.get(content_hash, 0) + 1
+        try:
+            async with lock:
+                handle = await run_io(self._lock_file, content_hash) if fcntl is not None else None
+                try:
+                    yield
+                finally:
+                    if handle is not None:
+                        handle.close()
+        finally:
+            self._lock_users[content_hash] -= 1
+            if not self._lock_users[content_hash]:
+                del self._lock_users[content_hash], self._locks[content_hash]
+
+    def adopt(self, tmp_path: str, content_hash: str, file_name: Optional[str] = None) -> str:
+        """Move a freshly written upload into the store, or drop it if the
+        same bytes are already there. Returns the blob path. Callers hold
+        ``hold(content_hash)`` until the document row is committed."""
+        path = self.blob_path(content_hash, file_name)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            self.blob_hits += 1
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return path
+
+    def _remove(self, content_hash: str):
+        for path in glob.glob(os.path.join(self.blob_dir, content_hash[:2], f"{content_hash}.*")):
+            os.remove(path)
+        shutil.rmtree(self._cache_dir(content_hash), ignore_errors=True)
+
+    async def release_unreferenced(self, db, content_hashes):
+        for content_hash in {h for h in content_hashes if h}:
+            async with self.hold(content_hash):
+                # Counted under the lock: an upload adopting this blob has
+                # either committed its row by now or not adopted it yet.
+                result = await db.execute(
+                    select(func.count()).select_from(Document).where(Document.content_hash == content_hash)
+                )
+                if result.scalar_one() == 0:
+                    await run_io(self._remove, content_hash)
+                    logger.info(f"🗑️ Released blob {content_hash[:12]}")
+
+    # Parsed text / embedding caches
+
+    def _cache_dir(self, content_hash: str) -> str:
+        return os.path.join(self.parsed_dir, content_hash[:2], content_hash)
+
+    def chunks_path(self, content_hash: str) -> str:
+        return os.path.join(self._cache_dir(content_hash), f"chunks-{CHUNK_SIZE}-{CHUNK_OVERLAP}.jsonl.gz")
+
+    def embeddings_path(self, content_hash: str, model: str) -> str:
+        name = f"emb-{_slug(model)}-{CHUNK_SIZE}-{CHUNK_OVERLAP}.f32"
+        return os.path.join(self._cache_dir(content_hash), name)
+
+    def has_chunks(self, content_hash: str) -> bool:
+        return os.path.exists(self.chunks_path(content_hash))
+
+    def iter_chunks(self, content_hash: str) -> Iterator[str]:
+        self.chunk_hits += 1
+        with gzip.open(self.chunks_path(content_hash), "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def load_embeddings(self, content_hash: str, model: str) -> Optional[np.ndarray]:
+        path = self.embeddings_path(content_hash, model)
+        if not (os.path.exists(path) and self.has_chunks(content_hash)):
+            return None
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            embeddings = np.memmap(path, dtype=np.float32, mode="r", shape=(meta["count"], meta["dim"]))
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable embedding cache {path}: {e}")
+            return None
+        self.embedding_hits += 1
+        return embeddings
+
+    def writer(self, content_hash: str, model: str, chunks: bool, embeddings: bool) -> CacheWriter:
+        return CacheWriter(
+            self.chunks_path(content_hash) if chunks else None,
+            self.embeddings_path(content_hash, model) if embeddings else None,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "blob_dedup_hits": self.blob_hits,
+            "chunk_cache_hits": self.chunk_hits,
+            "embedding_cache_hits": self.embedding_hits,
+        }
+
+
+content_store = ContentStore(BLOB_DIR, PARSED_CACHE_DIR)
@@ -0,0 +1,130 @@
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_budgets(raw: str) -> Dict[str, int]:
+    budgets = {}
+    for item in raw.split(","):
+        if "=" in item:
+            model, tokens = item.split("=", 1)
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+# Tokens of retrieved context allowed into a prompt: CONTEXT_TOKEN_BUDGET by
+# default, overridden per model with "model=tokens,..." in CONTEXT_TOKEN_BUDGETS
+# and per LLM node with nodeData.contextTokens.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_TOKEN_BUDGETS = _parse_budgets(os.getenv("CONTEXT_TOKEN_BUDGETS", ""))
+# Knowledge-base nodes fetch top_k * CONTEXT_CANDIDATES chunks and keep top_k
+# of them by maximal marginal relevance.
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "4"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
+# Hybrid retrieval: dense and BM25 candidates are merged by weighted
+# reciprocal rank fusion; per node with nodeData.denseWeight/lexicalWeight.
+# A lexical weight of 0 turns the BM25 lookup off.
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# A chunk cut shorter than this isn't worth including.
+MIN_TRIMMED_TOKENS = 32
+
+# Words split into pieces of up to six characters, plus punctuation: close
+# enough to a subword tokenizer's count for budgeting, without loading one.
+_TOKEN_RE = re.compile(r"\w{1,6}|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text))
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    for i, match in enumerate(_TOKEN_RE.finditer(text), start=1):
+        if i == max_tokens:
+            return text[:match.end()].rstrip() + " …"
+    return text
+
+
+def context_budget(model: str) -> int:
+    return CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+
+def select_mmr(
+    query_embedding,
+    texts: List[str],
+    vectors: np.ndarray,
+    k: int,
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+    relevance: Optional[np.ndarray] = None,
+) -> List[str]:
+    """Pick ``k`` of ``texts`` by maximal marginal relevance.
+
+    Each step takes the candidate with the best trade-off between similarity
+    to the query and dissimilarity to what is already picked; candidates at
+    least ``dedup_threshold`` similar to a pick (or with the same text) are
+    dropped as near-duplicates. ``vectors`` are the candidates' normalised
+    embeddings, in the same order as ``texts``; ``relevance`` replaces their
+    similarity to the query when given (e.g. fused hybrid scores in [0, 1]).
+    """
+    if not texts:
+        return []
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    query = query / max(np.linalg.norm(query), 1e-12)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    relevance = vectors @ query if relevance is None else np.asarray(relevance, dtype=np.float32)
+    similarity = vectors @ vectors.T
+
+    remaining = list(range(len(texts)))
+    picked: List[int] = []
+    while remaining and len(picked) < k:
+        redundancy = similarity[np.ix_(remaining, picked)].max(axis=1) if picked else 0.0
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        picked.append(best)
+        remaining = [
+            i for i in remaining
+            if i != best and similarity[i, best] < dedup_threshold and texts[i] != texts[best]
+        ]
+    return [texts[i] for i in picked]
+
+
+def fuse_rankings(rankings: Sequence[Tuple[List[str], float]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Weighted reciprocal rank fusion of ``(ids best first, weight)``
+    rankings: each id scores ``sum(weight / (k + rank))``. Returns
+    ``(id, score)`` pairs, best first."""
+    scores: Dict[str, float] = {}
+    for ids, weight in rankings:
+        if weight <= 0:
+            continue
+        for rank, item in enumerate(ids, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+def fit_to_budget(sections: Sequence[List[str]], budget: int) -> List[List[str]]:
+    """Keep items from ``sections`` in priority order until ``budget`` tokens
+    are used; the first item that doesn't fit is trimmed (if enough room is
+    left) and everything after it is dropped."""
+    kept: List[List[str]] = [[] for _ in sections]
+    remaining = budget
+    for section, items in zip(kept, sections):
+        for item in items:
+            cost = estimate_tokens(item)
+            if cost <= remaining:
+                section.append(item)
+                remaining -= cost
+                continue
+            if remaining >= MIN_TRIMMED_TOKENS:
+                section.append(trim_to_tokens(item, remaining))
+            logger.debug(f"Context trimmed to {budget} tokens")
+            return kept
+    return kept
@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Set, Tuple
+
+from services.embeddings import embedding_registry
+from services.executor import run_io, run_embed
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+Pending = Tuple[str, asyncio.Future, float]
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-query encodes into per-model micro-batches.
+
+    A batch is sent as soon as ``max_batch`` queries are waiting for the same
+    model, or ``max_wait_ms`` after the first one arrived, whichever comes
+    first. One ``model.encode`` call then serves every caller in the batch.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._pending: Dict[str, List[Pending]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # The loop only keeps weak references to tasks; hold running batches here.
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.batch_size_counts = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def encode(self, model_name: str, text: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(model_name, [])
+        pending.append((text, future, time.perf_counter()))
+        if len(pending) >= self.max_batch:
+            self._flush(model_name)
+        elif model_name not in self._timers:
+            self._timers[model_name] = loop.call_later(self.max_wait, self._flush, model_name)
+        return await future
+
+    def _flush(self, model_name: str):
+        timer = self._timers.pop(model_name, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(model_name, [])
+        # Callers that gave up (e.g. client disconnected) are not encoded.
+        batch = [item for item in batch if not item[1].done()]
+        if batch:
+            task = asyncio.ensure_future(self._run(model_name, batch))
+            self._tasks.add(task)
+            task.add_done_callback(lambda t: self._done(t, batch))
+
+    def _done(self, task: asyncio.Task, batch: List[Pending]):
+        self._tasks.discard(task)
+        # _run resolves every future unless it was cancelled (or died) first.
+        _fail(batch, RuntimeError("Embedding batch was cancelled"))
+        if not task.cancelled():
+            task.exception()
+
+    async def stop(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        pending, self._pending = self._pending, {}
+        for batch in pending.values():
+            _fail(batch, RuntimeError("Embedding batcher stopped"))
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, model_name: str, batch: List[Pending]):
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            waited = started - enqueued
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.batches += 1
+        self.items += len(batch)
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if len(batch) <= b), BATCH_SIZE_BUCKETS[-1])
+        self.batch_size_counts[bucket] += 1
+
+        try:
+            model = await run_io(embedding_registry.get, model_name)
+            embeddings = await run_embed(model.encode, [text for text, _, _ in batch])
+        except Exception as e:
+            _fail(batch, e)
+            return
+        for (_, future, _), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_size_histogram": {f"le_{b}": c for b, c in self.batch_size_counts.items()},
+            "queue_wait_ms_mean": round(self.wait_seconds_total / self.items * 1000, 3) if self.items else 0.0,
+            "queue_wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+        }
+
+
+def _fail(batch: List[Pending], error: BaseException):
+    for _, future, _ in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+embedding_batcher = EmbeddingBatcher(
+    max_batch=int(os.getenv("EMBED_MICROBATCH_SIZE", "32")),
+    max_wait_ms=float(os.getenv("EMBED_MICROBATCH_WAIT_MS", "5")),
+)
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+
+def model_key(name: str, backend: Optional[str] = None) -> str:
+    # Registry/index key for a model on a backend, e.g. "all-MiniLM-L6-v2@onnx-int8".
+    # Vectors from different backends are not mixed in one index, so the key
+    # doubles as the manifest's embedding_model.
+    backend = backend or DEFAULT_EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}")
+    return name if backend == "torch" else f"{name}@{backend}"
+
+
+def parse_model_key(key: str) -> Tuple[str, str]:
+    name, _, backend = key.partition("@")
+    return name, backend or "torch"
+
+
+def _load_model(key: str):
+    name, backend = parse_model_key(key)
+    if backend == "torch":
+        # sentence_transformers pulls in torch/transformers; only pay for
+        # that once a model is actually needed.
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(name)
+    from services.onnx_embeddings import OnnxEmbeddingModel
+
+    return OnnxEmbeddingModel(name, quantized=backend == "onnx-int8")
+
+
+def _model_size_bytes(model) -> int:
+    if hasattr(model, "size_bytes"):
+        return model.size_bytes()
+    try:
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+    except Exception:
+        return 0
+
+
+class EmbeddingModelRegistry:
+    """Process-wide cache of loaded SentenceTransformer models.
+
+    Models are keyed by ``model_key`` (the ``embeddingModel`` name from the
+    knowledge-base node plus its backend) and evicted least-recently-used once the estimated parameter memory
+    goes over ``max_bytes``. The most recently used model is never evicted,
+    so a single model larger than the cap still stays loaded.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds_total = 0.0
+
+    def get(self, name: Optional[str] = None):
+        name = name or DEFAULT_EMBEDDING_MODEL
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                self.hits += 1
+                return model
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Only one thread loads a given model; others wait and then hit.
+        with load_lock:
+            with self._lock:
+                model = self._models.get(name)
+                if model is not None:
+                    self._models.move_to_end(name)
+                    self.hits += 1
+                    return model
+                self.misses += 1
+
+            started = time.perf_counter()
+            model = _load_model(name)
+            elapsed = time.perf_counter() - started
+            size = _model_size_bytes(model)
+            logger.info(f"🔑 Loaded embedding model {name} in {elapsed:.2f}s ({size / 1e6:.0f} MB)")
+
+            with self._lock:
+                self.load_seconds_total += elapsed
+                self._models[name] = model
+                self._sizes[name] = size
+                self._evict()
+            return model
+
+    def _evict(self):
+        while len(self._models) > 1 and sum(self._sizes.values()) > self.max_bytes:
+            name, _ = self._models.popitem(last=False)
+            self._sizes.pop(name, None)
+            self.evictions += 1
+            logger.info(f"♻️ Evicted embedding model {name}")
+
+    def warm_up(self, names: List[str]):
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"❌ Failed to warm up embedding model {name}: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "models": list(self._models.keys()),
+                "memory_bytes": sum(self._sizes.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_seconds_total": round(self.load_seconds_total, 3),
+            }
+
+
+embedding_registry = EmbeddingModelRegistry(
+    max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_MB", "2048")) * 1024 * 1024
+)
+
+
+def warmup_model_names() -> List[str]:
+    raw = os.getenv("EMBEDDING_WARMUP_MODELS", "")
+    return [n.strip() for n in raw.split(",") if n.strip()]
@@ -0,0 +1,137 @@
+import os
+import asyncio
+import logging
+import functools
+import contextvars
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedPool:
+    """Wraps a concurrent.futures executor with an admission limit.
+
+    At most ``max_workers + max_queue`` calls are in flight; further callers
+    wait on the event loop instead of piling work into the executor's
+    unbounded internal queue.
+    """
+
+    def __init__(self, name: str, kind: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"{self.name}-pool"
+                )
+            logger.info(f"🧵 Started {self.name} pool ({self.kind}, {self.max_workers} workers)")
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(fn, *args, **kwargs)
+            if self.kind == "thread":
+                # Like asyncio.to_thread: carry the caller's contextvars (the
+                # request's Server-Timing spans, the current trace span) into
+                # the worker. Process pools can't take them.
+                call = functools.partial(contextvars.copy_context().run, call)
+            result = await loop.run_in_executor(self._get_executor(), call)
+            self.completed += 1
+            return result
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        active = min(self.in_flight, self.max_workers)
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": active,
+            "queue_depth": self.in_flight - active,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+_cpu_count = os.cpu_count() or 1
+
+# Blocking network SDK calls (Gemini, SerpAPI) and Chroma's SQLite access.
+io_pool = BoundedPool(
+    "io",
+    kind="thread",
+    max_workers=int(os.getenv("IO_POOL_WORKERS", "32")),
+    max_queue=int(os.getenv("IO_POOL_QUEUE", "256")),
+)
+
+# Pure-Python CPU work such as PDF text extraction and chunking.
+cpu_pool = BoundedPool(
+    "cpu",
+    kind=os.getenv("CPU_POOL_KIND", "process"),
+    max_workers=int(os.getenv("CPU_POOL_WORKERS", str(_cpu_count))),
+    max_queue=int(os.getenv("CPU_POOL_QUEUE", "64")),
+)
+
+# Model inference. Torch releases the GIL and is itself multi-threaded, and the
+# loaded models live in this process, so a small thread pool is used here.
+embed_pool = BoundedPool(
+    "embed",
+    kind="thread",
+    max_workers=int(os.getenv("EMBED_POOL_WORKERS", "2")),
+    max_queue=int(os.getenv("EMBED_POOL_QUEUE", "128")),
+)
+
+POOLS = (io_pool, cpu_pool, embed_pool)
+
+
+async def run_io(fn: Callable, *args, **kwargs) -> Any:
+    return await io_pool.run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable, *args, **kwargs) -> Any:
+    return await cpu_pool.run(fn, *args, **kwargs)
+
+
+async def run_embed(fn: Callable, *args, **kwargs) -> Any:
+    return await embed_pool.run(fn, *args, **kwargs)
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {pool.name: pool.stats() for pool in POOLS}
+
+
+def shutdown_pools():
+    for pool in POOLS:
+        pool.shutdown()
@@ -0,0 +1,258 @@
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from services.context import estimate_tokens, fit_to_budget
+from services.embeddings import DEFAULT_EMBEDDING_MODEL, model_key
+from services.http_clients import http_clients
+from services.llm import get_llm, generate as llm_generate
+from services.pipeline import (
+    embed_query, embed_queries, query_knowledge_base, query_knowledge_base_many,
+    search_web, build_prompt, context_used,
+)
+from services.metrics import prompt_tokens
+from services.plan import ExecutionPlan, PlanNode
+from services.semantic_cache import semantic_cache, context_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# "Context:", "User Query:", "Answer:" and separators around the context.
+PROMPT_TEMPLATE_TOKENS = 12
+
+
+@dataclass
+class GraphRun:
+    plan: ExecutionPlan
+    query: str
+    use_knowledge_base: bool = True
+    # When set, the LLM node feeding the output is not called; its prompt and
+    # client are returned instead so the caller can stream the answer.
+    defer_final_llm: bool = False
+    results: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Filled in up front by prefetch_batch: query embeddings per model and
+    # retrieved documents per knowledge-base node.
+    embeddings: Dict[str, Any] = field(default_factory=dict)
+    kb_documents: Dict[str, List[str]] = field(default_factory=dict)
+    _embeddings: Dict[str, "asyncio.Task"] = field(default_factory=dict)
+
+    async def query_embedding(self, model_name: str):
+        if model_name in self.embeddings:
+            return self.embeddings[model_name]
+        # Shared by every node that needs the query under the same model, so
+        # several KB nodes and the semantic cache encode it only once.
+        if model_name not in self._embeddings:
+            self._embeddings[model_name] = asyncio.ensure_future(embed_query(model_name, self.query))
+        return await self._embeddings[model_name]
+
+    def final_llm_id(self) -> Optional[str]:
+        llm_ids = [n.id for n in self.plan.nodes if n.type == "llm"]
+        for node in self.plan.nodes:
+            if node.type == "output":
+                feeding = [d for d in node.depends_on if d in llm_ids]
+                if feeding:
+                    return feeding[-1]
+        return llm_ids[-1] if llm_ids else None
+
+    def upstream_context(self, node: PlanNode):
+        """Collect KB documents, web snippets and earlier LLM answers from
+        everything upstream of ``node``, without looking past other LLMs."""
+        by_id = {n.id: n for n in self.plan.nodes}
+        docs: List[str] = []
+        web: List[str] = []
+        answers: List[str] = []
+        seen = set()
+        stack = list(node.depends_on)
+        while stack:
+            dep_id = stack.pop(0)
+            if dep_id in seen:
+                continue
+            seen.add(dep_id)
+            dep, result = by_id[dep_id], self.results.get(dep_id, {})
+            if dep.type == "knowledge-base":
+                docs.extend(d for d in result.get("documents", []) if d not in docs)
+            elif dep.type == "web-search":
+                if result.get("web_context"):
+                    web.append(result["web_context"])
+            elif dep.type == "llm":
+                if result.get("answer"):
+                    answers.append(result["answer"])
+                continue
+            stack.extend(dep.depends_on)
+        return docs, "\n".join(web), answers
+
+
+async def _run_user_input(run: GraphRun, node: PlanNode) -> Dict[str, Any]:
+    return {"query": run.query}
+
+
+async def _run_knowledge_base(run: GraphRun, node: PlanNode) -> Dict[str, Any]:
+    if not run.use_knowledge_base:
+        return {"documents": []}
+    if node.id in run.kb_documents:
+        return {"documents": run.kb_documents[node.id]}
+    config = node.config
+    try:
+        query_embedding = await run.query_embedding(config.embedding_model)
+        documents = await query_knowledge_base(
+            run.plan.stack_id, query_embedding, config.top_k,
+            query=run.query, dense_weight=config.dense_weight, lexical_weight=config.lexical_weight,
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Knowledge base query failed for {run.plan.stack_id}: {e}")
+        documents = []
+    logger.debug(f"Retrieved {len(documents)} docs for {node.id}")
+    return {"documents": documents}
+
+
+async def _run_web_search(run: GraphRun, node: PlanNode) -> Dict[str, Any]:
+    if not node.config.api_key:
+        return {"web_context": ""}
+    try:
+        return {"web_context": await search_web(node.config.api_key, run.query)}
+    except Exception as e:
+        logger.error(f"❌ SerpAPI search failed: {http_clients.redact(str(e))}")
+        return {"web_context": ""}
+
+
+async def _run_llm(run: GraphRun, node: PlanNode) -> Dict[str, Any]:
+    config = node.config
+    docs, web_context, answers = run.upstream_context(node)
+    # Earlier answers first, then KB chunks (already in MMR order), then web
+    # snippets, until the node's token budget is spent.
+    reserved = estimate_tokens(f"{run.plan.output_text or ''} {run.query}") + PROMPT_TEMPLATE_TOKENS
+    answers, docs, web_lines = fit_to_budget(
+        [answers, docs, web_context.split("\n") if web_context else []], config.context_tokens - reserved
+    )
+    web_context = "\n".join(web_lines)
+    prompt = build_prompt(docs, web_context, run.plan.output_text, run.query, extra_context=answers)
+    tokens = estimate_tokens(prompt)
+    prompt_tokens.observe(tokens, config.model)
+    llm = get_llm(config.api_key, config.model)
+    result = {
+        "prompt": prompt, "prompt_tokens": tokens, "llm": llm,
+        "context_used": context_used(docs, web_context), "cached": False,
+    }
+
+    if config.semantic_cache:
+        kb = run.plan.knowledge_base
+        embedding = await run.query_embedding(kb.embedding_model if kb else model_key(DEFAULT_EMBEDDING_MODEL))
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        fingerprint = context_fingerprint(docs, web_context, answers, run.plan.output_text)
+        answer = semantic_cache.lookup(
+            run.plan.stack_id, embedding, fingerprint, run.plan.version, config.semantic_cache_threshold
+        )
+        if answer is not None:
+            logger.debug(f"Semantic cache hit for {node.id}")
+            result.update(answer=answer, cached=True)
+            return result
+        result["cache_entry"] = {
+            "stack_id": run.plan.stack_id,
+            "embedding": embedding,
+            "fingerprint": fingerprint,
+            "version": run.plan.version,
+        }
+
+    if run.defer_final_llm and node.id == run.final_llm_id():
+        return result
+    logger.debug(f"Sending prompt to {config.model} ({node.id})")
+    started = time.perf_counter()
+    result["answer"] = await llm_generate(llm, prompt)
+    if cache_entry := result.get("cache_entry"):
+        semantic_cache.store(
+            **cache_entry, answer=result["answer"], llm_seconds=time.perf_counter() - started
+        )
+    return result
+
+
+async def _run_output(run: GraphRun, node: PlanNode) -> Dict[str, Any]:
+    answers = [
+        run.results[d]["answer"] for d in node.depends_on
+        if run.results.get(d, {}).get("answer") is not None
+    ]
+    return {"answer": "\n\n".join(answers) if answers else None}
+
+
+async def prefetch_batch(plan: ExecutionPlan, queries: List[str]) -> List[Dict[str, Any]]:
+    """Embed all queries with one encode per model and retrieve for every
+    knowledge-base node with one multi-query call. Returns GraphRun keyword
+    arguments (``embeddings``, ``kb_documents``) per query."""
+    prefetched = [{"embeddings": {}, "kb_documents": {}} for _ in queries]
+    kb_nodes = [n for n in plan.nodes if n.type == "knowledge-base"]
+    models = {n.config.embedding_model for n in kb_nodes}
+    if any(n.type == "llm" and n.config.semantic_cache for n in plan.nodes) and not kb_nodes:
+        models.add(model_key(DEFAULT_EMBEDDING_MODEL))
+
+    for model_name in models:
+        embeddings = await embed_queries(model_name, queries)
+        for item, embedding in zip(prefetched, embeddings):
+            item["embeddings"][model_name] = embedding
+        for node in kb_nodes:
+            if node.config.embedding_model != model_name:
+                continue
+            try:
+                documents = await query_knowledge_base_many(
+                    plan.stack_id, embeddings, node.config.top_k, queries=queries,
+                    dense_weight=node.config.dense_weight, lexical_weight=node.config.lexical_weight,
+                )
+            except Exception as e:
+                # Leave this node to the per-query path (which logs and degrades).
+                logger.warning(f"⚠️ Batch knowledge base query failed for {plan.stack_id}: {e}")
+                continue
+            for item, docs in zip(prefetched, documents):
+                item["kb_documents"][node.id] = docs
+    return prefetched
+
+
+HANDLERS: Dict[str, Callable[[GraphRun, PlanNode], Awaitable[Dict[str, Any]]]] = {
+    "user-input": _run_user_input,
+    "knowledge-base": _run_knowledge_base,
+    "web-search": _run_web_search,
+    "llm": _run_llm,
+    "output": _run_output,
+}
+
+
+async def execute_plan(run: GraphRun) -> Dict[str, Any]:
+    """Run every node of the plan as soon as the nodes it depends on finish.
+
+    Independent branches (e.g. knowledge-base retrieval and web search) run
+    concurrently, so latency is the longest path rather than the sum of all
+    stages. Per-node wall time in milliseconds is recorded in ``timings``.
+    """
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_node(node: PlanNode):
+        if node.depends_on:
+            await asyncio.gather(*(tasks[d] for d in node.depends_on))
+        started = time.perf_counter()
+        run.results[node.id] = await HANDLERS[node.type](run, node)
+        run.timings[node.id] = round((time.perf_counter() - started) * 1000, 2)
+
+    for node in run.plan.nodes:
+        tasks[node.id] = asyncio.create_task(run_node(node))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    final = run.results.get(run.final_llm_id() or "", {})
+    outputs = [run.results[n.id] for n in run.plan.nodes if n.type == "output"]
+    answer = outputs[0]["answer"] if outputs and outputs[0]["answer"] is not None else final.get("answer")
+    return {
+        "answer": answer,
+        "prompt": final.get("prompt"),
+        "prompt_tokens": final.get("prompt_tokens"),
+        "llm": final.get("llm"),
+        "context_used": final.get("context_used", context_used([], "")),
+        "cached": final.get("cached", False),
+        "cache_entry": final.get("cache_entry"),
+        "timings": run.timings,
+    }
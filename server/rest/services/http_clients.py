@@ -0,0 +1,309 @@
+import os
+import re
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Set, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT_S = float(os.getenv("HTTP_CONNECT_TIMEOUT_S", "5"))
+HTTP_READ_TIMEOUT_S = float(os.getenv("HTTP_READ_TIMEOUT_S", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_S", "60"))
+# Client pools kept open across all services and API keys; the least
+# recently used one is closed (once idle) when another key shows up.
+HTTP_MAX_CLIENTS = int(os.getenv("HTTP_MAX_CLIENTS", "64"))
+
+# Worth retrying: the upstream was busy, overloaded or briefly unreachable.
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+REDACTED = "***"
+
+
+class RetryPolicy:
+    """Deadline, retry and hedging settings for one upstream service.
+
+    ``deadline`` bounds the whole call including retries and backoff.
+    ``hedge_after`` (seconds, 0 = off) sends a second copy of a request that
+    hasn't answered by then and takes whichever finishes first.
+    """
+
+    def __init__(self, deadline: float, retries: int, backoff: float = 0.2, backoff_max: float = 5.0, hedge_after: float = 0.0):
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+
+    @classmethod
+    def from_env(cls, prefix: str, deadline: float, retries: int = 2) -> "RetryPolicy":
+        return cls(
+            deadline=float(os.getenv(f"{prefix}_DEADLINE_S", str(deadline))),
+            retries=int(os.getenv(f"{prefix}_RETRIES", str(retries))),
+            backoff=float(os.getenv(f"{prefix}_BACKOFF_S", "0.2")),
+            hedge_after=float(os.getenv(f"{prefix}_HEDGE_AFTER_MS", "0")) / 1000,
+        )
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        # Full jitter, so clients that failed together don't retry together.
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = error.response.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        return delay
+
+
+class Service:
+    def __init__(self, name: str, base_url: str, policy: RetryPolicy, key_header: str = "", key_param: str = ""):
+        self.name = name
+        self.base_url = base_url
+        self.policy = policy
+        self.key_header = key_header
+        self.key_param = key_param
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.deadline_exceeded = 0
+        self.evictions = 0
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUSES
+    return isinstance(error, httpx.TransportError)
+
+
+def _consume(task: asyncio.Task):
+    # Losing hedges may fail after we stopped watching; don't warn about it.
+    if not task.cancelled():
+        task.exception()
+
+
+class HttpClients:
+    """Pooled ``httpx.AsyncClient``s shared across requests, one per
+    (service, API key).
+
+    The key is baked into the client's default headers/params, so stacks with
+    different keys never share (or race on) global state, and each client
+    keeps its own keep-alive pool to the upstream. At most ``max_clients``
+    stay open: calls lease a client, and an evicted one is closed as soon as
+    its last lease ends.
+    """
+
+    def __init__(self, max_clients: int = HTTP_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._services: Dict[str, Service] = {}
+        self._clients: "OrderedDict[Tuple[str, str], httpx.AsyncClient]" = OrderedDict()
+        self._leases: Dict[httpx.AsyncClient, int] = {}
+        self._retired: Set[httpx.AsyncClient] = set()
+        self._closing: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._key_param_re = None
+
+    def register(self, name: str, base_url: str, policy: RetryPolicy, key_header: str = "", key_param: str = ""):
+        self._services[name] = Service(name, base_url.rstrip("/"), policy, key_header, key_param)
+        params = sorted({config.key_param for config in self._services.values() if config.key_param})
+        if params:
+            self._key_param_re = re.compile(rf"([?&](?:{'|'.join(map(re.escape, params))})=)[^&#\s'\"]+")
+
+    def redact(self, text: str) -> str:
+        """``text`` with the values of API key query params masked. Keys sent
+        as params end up in request URLs, which httpx logs and puts in error
+        messages."""
+        if self._key_param_re is None:
+            return text
+        return self._key_param_re.sub(rf"\g<1>{REDACTED}", text)
+
+    @contextmanager
+    def _lease(self, service: str, api_key: str) -> Iterator[httpx.AsyncClient]:
+        with self._lock:
+            client = self._client(service, api_key)
+            self._leases[client] = self._leases.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._leases[client] -= 1
+                if self._leases[client] == 0:
+                    del self._leases[client]
+                    if client in self._retired:
+                        self._retired.discard(client)
+                        self._close(client)
+
+    def _client(self, service: str, api_key: str) -> httpx.AsyncClient:
+        # Caller holds self._lock.
+        client = self._clients.get((service, api_key))
+        if client is not None and not client.is_closed:
+            self._clients.move_to_end((service, api_key))
+            return client
+        config = self._services[service]
+        client = httpx.AsyncClient(
+            base_url=config.base_url,
+            headers={config.key_header: api_key} if config.key_header else None,
+            params={config.key_param: api_key} if config.key_param else None,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT_S, connect=HTTP_CONNECT_TIMEOUT_S),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_S,
+            ),
+        )
+        self._clients[(service, api_key)] = client
+        logger.info(f"🌐 Opened {service} client pool ({config.base_url})")
+        while len(self._clients) > self.max_clients:
+            (evicted_service, _), evicted = self._clients.popitem(last=False)
+            self._services[evicted_service].evictions += 1
+            if evicted in self._leases:
+                self._retired.add(evicted)
+            else:
+                self._close(evicted)
+        return client
+
+    def _close(self, client: httpx.AsyncClient):
+        task = asyncio.ensure_future(client.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _hedged(self, config: Service, call: Callable[[], Awaitable[Any]], hedge_after: float) -> Any:
+        if not hedge_after:
+            config.attempts += 1
+            return await call()
+
+        tasks = [asyncio.ensure_future(call())]
+        config.attempts += 1
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                config.hedges += 1
+                config.attempts += 1
+                tasks.append(asyncio.ensure_future(call()))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            config.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.add_done_callback(_consume)
+                task.cancel()
+
+    async def _with_retries(self, config: Service, call: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.policy.deadline
+        config.calls += 1
+        hedge_after = config.policy.hedge_after if hedge else 0.0
+        attempt = 0
+        while True:
+            try:
+                return await asyncio.wait_for(self._hedged(config, call, hedge_after), deadline - loop.time())
+            except asyncio.TimeoutError:
+                config.deadline_exceeded += 1
+                config.failures += 1
+                raise
+            except Exception as e:
+                delay = config.policy.delay(attempt, e)
+                if not _retryable(e) or attempt >= config.policy.retries or loop.time() + delay >= deadline:
+                    config.failures += 1
+                    raise
+                attempt += 1
+                config.retries += 1
+                logger.debug(f"Retrying {config.name} in {delay:.2f}s after: {self.redact(str(e))}")
+                await asyncio.sleep(delay)
+
+    async def request(self, service: str, api_key: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request with the service's deadline, retries and hedging.
+
+        Raises ``httpx.HTTPStatusError`` for error responses once retries are
+        used up, and ``asyncio.TimeoutError`` when the deadline passes.
+        """
+        config = self._services[service]
+        with self._lease(service, api_key) as client:
+            async def call():
+                response = await client.request(method, url, **kwargs)
+                response.raise_for_status()
+                return response
+
+            return await self._with_retries(config, call)
+
+    @asynccontextmanager
+    async def stream(self, service: str, api_key: str, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Open a streaming response, retrying until the headers arrive.
+
+        Streams are never hedged (that would pay for the whole body twice),
+        and once the body starts flowing a failure is the caller's problem.
+        """
+        config = self._services[service]
+        with self._lease(service, api_key) as client:
+            async def call():
+                response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError:
+                    await response.aread()
+                    await response.aclose()
+                    raise
+                return response
+
+            response = await self._with_retries(config, call, hedge=False)
+            try:
+                yield response
+            finally:
+                await response.aclose()
+
+    async def aclose(self):
+        with self._lock:
+            clients = [*self._clients.values(), *self._retired]
+            self._clients, self._retired = OrderedDict(), set()
+        await asyncio.gather(*(client.aclose() for client in clients), *self._closing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "clients": sum(1 for (service, _), c in self._clients.items() if service == name and not c.is_closed),
+                "calls": config.calls,
+                "attempts": config.attempts,
+                "retries": config.retries,
+                "hedges": config.hedges,
+                "hedge_wins": config.hedge_wins,
+                "failures": config.failures,
+                "deadline_exceeded": config.deadline_exceeded,
+                "client_evictions": config.evictions,
+            }
+            for name, config in self._services.items()
+        }
+
+
+class RedactKeys(logging.Filter):
+    """Masks API keys in log lines (httpx logs every request URL at INFO)."""
+
+    def __init__(self, clients: HttpClients):
+        super().__init__()
+        self.clients = clients
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        redacted = self.clients.redact(message)
+        if redacted != message:
+            record.msg, record.args = redacted, None
+        return True
+
+
+http_clients = HttpClients()
+logging.getLogger("httpx").addFilter(RedactKeys(http_clients))
@@ -0,0 +1,296 @@
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from services.executor import run_io, run_cpu, run_embed
+from services.content_store import content_store
+from services.embeddings import embedding_registry
+from services.lexical_index import lexical_index
+from services.metrics import stage
+from services.semantic_cache import semantic_cache
+from services.vector_store import collection_name, vector_store
+from utils.documents import Chunker, next_batch, pdf_page_count, read_pages
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.getenv("INDEX_DIR", "kb_index")
+os.makedirs(INDEX_DIR, exist_ok=True)
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", "16"))
+
+MANIFEST_VERSION = 2
+# Chunks re-read from the vector store per call when backfilling the BM25
+# index of documents indexed before it existed.
+LEXICAL_BACKFILL_BATCH = 1024
+
+# Serialises manifest read-modify-write cycles per stack within this process.
+_stack_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+ProgressCallback = Callable[[str, float], Awaitable[None]]
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_id(doc_hash: str, chunk: str) -> str:
+    chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    return f"{doc_hash[:16]}-{chunk_hash[:16]}"
+
+
+def manifest_path(stack_id: str) -> str:
+    return os.path.join(INDEX_DIR, stack_id, "manifest.json")
+
+
+def empty_manifest(embedding_model: str) -> Dict[str, Any]:
+    return {"version": MANIFEST_VERSION, "embedding_model": embedding_model, "documents": {}}
+
+
+def load_manifest(stack_id: str) -> Optional[Dict[str, Any]]:
+    path = manifest_path(stack_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ Ignoring unreadable manifest for {stack_id}: {e}")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(stack_id: str, manifest: Dict[str, Any]):
+    path = manifest_path(stack_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+async def _load_or_reset(stack_id: str, embedding_model_name: str) -> Dict[str, Any]:
+    # Caller must hold the stack lock.
+    manifest = await run_io(load_manifest, stack_id)
+    if manifest is not None and manifest.get("embedding_model") == embedding_model_name:
+        return manifest
+    if manifest is not None:
+        logger.info(f"♻️ Resetting {collection_name(stack_id)} (embedding model changed)")
+    await run_io(vector_store.drop, stack_id)
+    await run_io(lexical_index.drop, stack_id)
+    manifest = empty_manifest(embedding_model_name)
+    await run_io(save_manifest, stack_id, manifest)
+    semantic_cache.invalidate(stack_id)
+    return manifest
+
+
+async def _backfill_lexical(stack_id: str, entries: List[Dict[str, Any]]):
+    # Caller must hold the stack lock. Texts come back from the vector store,
+    # so nothing is parsed or embedded again.
+    for entry in entries:
+        ids = entry["chunk_ids"]
+        for start in range(0, len(ids), LEXICAL_BACKFILL_BATCH):
+            found, texts, _ = await run_io(vector_store.fetch, stack_id, ids[start:start + LEXICAL_BACKFILL_BATCH])
+            with stage("lexical_upsert"):
+                await run_io(lexical_index.upsert, stack_id, found, texts)
+        entry["lexical"] = True
+    logger.info(f"🔤 Built the lexical index for {len(entries)} documents in {collection_name(stack_id)}")
+
+
+async def drop_knowledge_base(stack_id: str):
+    """Remove everything indexed for a deleted stack: its vectors, BM25
+    postings and manifest."""
+    async with _stack_locks[stack_id]:
+        await run_io(vector_store.drop, stack_id)
+        await run_io(lexical_index.drop, stack_id)
+        await run_io(shutil.rmtree, os.path.dirname(manifest_path(stack_id)), True)
+        semantic_cache.invalidate(stack_id)
+    logger.info(f"🗑️ Dropped the index of {collection_name(stack_id)}")
+
+
+async def reconcile_knowledge_base(
+    stack_id: str,
+    documents: List[Dict[str, Any]],
+    embedding_model_name: str,
+) -> Dict[str, Any]:
+    """Drop chunks of documents no longer attached to the stack and report
+    which attached documents are not indexed yet.
+
+    Nothing is parsed or embedded here; missing documents are left for the
+    ingestion workers.
+    """
+    async with _stack_locks[stack_id]:
+        manifest = await _load_or_reset(stack_id, embedding_model_name)
+        indexed = manifest["documents"]
+        attached = {d.get("id") for d in documents if d.get("id")}
+
+        removed = [h for h, entry in indexed.items() if not attached & set(entry["document_ids"])]
+        if removed:
+            for doc_hash in removed:
+                ids = indexed.pop(doc_hash)["chunk_ids"]
+                if ids:
+                    await run_io(vector_store.delete, stack_id, ids)
+                    await run_io(lexical_index.delete, stack_id, ids)
+                logger.info(f"🗑️ Removed {len(ids)} chunks of document {doc_hash[:12]}")
+            await run_io(save_manifest, stack_id, manifest)
+            semantic_cache.invalidate(stack_id)
+
+        stale = [entry for entry in indexed.values() if not entry.get("lexical")]
+        if stale:
+            await _backfill_lexical(stack_id, stale)
+            await run_io(save_manifest, stack_id, manifest)
+            semantic_cache.invalidate(stack_id)
+
+        indexed_ids = {i for entry in indexed.values() for i in entry["document_ids"]}
+        missing = [d for d in documents if d.get("id") and d["id"] not in indexed_ids]
+
+    return {
+        "removed": len(removed),
+        "missing": missing,
+        "chunks": sum(len(entry["chunk_ids"]) for entry in indexed.values()),
+    }
+
+
+async def index_document(
+    stack_id: str,
+    doc: Dict[str, Any],
+    embedding_model_name: str,
+    on_progress: Optional[ProgressCallback] = None,
+) -> int:
+    """Parse, chunk, embed and upsert one document into the stack index.
+
+    Chunk ids are content-addressed, so re-running after an interruption
+    simply overwrites whatever was upserted before. Chunks and embeddings
+    already cached for the same bytes (by any stack) are reused instead of
+    parsing and encoding again. Returns the number of chunks indexed for the
+    document.
+    """
+    async def progress(stage: str, fraction: float):
+        if on_progress is not None:
+            await on_progress(stage, fraction)
+
+    # Uploads record their hash as they are written; older documents are hashed here.
+    doc_hash = doc.get("content_hash") or await run_io(file_sha256, doc["path"])
+
+    async with _stack_locks[stack_id]:
+        manifest = await _load_or_reset(stack_id, embedding_model_name)
+        entry = manifest["documents"].get(doc_hash)
+        if entry is not None:
+            # Same bytes already indexed (e.g. re-upload): just attach the id.
+            if doc["id"] not in entry["document_ids"]:
+                entry["document_ids"].append(doc["id"])
+                await run_io(save_manifest, stack_id, manifest)
+            return len(entry["chunk_ids"])
+
+    cached_embeddings = await run_io(content_store.load_embeddings, doc_hash, embedding_model_name)
+    chunks_cached = cached_embeddings is not None or await run_io(content_store.has_chunks, doc_hash)
+    writer = None
+    if not chunks_cached or cached_embeddings is None:
+        writer = await run_io(
+            content_store.writer, doc_hash, embedding_model_name,
+            chunks=not chunks_cached, embeddings=cached_embeddings is None,
+        )
+
+    ids: List[str] = []
+    seen = set()
+    batch_ids: List[str] = []
+    batch_chunks: List[str] = []
+    model = None
+    offset = 0
+
+    async def flush(limit: int):
+        nonlocal model, offset
+        while len(batch_chunks) >= limit and batch_chunks:
+            chunks, chunk_ids = batch_chunks[:EMBED_BATCH_SIZE], batch_ids[:EMBED_BATCH_SIZE]
+            del batch_chunks[:EMBED_BATCH_SIZE], batch_ids[:EMBED_BATCH_SIZE]
+            if cached_embeddings is not None:
+                # Another stack already embedded these exact chunks with this model.
+                embeddings = np.asarray(cached_embeddings[offset:offset + len(chunks)])
+                if len(embeddings) != len(chunks):
+                    raise ValueError(f"Embedding cache for {doc_hash[:12]} is truncated")
+                offset += len(chunks)
+            else:
+                if model is None:
+                    model = await run_io(embedding_registry.get, embedding_model_name)
+                with stage("embed"):
+                    embeddings = await run_embed(model.encode, chunks)
+                await run_io(writer.add, chunks, embeddings)
+            with stage("vector_upsert"):
+                await run_io(vector_store.upsert, stack_id, chunk_ids, chunks, embeddings)
+            with stage("lexical_upsert"):
+                await run_io(lexical_index.upsert, stack_id, chunk_ids, chunks)
+
+    def collect(chunks: List[str]):
+        # A chunk repeated inside one document maps to the same id; keep the first.
+        for chunk in chunks:
+            cid = chunk_id(doc_hash, chunk)
+            if cid in seen:
+                continue
+            seen.add(cid)
+            ids.append(cid)
+            batch_ids.append(cid)
+            batch_chunks.append(chunk)
+
+    try:
+        if chunks_cached:
+            # Parsed before (by any stack): stream the cached chunk list.
+            await progress("embed", 0.0)
+            cached = content_store.iter_chunks(doc_hash)
+            while batch := await run_io(next_batch, cached, EMBED_BATCH_SIZE):
+                collect(batch)
+                await flush(EMBED_BATCH_SIZE)
+        else:
+            await progress("parse", 0.0)
+            page_count = await run_cpu(pdf_page_count, doc["path"])
+            chunker = Chunker()
+            # Pages are read a window at a time in the CPU pool and chunks are
+            # embedded as soon as a batch fills, so memory stays flat regardless
+            # of document size.
+            for first_page in range(0, page_count, PAGE_WINDOW):
+                with stage("pdf_parse"):
+                    pages = await run_cpu(read_pages, doc["path"], first_page, PAGE_WINDOW)
+                with stage("chunk"):
+                    for text in pages:
+                        collect(chunker.feed(text))
+                await flush(EMBED_BATCH_SIZE)
+                done = min(first_page + PAGE_WINDOW, page_count)
+                await progress("embed", 0.95 * done / page_count)
+            collect(chunker.flush())
+        await flush(1)
+    except BaseException:
+        if writer is not None:
+            await run_io(writer.abort)
+        raise
+    if writer is not None:
+        await run_io(writer.commit)
+
+    await progress("upsert", 0.95)
+    async with _stack_locks[stack_id]:
+        manifest = await run_io(load_manifest, stack_id)
+        if manifest is None or manifest.get("embedding_model") != embedding_model_name:
+            # The index was reset under us; the next reconcile re-queues this document.
+            logger.warning(f"⚠️ Index for {stack_id} changed while ingesting {doc.get('file_name')}")
+            return 0
+        entry = manifest["documents"].setdefault(
+            doc_hash, {"file_name": doc.get("file_name"), "chunk_ids": ids, "document_ids": [], "lexical": True}
+        )
+        if doc["id"] not in entry["document_ids"]:
+            entry["document_ids"].append(doc["id"])
+        await run_io(save_manifest, stack_id, manifest)
+    semantic_cache.invalidate(stack_id)
+
+    logger.info(f"✅ Indexed {len(ids)} chunks for {doc.get('file_name')} in {collection_name(stack_id)}")
+    return len(ids)
@@ -0,0 +1,256 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.future import select
+
+from db import SessionLocal
+from models.document import Document
+from models.ingestion_job import IngestionJob
+from models.workflow import Workflow
+from services.embeddings import DEFAULT_EMBEDDING_MODEL, model_key
+from services.indexing import index_document
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Workers renew the lease on their running jobs every heartbeat; a running
+# job whose lease is older than INGEST_STALE_SECONDS is assumed orphaned
+# (its process died) and goes back to the queue. The sweep runs on every
+# heartbeat, in every process.
+INGEST_HEARTBEAT_SECONDS = float(os.getenv("INGEST_HEARTBEAT_SECONDS", "30"))
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "120"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def embedding_model_for(workflow: Optional[Workflow]) -> str:
+    for node in (workflow.nodes or []) if workflow else []:
+        if node.get("data", {}).get("type") == "knowledge-base":
+            data = node["data"].get("nodeData") or {}
+            return model_key(
+                data.get("embeddingModel") or DEFAULT_EMBEDDING_MODEL, data.get("embeddingBackend") or None
+            )
+    return model_key(DEFAULT_EMBEDDING_MODEL)
+
+
+class IngestionQueue:
+    """In-process worker pool that runs parse → chunk → embed → upsert jobs.
+
+    Job state lives in the ``ingestion_jobs`` table. Workers claim a job
+    with a conditional UPDATE that records this process as its lease holder,
+    so several processes can share the table without running a job twice.
+    ``stop`` hands jobs it interrupts back to the queue; jobs of a process
+    that died are re-queued by the periodic sweep once their lease expires.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._enqueued: set = set()
+        self._tasks: List[asyncio.Task] = []
+        self._maintenance: Optional[asyncio.Task] = None
+        self.requeued_stale = 0
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._enqueued:
+            self._enqueued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def start(self):
+        resumed = await self._sweep()
+        if resumed:
+            logger.info(f"🔁 Resuming {resumed} interrupted ingestion jobs")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._maintenance = asyncio.create_task(self._maintain())
+
+    async def stop(self):
+        tasks = self._tasks + ([self._maintenance] if self._maintenance else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks, self._maintenance = [], None
+        await self._release_running()
+
+    async def _release_running(self):
+        # Jobs this process was cancelled in the middle of go straight back
+        # to the queue instead of waiting for their lease to expire.
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(IngestionJob.stack_id, IngestionJob.document_id).where(
+                    IngestionJob.worker_id == self.worker_id, IngestionJob.status == "running"
+                )
+            )
+            held = result.all()
+            if not held:
+                return
+            await db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.worker_id == self.worker_id, IngestionJob.status == "running")
+                .values(status="queued", worker_id=None, heartbeat_at=None)
+            )
+            for stack_id, document_id in held:
+                await db.execute(
+                    update(Document)
+                    .where(Document.stack_id == stack_id, Document.id == document_id, Document.status == "running")
+                    .values(status="queued")
+                )
+            await db.commit()
+        logger.info(f"⏸️ Returned {len(held)} interrupted ingestion jobs to the queue")
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(INGEST_HEARTBEAT_SECONDS)
+            try:
+                await self._heartbeat()
+                requeued = await self._sweep()
+                if requeued:
+                    logger.info(f"🔁 Picked up {requeued} queued or orphaned ingestion jobs")
+            except Exception as e:
+                logger.warning(f"⚠️ Ingestion maintenance failed: {e}")
+
+    async def _heartbeat(self):
+        async with SessionLocal() as db:
+            await db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.worker_id == self.worker_id, IngestionJob.status == "running")
+                .values(heartbeat_at=datetime.now(timezone.utc))
+            )
+            await db.commit()
+
+    async def _sweep(self) -> int:
+        """Re-queue running jobs whose lease expired and enqueue every queued
+        job this process doesn't already have; returns how many were added."""
+        stale = datetime.now(timezone.utc) - timedelta(seconds=INGEST_STALE_SECONDS)
+        async with SessionLocal() as db:
+            expired = await db.execute(
+                update(IngestionJob)
+                .where(
+                    IngestionJob.status == "running",
+                    or_(
+                        IngestionJob.heartbeat_at < stale,
+                        # Claimed before leases existed.
+                        and_(IngestionJob.heartbeat_at.is_(None), IngestionJob.updated_at < stale),
+                    ),
+                )
+                .values(status="queued", worker_id=None, heartbeat_at=None)
+            )
+            self.requeued_stale += expired.rowcount or 0
+            result = await db.execute(
+                select(IngestionJob.id)
+                .where(IngestionJob.status == "queued")
+                .order_by(IngestionJob.created_at)
+            )
+            pending = [job_id for job_id in result.scalars().all() if job_id not in self._enqueued]
+            await db.commit()
+        for job_id in pending:
+            self._enqueue(job_id)
+        return len(pending)
+
+    async def submit(self, db, stack_id: str, document: Dict) -> IngestionJob:
+        job = IngestionJob(
+            id=str(uuid.uuid4()),
+            stack_id=stack_id,
+            document_id=document["id"],
+            file_name=document.get("file_name"),
+            path=document["path"],
+            status="queued",
+            progress=0.0,
+        )
+        db.add(job)
+        await db.execute(
+            update(Document)
+            .where(Document.stack_id == stack_id, Document.id == document["id"])
+            .values(status="queued", error=None)
+        )
+        await db.commit()
+        self._enqueue(job.id)
+        return job
+
+    async def active_document_ids(self, db, stack_id: str) -> set:
+        result = await db.execute(
+            select(IngestionJob.document_id).where(
+                IngestionJob.stack_id == stack_id,
+                IngestionJob.status.in_(ACTIVE_STATUSES),
+            )
+        )
+        return set(result.scalars().all())
+
+    def stats(self) -> Dict:
+        return {"workers": len(self._tasks), "queued": self._queue.qsize(), "requeued_stale": self.requeued_stale}
+
+    async def _worker(self, n: int):
+        while True:
+            job_id = await self._queue.get()
+            self._enqueued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ingestion worker {n} crashed on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        async with SessionLocal() as db:
+            # Claim the job atomically: with several workers the same queued
+            # job can be in more than one process's queue.
+            claimed = await db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id, IngestionJob.status == "queued")
+                .values(status="running", worker_id=self.worker_id, heartbeat_at=datetime.now(timezone.utc))
+            )
+            await db.commit()
+            if claimed.rowcount != 1:
+                return
+            job = await db.get(IngestionJob, job_id)
+            document = await db.get(Document, {"stack_id": job.stack_id, "id": job.document_id})
+            job.error = None
+            if document is not None:
+                document.status = "running"
+                document.error = None
+            await db.commit()
+
+            result = await db.execute(select(Workflow).where(Workflow.stack_id == job.stack_id))
+            embedding_model_name = embedding_model_for(result.scalar_one_or_none())
+
+            async def on_progress(stage: str, fraction: float):
+                job.stage = stage
+                job.progress = round(fraction, 3)
+                await db.commit()
+
+            try:
+                if not os.path.exists(job.path):
+                    raise FileNotFoundError(job.path)
+                source = document.as_source() if document is not None else {
+                    "id": job.document_id, "file_name": job.file_name, "path": job.path
+                }
+                job.chunks = await index_document(
+                    job.stack_id,
+                    source,
+                    embedding_model_name,
+                    on_progress=on_progress,
+                )
+                job.status = "succeeded"
+                job.stage = "done"
+                job.progress = 1.0
+                logger.info(f"✅ Ingestion job {job_id} finished ({job.chunks} chunks)")
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logger.error(f"❌ Ingestion job {job_id} failed: {e}")
+            if document is not None:
+                document.status = "indexed" if job.status == "succeeded" else "failed"
+                document.chunks = job.chunks or 0
+                document.error = job.error
+            await db.commit()
+
+
+ingestion_queue = IngestionQueue(workers=INGEST_WORKERS)
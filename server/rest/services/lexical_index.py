@@ -0,0 +1,395 @@
+import os
+import re
+import math
+import logging
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.shared_log import SharedLog
+from services.vector_store import collection_name
+
+logger = logging.getLogger(__name__)
+
+# Persisted next to the vector index (INDEX_DIR/vectors), one directory per stack.
+LEXICAL_DIR = os.getenv("LEXICAL_DIR", os.path.join(os.getenv("INDEX_DIR", "kb_index"), "lexical"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# On stacks of at least LEXICAL_MAX_DF_MIN_CHUNKS chunks, terms found in
+# more than LEXICAL_MAX_DF_RATIO of them are skipped: their posting lists
+# are the longest and BM25 gives them almost no weight anyway. They are
+# still scored when they are the only query term or nothing else matched.
+LEXICAL_MAX_DF_RATIO = float(os.getenv("LEXICAL_MAX_DF_RATIO", "0.5"))
+LEXICAL_MAX_DF_MIN_CHUNKS = int(os.getenv("LEXICAL_MAX_DF_MIN_CHUNKS", "2000"))
+# Postings are snapshotted to ``postings.npz`` once the log has grown by
+# this much and by half of what the last snapshot covered, so a process
+# loading a stack replays at most about a third of its log.
+LEXICAL_SNAPSHOT_MIN_BYTES = int(os.getenv("LEXICAL_SNAPSHOT_MIN_BYTES", str(4 * 1024 * 1024)))
+# Load every stack on disk in the background at startup (see readiness).
+LEXICAL_WARMUP = os.getenv("LEXICAL_WARMUP", "true").lower() == "true"
+
+MAX_TF = 65535
+
+# Words, keeping identifiers like "ERR-4012", "v2.3.1" or "max_retries"
+# whole; their parts are indexed as well so "4012" still matches.
+_WORD_RE = re.compile(r"[^\W_]+(?:[-_./][^\W_]+)*")
+_SPLIT_RE = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        tokens.append(word)
+        if len(word) > 1 and _SPLIT_RE.search(word):
+            tokens.extend(_SPLIT_RE.split(word))
+    return tokens
+
+
+def term_frequencies(text: str) -> Tuple[Dict[str, int], int]:
+    tokens = tokenize(text)
+    return {term: min(count, MAX_TF) for term, count in Counter(tokens).items()}, len(tokens)
+
+
+def _join(strings: Sequence[str]) -> np.ndarray:
+    # Ids and terms never contain newlines.
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _split(joined: np.ndarray) -> List[str]:
+    text = joined.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class _StackLexicalIndex:
+    """BM25 inverted index for one stack.
+
+    ``docs.jsonl`` logs chunks (``{"id", "tf", "len"}``) and deletes
+    (``{"del": id}``) through a ``SharedLog``, like the numpy vector index.
+    In memory, each term maps to parallel ``array``s of row numbers and term
+    counts; queries read them as numpy views, so scoring a term costs one
+    vectorised pass over its posting list. Rows of deleted or replaced chunks
+    stay in the postings (masked out by ``live``) until compaction.
+
+    Rebuilding the postings from the log is the slow part of loading a
+    stack, so writers also save them to ``postings.npz`` together with the
+    log epoch and offset they cover; a reload starts from that snapshot and
+    replays only the log lines after it.
+    """
+
+    def __init__(self, directory: str, lock_path: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.log = SharedLog(directory, "docs.jsonl", lock_path)
+        self.reloads = 0
+        self.tail_reads = 0
+        self.snapshot_loads = 0
+        self.snapshot_epoch: Optional[str] = None
+        self.snapshot_offset = 0
+        self._reset()
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, "postings.npz")
+
+    def _reset(self):
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.live = bytearray()
+        self.lengths = array("I")
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.live_rows = 0
+        self.live_tokens = 0
+
+    def close(self):
+        self.log.close()
+
+    def refresh(self, locked: bool = False):
+        change = self.log.poll(locked, restore=self._restore)
+        if change is None:
+            return
+        reset, entries, meta = change
+        if reset:
+            if meta is None:
+                self._reset()
+            self.reloads += 1
+        else:
+            self.tail_reads += 1
+        if meta is not None:
+            self._apply(entries)
+
+    def _restore(self, epoch: str, size: int) -> int:
+        # Called by the log (under its lock) before a full reload; returns
+        # the offset the snapshot covers, or 0 to replay everything.
+        self._reset()
+        try:
+            with np.load(self.snapshot_path) as snapshot:
+                offset = int(snapshot["offset"])
+                if str(snapshot["epoch"]) != epoch or offset > size:
+                    return 0
+                self._load_snapshot(snapshot)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable snapshot {self.snapshot_path}: {e}")
+            self._reset()
+            return 0
+        self.snapshot_loads += 1
+        self.snapshot_epoch, self.snapshot_offset = epoch, offset
+        return offset
+
+    def _load_snapshot(self, snapshot):
+        self.ids = _split(snapshot["ids"])
+        lengths, live = snapshot["lengths"], snapshot["live"].astype(bool)
+        self.lengths = array("I", lengths.tobytes())
+        self.live = bytearray(live.tobytes())
+        self.rows = {self.ids[row]: row for row in np.flatnonzero(live).tolist()}
+        self.live_rows = len(self.rows)
+        self.live_tokens = int(lengths[live].sum())
+        rows, counts, offsets = snapshot["rows"], snapshot["counts"], snapshot["offsets"].tolist()
+        for term, start, end in zip(_split(snapshot["terms"]), offsets, offsets[1:]):
+            self.postings[term] = (array("I", rows[start:end].tobytes()), array("H", counts[start:end].tobytes()))
+
+    def _save_snapshot(self):
+        # Caller holds the file lock and has just refreshed.
+        epoch, offset = self.log.position
+        terms = list(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(self.postings[term][0]) for term in terms], out=offsets[1:])
+
+        def concat(part: int, dtype) -> np.ndarray:
+            if not terms:
+                return np.zeros(0, dtype=dtype)
+            return np.concatenate([np.frombuffer(self.postings[term][part], dtype=dtype) for term in terms])
+
+        tmp = f"{self.snapshot_path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                epoch=np.array(epoch),
+                offset=np.array(offset),
+                ids=_join(self.ids),
+                lengths=np.frombuffer(self.lengths, dtype=np.uint32).copy(),
+                live=np.frombuffer(self.live, dtype=np.uint8).copy(),
+                terms=_join(terms),
+                offsets=offsets,
+                rows=concat(0, np.uint32),
+                counts=concat(1, np.uint16),
+            )
+        os.replace(tmp, self.snapshot_path)
+        self.snapshot_epoch, self.snapshot_offset = epoch, offset
+
+    def _maybe_snapshot(self):
+        epoch, offset = self.log.position
+        covered = self.snapshot_offset if self.snapshot_epoch == epoch else 0
+        if offset - covered >= max(LEXICAL_SNAPSHOT_MIN_BYTES, covered // 2):
+            self._save_snapshot()
+
+    def _kill(self, row: int):
+        self.live[row] = 0
+        self.live_rows -= 1
+        self.live_tokens -= self.lengths[row]
+
+    def _apply(self, entries: List[Dict]):
+        postings_of = self.postings
+        for entry in entries:
+            if "del" in entry:
+                row = self.rows.pop(entry["del"], None)
+                if row is not None:
+                    self._kill(row)
+                continue
+            old = self.rows.get(entry["id"])
+            if old is not None:
+                self._kill(old)
+            row = self.rows[entry["id"]] = len(self.ids)
+            self.ids.append(entry["id"])
+            self.live.append(1)
+            self.lengths.append(entry["len"])
+            self.live_rows += 1
+            self.live_tokens += entry["len"]
+            for term, count in entry["tf"].items():
+                postings = postings_of.get(term)
+                if postings is None:
+                    postings = postings_of[term] = (array("I"), array("H"))
+                postings[0].append(row)
+                postings[1].append(count)
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str]):
+        entries = []
+        for chunk_id, text in zip(ids, documents):
+            tf, length = term_frequencies(text)
+            entries.append({"id": chunk_id, "tf": tf, "len": length})
+        with self.log.file_lock():
+            self.refresh(locked=True)
+            if not os.path.exists(self.log.meta_path):
+                self.log.create({})
+            self.log.append(entries)
+            self.refresh(locked=True)
+            self._maybe_compact()
+            self._maybe_snapshot()
+
+    def delete(self, ids: Sequence[str]):
+        with self.log.file_lock():
+            self.refresh(locked=True)
+            removed = [i for i in ids if i in self.rows]
+            if not removed:
+                return
+            self.log.append({"del": chunk_id} for chunk_id in removed)
+            self.refresh(locked=True)
+            self._maybe_compact()
+            self._maybe_snapshot()
+
+    def drop(self):
+        with self.log.file_lock():
+            self.log.remove()
+            self._reset()
+
+    def _maybe_compact(self):
+        dead = len(self.ids) - self.live_rows
+        if dead < 1024 or dead * 2 < len(self.ids):
+            return
+        tfs: Dict[int, Dict[str, int]] = {}
+        for term, (rows, counts) in self.postings.items():
+            for row, count in zip(rows, counts):
+                if self.live[row]:
+                    tfs.setdefault(row, {})[term] = count
+        keep = [row for row in range(len(self.ids)) if self.live[row]]
+        self.log.rewrite(
+            ({"id": self.ids[row], "tf": tfs.get(row, {}), "len": self.lengths[row]} for row in keep), {}
+        )
+        self.refresh(locked=True)
+        logger.info(f"🧹 Compacted {self.directory} to {len(keep)} chunks")
+
+    def query(self, text: str, n_results: int) -> List[str]:
+        if self.live_rows == 0:
+            return []
+        n_docs = self.live_rows
+        avg_length = max(self.live_tokens / n_docs, 1.0)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+        live = np.frombuffer(self.live, dtype=bool)
+        dead = len(self.ids) - n_docs
+
+        terms = [term for term in set(tokenize(text)) if term in self.postings]
+        common: List[str] = []
+        if n_docs >= LEXICAL_MAX_DF_MIN_CHUNKS and len(terms) > 1:
+            # At most ``dead`` postings are stale, so this never drops a
+            # term below the cutoff and never reads a long posting list.
+            max_df = LEXICAL_MAX_DF_RATIO * n_docs
+            common = [term for term in terms if len(self.postings[term][0]) - dead > max_df]
+            terms = [term for term in terms if term not in common]
+
+        hits, weights = self._score(terms, n_docs, avg_length, lengths, live, dead)
+        if not hits:
+            hits, weights = self._score(common, n_docs, avg_length, lengths, live, dead)
+        if not hits:
+            return []
+
+        rows, inverse = np.unique(np.concatenate(hits), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        if len(rows) > n_results:
+            top = np.argpartition(-scores, n_results - 1)[:n_results]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.ids[row] for row in rows[top]]
+
+    def _score(self, terms, n_docs, avg_length, lengths, live, dead):
+        hits, weights = [], []
+        for term in terms:
+            postings = self.postings[term]
+            rows = np.frombuffer(postings[0], dtype=np.uint32)
+            tf = np.frombuffer(postings[1], dtype=np.uint16)
+            if dead:
+                rows_live = live[rows]
+                rows, tf = rows[rows_live], tf[rows_live]
+            df = len(rows)
+            if df == 0:
+                continue
+            tf = tf.astype(np.float32)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / avg_length)
+            hits.append(rows)
+            weights.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        return hits, weights
+
+    def stats(self) -> Dict:
+        return {"chunks": self.live_rows, "dead_chunks": len(self.ids) - self.live_rows, "terms": len(self.postings)}
+
+
+class LexicalIndex:
+    """Per-stack BM25 indexes for exact-term lookups (error codes, part
+    numbers, names) that embeddings tend to blur; kept in step with the
+    vector store by services.indexing and fused with it in services.pipeline.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._indexes: Dict[str, _StackLexicalIndex] = {}
+        self._lock = threading.Lock()
+
+    def _index(self, stack_id: str) -> _StackLexicalIndex:
+        with self._lock:
+            index = self._indexes.get(stack_id)
+            if index is None:
+                name = collection_name(stack_id)
+                index = self._indexes[stack_id] = _StackLexicalIndex(
+                    os.path.join(self.directory, name), os.path.join(self.directory, ".locks", f"{name}.lock")
+                )
+            return index
+
+    def upsert(self, stack_id: str, ids: List[str], documents: List[str]):
+        index = self._index(stack_id)
+        with index.lock:
+            index.upsert(ids, documents)
+
+    def delete(self, stack_id: str, ids: List[str]):
+        index = self._index(stack_id)
+        with index.lock:
+            index.delete(ids)
+
+    def drop(self, stack_id: str):
+        index = self._index(stack_id)
+        with index.lock:
+            index.drop()
+
+    def warm_up(self):
+        """Load every stack found on disk, so the first query for each one
+        doesn't wait for its postings to be read."""
+        prefix = collection_name("")
+        names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+        for name in sorted(names):
+            if name.startswith(prefix) and os.path.isdir(os.path.join(self.directory, name)):
+                index = self._index(name[len(prefix):])
+                with index.lock:
+                    index.refresh()
+
+    def query(self, stack_id: str, text: str, n_results: int) -> List[str]:
+        """Ids of the ``n_results`` best BM25 matches, best first."""
+        index = self._index(stack_id)
+        with index.lock:
+            index.refresh()
+            return index.query(text, n_results)
+
+    def close(self):
+        with self._lock:
+            indexes, self._indexes = list(self._indexes.values()), {}
+        for index in indexes:
+            with index.lock:
+                index.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            indexes = dict(self._indexes)
+        return {
+            "stacks_loaded": len(indexes),
+            "chunks": sum(index.stats()["chunks"] for index in indexes.values()),
+            "terms": sum(index.stats()["terms"] for index in indexes.values()),
+            "reloads": sum(index.reloads for index in indexes.values()),
+            "tail_reads": sum(index.tail_reads for index in indexes.values()),
+            "snapshot_loads": sum(index.snapshot_loads for index in indexes.values()),
+        }
+
+
+lexical_index = LexicalIndex(LEXICAL_DIR)
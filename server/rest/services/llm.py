@@ -0,0 +1,130 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, Tuple
+
+from services.http_clients import RetryPolicy, http_clients
+from services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_MODEL = "gemini-2.0-flash"
+
+# "gemini" talks to Google; "fake" streams a canned answer locally so the
+# streaming endpoints can be exercised without network access or a key.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+FAKE_LLM_DELAY_MS = float(os.getenv("FAKE_LLM_DELAY_MS", "20"))
+
+# Point at a local stub server to test without Google.
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+# (API key, model) pairs kept; LLM objects are cheap, the cap just stops the
+# map from growing with every key ever seen.
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+
+http_clients.register(
+    "gemini",
+    GEMINI_BASE_URL,
+    RetryPolicy.from_env("LLM", deadline=60),
+    key_header="x-goog-api-key",
+)
+
+
+def _response_text(payload: Dict) -> str:
+    candidates = payload.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+class GeminiLLM:
+    """Gemini over its REST API on a pooled client for this key.
+
+    Replaces the SDK, whose ``genai.configure`` swapped a process-wide key
+    (racing between stacks) and whose calls blocked a thread each.
+    """
+
+    def __init__(self, api_key: str, model: str):
+        self.api_key = api_key
+        self.model_name = model
+
+    def _body(self, prompt: str) -> Dict:
+        return {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+
+    async def generate(self, prompt: str) -> str:
+        response = await http_clients.request(
+            "gemini", self.api_key, "POST",
+            f"/v1beta/models/{self.model_name}:generateContent", json=self._body(prompt),
+        )
+        return _response_text(response.json())
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        async with http_clients.stream(
+            "gemini", self.api_key, "POST",
+            f"/v1beta/models/{self.model_name}:streamGenerateContent",
+            params={"alt": "sse"}, json=self._body(prompt),
+        ) as response:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                text = _response_text(json.loads(line[len("data:"):]))
+                if text:
+                    yield text
+
+
+class FakeLLM:
+    def __init__(self, api_key: str = "", model: str = "fake"):
+        self.model_name = model
+        self.delay = FAKE_LLM_DELAY_MS / 1000
+
+    def _answer(self, prompt: str) -> str:
+        query = prompt.rsplit("User Query:", 1)[-1].replace("Answer:", "").strip()
+        return f"This is a fake answer to: {query}"
+
+    async def generate(self, prompt: str) -> str:
+        await asyncio.sleep(self.delay)
+        return self._answer(prompt)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        for word in self._answer(prompt).split(" "):
+            await asyncio.sleep(self.delay)
+            yield word + " "
+
+
+_llms: "OrderedDict[Tuple[str, str], object]" = OrderedDict()
+_llms_lock = threading.Lock()
+
+
+def get_llm(api_key: str, model: str = DEFAULT_LLM_MODEL):
+    with _llms_lock:
+        llm = _llms.get((api_key, model))
+        if llm is None:
+            llm = FakeLLM(api_key, model) if LLM_BACKEND == "fake" else GeminiLLM(api_key, model)
+            _llms[(api_key, model)] = llm
+            while len(_llms) > LLM_CACHE_SIZE:
+                _llms.popitem(last=False)
+        else:
+            _llms.move_to_end((api_key, model))
+        return llm
+
+
+async def generate(llm, prompt: str) -> str:
+    with stage("llm_call", model=llm.model_name):
+        return await llm.generate(prompt)
+
+
+async def stream(llm, prompt: str) -> AsyncIterator[str]:
+    """Yield text deltas from ``llm.stream``.
+
+    Deltas are only read from the upstream when the consumer asks for the
+    next one, so a slow client applies backpressure all the way to the model
+    stream, and closing this generator closes the upstream response.
+    """
+    async with aclosing(llm.stream(prompt)) as deltas:
+        with stage("llm_call", model=llm.model_name):
+            async for delta in deltas:
+                yield delta
@@ -0,0 +1,165 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "ai_planet"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stages recorded by ``stage()``; listed so /metrics exposes them from the start.
+STAGES = (
+    "db_fetch", "pdf_parse", "chunk", "embed", "vector_upsert", "vector_query",
+    "lexical_upsert", "lexical_query", "web_search", "prompt_build", "llm_call",
+)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            # counts per bucket, then +Inf count, then sum
+            series = self._series.setdefault(labels, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def touch(self, *labels: str):
+        with self._lock:
+            self._series.setdefault(labels, [0.0] * (len(self.buckets) + 2))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for labels, series in items:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {int(count)}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {int(series[-2])}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {int(series[-2])}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram(
+    f"{METRIC_PREFIX}_stage_duration_seconds", "Time spent per pipeline stage", ("stage",)
+)
+request_seconds = Histogram(
+    f"{METRIC_PREFIX}_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+prompt_tokens = Histogram(
+    f"{METRIC_PREFIX}_prompt_tokens", "Estimated prompt tokens per LLM call", ("model",),
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768),
+)
+
+# Spans recorded during the current request, rendered as a Server-Timing header.
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+_tracer = None
+
+
+def setup_tracing():
+    """Export spans over OTLP when OTEL_EXPORTER_OTLP_ENDPOINT is set."""
+    global _tracer
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if not endpoint or _tracer is not None:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    except ImportError as e:
+        logger.warning(f"⚠️ Tracing requested but OpenTelemetry is unavailable: {e}")
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "ai-planet-rest")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, insecure=True)))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer(__name__)
+    logger.info(f"📡 Exporting traces to {endpoint}")
+
+
+@contextmanager
+def stage(name: str, **attributes: Any) -> Iterator[None]:
+    """Time a pipeline stage into the stage histogram, the current request's
+    Server-Timing header and (when enabled) an OpenTelemetry span."""
+    span_cm = _tracer.start_as_current_span(name, attributes=attributes) if _tracer else None
+    if span_cm is not None:
+        span_cm.__enter__()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, name)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+        if span_cm is not None:
+            span_cm.__exit__(None, None, None)
+
+
+def begin_request() -> contextvars.Token:
+    return _request_spans.set([])
+
+
+def end_request(token: contextvars.Token) -> str:
+    """Reset the request context and return its Server-Timing header value."""
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    totals: Dict[str, List[float]] = {}
+    for name, elapsed in spans:
+        total = totals.setdefault(name, [0.0, 0])
+        total[0] += elapsed
+        total[1] += 1
+    return ", ".join(
+        f'{name};dur={total * 1000:.1f};desc="{count}x"' for name, (total, count) in totals.items()
+    )
+
+
+def _gauges(prefix: str, value: Any) -> List[str]:
+    if isinstance(value, bool):
+        return [f"{prefix} {int(value)}"]
+    if isinstance(value, (int, float)):
+        return [f"{prefix} {value}"]
+    if isinstance(value, dict):
+        lines = []
+        for key, child in value.items():
+            lines.extend(_gauges(f"{prefix}_{_metric_name(key)}", child))
+        return lines
+    return []
+
+
+def _metric_name(key: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in str(key)).strip("_").lower()
+
+
+def render_metrics(component_stats: Dict[str, Any]) -> str:
+    for name in STAGES:
+        stage_seconds.touch(name)
+    lines = stage_seconds.render() + request_seconds.render() + prompt_tokens.render()
+    for component, stats in component_stats.items():
+        lines.extend(_gauges(f"{METRIC_PREFIX}_{_metric_name(component)}", stats))
+    return "\n".join(lines) + "\n"
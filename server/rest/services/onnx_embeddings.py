@@ -0,0 +1,141 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+from typing import List, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ONNX_CACHE_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(os.getenv("INDEX_DIR", "kb_index"), "onnx"))
+# 0 leaves the choice to onnxruntime (one thread per physical core).
+ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+POOLING_FILE = "pooling.json"
+
+
+def _model_dir(name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, "".join(c if c.isalnum() or c in "-_." else "_" for c in name))
+
+
+def export_model(name: str, target: str):
+    """Export a SentenceTransformer's transformer to ONNX alongside its
+    tokenizer and pooling settings. Pooling and normalisation run in NumPy."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(name, device="cpu")
+    transformer = st_model[0]
+    pooling = next((m for m in st_model if type(m).__name__ == "Pooling"), None)
+    normalize = any(type(m).__name__ == "Normalize" for m in st_model)
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    sample = tokenizer(["export"], return_tensors="pt")
+    input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+    dynamic_axes = {k: {0: "batch", 1: "sequence"} for k in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(target))
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                auto_model,
+                tuple(sample[k] for k in input_names),
+                os.path.join(tmp, FP32_FILE),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                dynamo=False,
+            )
+        tokenizer.save_pretrained(tmp)
+        with open(os.path.join(tmp, POOLING_FILE), "w") as f:
+            json.dump({
+                "mode": "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean",
+                "normalize": normalize,
+                "max_seq_length": st_model.max_seq_length,
+                "input_names": input_names,
+            }, f)
+        # Another worker may have finished the same export first.
+        if os.path.exists(target):
+            shutil.rmtree(tmp)
+        else:
+            os.replace(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def quantize_model(model_dir: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp = os.path.join(model_dir, f"{INT8_FILE}.tmp")
+    quantize_dynamic(os.path.join(model_dir, FP32_FILE), tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, os.path.join(model_dir, INT8_FILE))
+
+
+class OnnxEmbeddingModel:
+    """ONNX Runtime stand-in for ``SentenceTransformer.encode`` on CPU.
+
+    The first load of a model exports it (and quantizes it for int8) into
+    ``EMBEDDING_ONNX_DIR``; later loads just open the cached files.
+    """
+
+    def __init__(self, name: str, quantized: bool = False, threads: int = ONNX_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = _model_dir(name)
+        if not os.path.exists(os.path.join(model_dir, FP32_FILE)):
+            logger.info(f"📦 Exporting {name} to ONNX")
+            export_model(name, model_dir)
+        model_file = FP32_FILE
+        if quantized:
+            if not os.path.exists(os.path.join(model_dir, INT8_FILE)):
+                logger.info(f"📦 Quantizing {name} to int8")
+                quantize_model(model_dir)
+            model_file = INT8_FILE
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.model_path = os.path.join(model_dir, model_file)
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        with open(os.path.join(model_dir, POOLING_FILE)) as f:
+            self.pooling = json.load(f)
+
+    def size_bytes(self) -> int:
+        return os.path.getsize(self.model_path)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.pooling["max_seq_length"],
+                return_tensors="np",
+            )
+            feeds = {k: batch[k].astype(np.int64) for k in self.pooling["input_names"]}
+            hidden = self.session.run(None, feeds)[0]
+            if self.pooling["mode"] == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = feeds["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.pooling["normalize"]:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            outputs.append(pooled.astype(np.float32))
+        embeddings = np.concatenate(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
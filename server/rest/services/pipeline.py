@@ -0,0 +1,204 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.context import (
+    CONTEXT_CANDIDATES, HYBRID_DENSE_WEIGHT, HYBRID_LEXICAL_WEIGHT, fuse_rankings, select_mmr,
+)
+from services.embedding_batcher import embedding_batcher
+from services.embeddings import embedding_registry
+from services.executor import run_embed, run_io
+from services.http_clients import RetryPolicy, http_clients
+from services.lexical_index import lexical_index
+from services.metrics import stage
+from services.vector_store import Hits, vector_store
+from services.search_cache import search_cache
+
+logger = logging.getLogger(__name__)
+
+KB_RESULTS = 3
+WEB_RESULTS = 3
+
+# "serpapi" queries Google through SerpAPI; "fake" returns canned results.
+WEB_SEARCH_BACKEND = os.getenv("WEB_SEARCH_BACKEND", "serpapi")
+FAKE_SEARCH_DELAY_MS = float(os.getenv("FAKE_SEARCH_DELAY_MS", "300"))
+SERPAPI_BASE_URL = os.getenv("SERPAPI_BASE_URL", "https://serpapi.com")
+# The parts of a search result that search_web reads; only these are cached.
+SEARCH_RESULT_FIELDS = ("title", "link", "snippet")
+
+http_clients.register("serpapi", SERPAPI_BASE_URL, RetryPolicy.from_env("SEARCH", deadline=10), key_param="api_key")
+
+
+async def embed_query(embedding_model_name: str, query: str):
+    with stage("embed"):
+        return await embedding_batcher.encode(embedding_model_name, query)
+
+
+async def embed_queries(embedding_model_name: str, queries: List[str]):
+    # For batch requests: one encode call for all queries, bypassing the
+    # micro-batcher (which is tuned for single concurrent queries).
+    model = await run_io(embedding_registry.get, embedding_model_name)
+    with stage("embed"):
+        return await run_embed(model.encode, queries)
+
+
+def _select(
+    stack_id: str, query: str, query_embedding, dense: Hits, n_results: int, dense_weight: float, lexical_weight: float
+) -> List[str]:
+    ids, texts, vectors = dense
+    if lexical_weight <= 0 or not query:
+        return select_mmr(query_embedding, texts, vectors, n_results)
+
+    n_candidates = n_results * CONTEXT_CANDIDATES
+    with stage("lexical_query"):
+        lexical = lexical_index.query(stack_id, query, n_candidates)
+    fused = fuse_rankings([(ids, dense_weight), (lexical, lexical_weight)])[:n_candidates]
+    if not fused:
+        return []
+    # Chunks only BM25 found still need their vectors for MMR.
+    dense_ids = set(ids)
+    missing = [i for i, _ in fused if i not in dense_ids]
+    if missing:
+        # BM25 can still list chunks the vector store just dropped; those
+        # come back without a row and are left out below.
+        extra_ids, extra_texts, extra_vectors = vector_store.fetch(stack_id, missing)
+        if extra_ids:
+            vectors = np.concatenate([vectors, extra_vectors]) if ids else extra_vectors
+            ids, texts = ids + extra_ids, texts + extra_texts
+    rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+    picked = [(rows[i], score) for i, score in fused if i in rows]
+    if not picked:
+        return []
+    relevance = np.array([score for _, score in picked], dtype=np.float32)
+    return select_mmr(
+        query_embedding,
+        [texts[row] for row, _ in picked],
+        vectors[[row for row, _ in picked]],
+        n_results,
+        relevance=relevance / relevance.max(),
+    )
+
+
+def _retrieve(stack_id, query, query_embedding, n_results, dense_weight, lexical_weight) -> List[str]:
+    dense = vector_store.query_vectors(stack_id, query_embedding, n_results * CONTEXT_CANDIDATES)
+    return _select(stack_id, query, query_embedding, dense, n_results, dense_weight, lexical_weight)
+
+
+def _retrieve_many(stack_id, queries, query_embeddings, n_results, dense_weight, lexical_weight) -> List[List[str]]:
+    found = vector_store.query_vectors_many(stack_id, query_embeddings, n_results * CONTEXT_CANDIDATES)
+    return [
+        _select(stack_id, query, embedding, dense, n_results, dense_weight, lexical_weight)
+        for query, embedding, dense in zip(queries, query_embeddings, found)
+    ]
+
+
+async def query_knowledge_base(
+    stack_id: str,
+    query_embedding,
+    n_results: int = KB_RESULTS,
+    query: str = "",
+    dense_weight: float = HYBRID_DENSE_WEIGHT,
+    lexical_weight: float = HYBRID_LEXICAL_WEIGHT,
+) -> List[str]:
+    """Top ``n_results`` chunks, chosen by MMR from a larger candidate set so
+    near-duplicate chunks don't crowd out the rest. With a ``query`` text,
+    candidates are the vector hits fused with BM25 hits by reciprocal rank."""
+    with stage("vector_query"):
+        return await run_io(_retrieve, stack_id, query, query_embedding, n_results, dense_weight, lexical_weight)
+
+
+async def query_knowledge_base_many(
+    stack_id: str,
+    query_embeddings,
+    n_results: int = KB_RESULTS,
+    queries: Sequence[str] = (),
+    dense_weight: float = HYBRID_DENSE_WEIGHT,
+    lexical_weight: float = HYBRID_LEXICAL_WEIGHT,
+) -> List[List[str]]:
+    queries = list(queries) or [""] * len(query_embeddings)
+    with stage("vector_query"):
+        return await run_io(
+            _retrieve_many, stack_id, queries, query_embeddings, n_results, dense_weight, lexical_weight
+        )
+
+
+class FakeSearch:
+    """Offline stand-in for SerpAPI used by benchmarks."""
+
+    def __init__(self, params: Dict[str, Any]):
+        self.params = params
+
+    async def get_dict(self) -> Dict[str, Any]:
+        await asyncio.sleep(FAKE_SEARCH_DELAY_MS / 1000)
+        query = self.params.get("q", "")
+        return {"organic_results": [
+            {"title": f"Result {i} for {query}", "link": f"https://example.com/{i}", "snippet": f"Snippet {i} about {query}."}
+            for i in range(WEB_RESULTS)
+        ]}
+
+
+async def fetch_search(params: Dict[str, Any]) -> Dict[str, Any]:
+    if WEB_SEARCH_BACKEND == "fake":
+        return await FakeSearch(params).get_dict()
+    query = {k: v for k, v in params.items() if k != "api_key"}
+    response = await http_clients.request("serpapi", params["api_key"], "GET", "/search.json", params=query)
+    return response.json()
+
+
+async def fetch_search_results(params: Dict[str, Any]) -> Dict[str, Any]:
+    """``fetch_search`` trimmed to what ``search_web`` uses. SerpAPI reports
+    some failures (bad key, quota) in a 200 body; those raise instead of
+    being cached, since cache entries are shared across API keys."""
+    results = await fetch_search(params)
+    if "error" in results or "organic_results" not in results:
+        raise RuntimeError(f"SerpAPI returned no results: {results.get('error', 'missing organic_results')}")
+    return {"organic_results": [
+        {field: item.get(field, "") for field in SEARCH_RESULT_FIELDS}
+        for item in results["organic_results"][:WEB_RESULTS]
+    ]}
+
+
+async def search_web(serpapi_key: str, query: str) -> str:
+    params = {"engine": "google", "q": query, "api_key": serpapi_key}
+    with stage("web_search"):
+        results = await search_cache.get_or_fetch(params, lambda: fetch_search_results(params))
+    snippets = []
+    for item in results.get("organic_results", [])[:WEB_RESULTS]:
+        title = item.get("title", "")
+        link = item.get("link", "")
+        snippet = item.get("snippet", "")
+        snippets.append(f"{title} ({link}): {snippet}")
+    logger.debug(f"Retrieved {len(snippets)} web snippets")
+    return "\n".join(snippets)
+
+
+def build_prompt(
+    retrieved_docs: List[str],
+    web_context: str,
+    output_text: Optional[str],
+    user_query: str,
+    extra_context: Sequence[str] = (),
+) -> str:
+    with stage("prompt_build"):
+        kb_context = "\n".join(retrieved_docs) if retrieved_docs else ""
+        combined_context = "\n\n".join([c for c in [kb_context, web_context, *extra_context] if c.strip()])
+
+        output_data_str = f"\n\nOutput: {output_text}" if output_text else ""
+
+        logger.debug(f"Building prompt (context length={len(combined_context)})")
+        return f"Context:\n{combined_context}{output_data_str}\n\nUser Query: {user_query}\nAnswer:"
+
+
+def context_used(retrieved_docs: List[str], web_context: str) -> Dict[str, List[str]]:
+    return {
+        "knowledge_base": retrieved_docs,
+        "web_search": web_context.split("\n") if web_context else [],
+    }
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
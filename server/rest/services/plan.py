@@ -0,0 +1,388 @@
+import os
+import json
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy.future import select
+
+from models.document import Document
+from models.workflow import Workflow
+from services.embeddings import DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKENDS, model_key
+from services.context import CONTEXT_TOKEN_BUDGET, HYBRID_DENSE_WEIGHT, HYBRID_LEXICAL_WEIGHT, context_budget
+from services.llm import DEFAULT_LLM_MODEL
+from services.metrics import stage
+from utils.documents import UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+# Plans are invalidated locally on writes; the TTL bounds how long another
+# worker process can keep serving a plan for a workflow it did not update.
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "30"))
+DEFAULT_TOP_K = 3
+DEFAULT_SEMANTIC_THRESHOLD = 0.95
+
+
+class PlanError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class KnowledgeBaseConfig:
+    node_id: str
+    # model_key(): the model name, suffixed with the backend unless torch.
+    embedding_model: str
+    top_k: int
+    # Reciprocal rank fusion weights of vector and BM25 hits.
+    dense_weight: float = HYBRID_DENSE_WEIGHT
+    lexical_weight: float = HYBRID_LEXICAL_WEIGHT
+
+
+@dataclass(frozen=True)
+class WebSearchConfig:
+    node_id: str
+    api_key: Optional[str]
+
+
+@dataclass(frozen=True)
+class LLMConfig:
+    node_id: str
+    api_key: Optional[str]
+    model: str
+    serpapi_key: Optional[str]
+    web_search: bool
+    semantic_cache: bool = False
+    semantic_cache_threshold: float = DEFAULT_SEMANTIC_THRESHOLD
+    # Token budget for retrieved context in this node's prompt.
+    context_tokens: int = CONTEXT_TOKEN_BUDGET
+
+
+@dataclass(frozen=True)
+class InputConfig:
+    node_id: str
+    query: Optional[str]
+
+
+@dataclass(frozen=True)
+class OutputConfig:
+    node_id: str
+    output_text: Optional[str]
+
+
+NodeConfig = Union[KnowledgeBaseConfig, WebSearchConfig, LLMConfig, InputConfig, OutputConfig]
+
+NODE_TYPES = {
+    KnowledgeBaseConfig: "knowledge-base",
+    WebSearchConfig: "web-search",
+    LLMConfig: "llm",
+    InputConfig: "user-input",
+    OutputConfig: "output",
+}
+
+
+@dataclass(frozen=True)
+class PlanNode:
+    id: str
+    type: str
+    config: NodeConfig
+    depends_on: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    stack_id: str
+    workflow_id: str
+    version: int
+    # Topologically ordered; every node comes after the nodes it depends on.
+    nodes: Tuple[PlanNode, ...]
+    documents: Tuple[Tuple[Tuple[str, Any], ...], ...]
+
+    @property
+    def node_types(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(n.type for n in self.nodes))
+
+    def configs(self, node_type: str) -> List[NodeConfig]:
+        return [n.config for n in self.nodes if n.type == node_type]
+
+    def _first(self, node_type: str):
+        configs = self.configs(node_type)
+        return configs[0] if configs else None
+
+    @property
+    def knowledge_base(self) -> Optional[KnowledgeBaseConfig]:
+        return self._first("knowledge-base")
+
+    @property
+    def llm(self) -> Optional[LLMConfig]:
+        return self._first("llm")
+
+    @property
+    def has_output(self) -> bool:
+        return self._first("output") is not None
+
+    @property
+    def output_text(self) -> Optional[str]:
+        output = self._first("output")
+        return output.output_text if output else None
+
+    @property
+    def user_query(self) -> Optional[str]:
+        user_input = self._first("user-input")
+        return user_input.query if user_input else None
+
+    def document_list(self):
+        return [dict(d) for d in self.documents]
+
+
+def _node_data(node: Dict[str, Any]) -> Dict[str, Any]:
+    data = node.get("data", {}).get("nodeData") or {}
+    if not isinstance(data, dict):
+        raise PlanError(f"Node {node.get('id')} has invalid nodeData")
+    return data
+
+
+def _as_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def _as_positive_int(value: Any, default: int, field: str) -> int:
+    if value in (None, ""):
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise PlanError(f"{field} must be an integer")
+    if number < 1:
+        raise PlanError(f"{field} must be positive")
+    return number
+
+
+def _as_fraction(value: Any, default: float, field: str) -> float:
+    if value in (None, ""):
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise PlanError(f"{field} must be a number")
+    if not 0.0 < number <= 1.0:
+        raise PlanError(f"{field} must be in (0, 1]")
+    return number
+
+
+def _as_weight(value: Any, default: float, field: str) -> float:
+    if value in (None, ""):
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise PlanError(f"{field} must be a number")
+    if number < 0:
+        raise PlanError(f"{field} must not be negative")
+    return number
+
+
+def _workflow_data(workflow: Workflow) -> Dict[str, Any]:
+    raw_data = workflow.data or {}
+    if isinstance(raw_data, str):
+        try:
+            raw_data = json.loads(raw_data)
+        except Exception as e:
+            logger.error(f"❌ Failed to parse workflow.data JSON: {e}")
+            raw_data = {}
+    return raw_data
+
+
+def legacy_documents(raw_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Documents as stored in workflow.data before the documents table.
+    documents = list(raw_data.get("documents", []))
+    if not documents:
+        for key, value in raw_data.items():
+            if key.startswith("knowledge-base") and isinstance(value, dict):
+                documents.append({
+                    "id": value.get("documentId"),
+                    "file_name": value.get("fileName"),
+                    "path": os.path.join(UPLOAD_DIR, f"{value.get('documentId')}_{value.get('fileName')}")
+                })
+    return documents
+
+
+# Stages used to wire up workflows saved without any edges; nodes in the same
+# stage are independent of each other.
+IMPLICIT_STAGES = {"user-input": 0, "knowledge-base": 1, "web-search": 1, "llm": 2, "output": 3}
+
+
+def _compile_node(node_id: str, node_type: str, data: Dict[str, Any]) -> Optional[NodeConfig]:
+    if node_type == "knowledge-base":
+        backend = data.get("embeddingBackend") or None
+        if backend is not None and backend not in EMBEDDING_BACKENDS:
+            raise PlanError(f"embeddingBackend must be one of {', '.join(EMBEDDING_BACKENDS)}")
+        return KnowledgeBaseConfig(
+            node_id=node_id,
+            embedding_model=model_key(data.get("embeddingModel") or DEFAULT_EMBEDDING_MODEL, backend),
+            top_k=_as_positive_int(data.get("topK"), DEFAULT_TOP_K, "topK"),
+            dense_weight=_as_weight(data.get("denseWeight"), HYBRID_DENSE_WEIGHT, "denseWeight"),
+            lexical_weight=_as_weight(data.get("lexicalWeight"), HYBRID_LEXICAL_WEIGHT, "lexicalWeight"),
+        )
+    if node_type == "web-search":
+        return WebSearchConfig(node_id=node_id, api_key=data.get("serpApi") or data.get("apiKey") or None)
+    if node_type == "llm":
+        return LLMConfig(
+            node_id=node_id,
+            api_key=data.get("apiKey") or None,
+            model=data.get("model") or DEFAULT_LLM_MODEL,
+            serpapi_key=data.get("serpApi") or None,
+            web_search=_as_bool(data.get("webSearch", False)),
+            semantic_cache=_as_bool(data.get("semanticCache", False)),
+            semantic_cache_threshold=_as_fraction(
+                data.get("semanticCacheThreshold"), DEFAULT_SEMANTIC_THRESHOLD, "semanticCacheThreshold"
+            ),
+            context_tokens=_as_positive_int(
+                data.get("contextTokens"), context_budget(data.get("model") or DEFAULT_LLM_MODEL), "contextTokens"
+            ),
+        )
+    if node_type == "user-input":
+        return InputConfig(node_id=node_id, query=data.get("query") or None)
+    if node_type == "output":
+        return OutputConfig(node_id=node_id, output_text=data.get("outputText") or None)
+    return None
+
+
+def _topological_order(deps: Dict[str, List[str]], order: List[str]) -> List[str]:
+    # Kahn's algorithm, keeping the original node order among ready nodes.
+    remaining = {n: len(d) for n, d in deps.items()}
+    dependents: Dict[str, List[str]] = {n: [] for n in deps}
+    for node_id, node_deps in deps.items():
+        for dep in node_deps:
+            dependents[dep].append(node_id)
+    position = {n: i for i, n in enumerate(order)}
+    ready = sorted((n for n, c in remaining.items() if c == 0), key=position.get)
+    result = []
+    while ready:
+        node_id = ready.pop(0)
+        result.append(node_id)
+        for dependent in dependents[node_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+                ready.sort(key=position.get)
+    if len(result) != len(deps):
+        raise PlanError("Workflow graph contains a cycle")
+    return result
+
+
+def compile_plan(workflow: Workflow, documents: Optional[List[Dict[str, Any]]] = None) -> ExecutionPlan:
+    configs: Dict[str, NodeConfig] = {}
+    order: List[str] = []
+    for i, node in enumerate(workflow.nodes or []):
+        node_id = node.get("id") or f"node-{i}"
+        config = _compile_node(node_id, node["data"]["type"], _node_data(node))
+        if config is None or node_id in configs:
+            continue
+        configs[node_id] = config
+        order.append(node_id)
+
+    node_type = {node_id: NODE_TYPES[type(c)] for node_id, c in configs.items()}
+    deps: Dict[str, List[str]] = {node_id: [] for node_id in order}
+    edges = workflow.edges or []
+    if edges:
+        for edge in edges:
+            source, target = edge.get("source"), edge.get("target")
+            if source in deps and target in deps and source != target and source not in deps[target]:
+                deps[target].append(source)
+    else:
+        stage_of = {node_id: IMPLICIT_STAGES[node_type[node_id]] for node_id in order}
+        for node_id in order:
+            upstream = [n for n in order if stage_of[n] < stage_of[node_id]]
+            # Depend only on the nearest populated stage before this one.
+            if upstream:
+                nearest = max(stage_of[n] for n in upstream)
+                deps[node_id] = [n for n in upstream if stage_of[n] == nearest]
+
+    # Web search configured on an LLM node becomes its own node, so it can run
+    # alongside knowledge-base retrieval instead of after it.
+    for node_id in list(order):
+        config = configs[node_id]
+        if isinstance(config, LLMConfig) and config.web_search and config.serpapi_key:
+            search_id = f"{node_id}:web-search"
+            configs[search_id] = WebSearchConfig(node_id=search_id, api_key=config.serpapi_key)
+            node_type[search_id] = "web-search"
+            deps[search_id] = []
+            deps[node_id].append(search_id)
+            order.insert(order.index(node_id), search_id)
+
+    nodes = tuple(
+        PlanNode(id=node_id, type=node_type[node_id], config=configs[node_id], depends_on=tuple(deps[node_id]))
+        for node_id in _topological_order(deps, order)
+    )
+
+    return ExecutionPlan(
+        stack_id=workflow.stack_id,
+        workflow_id=workflow.id,
+        version=workflow.version or 1,
+        nodes=nodes,
+        documents=tuple(
+            tuple(sorted(d.items()))
+            for d in (documents if documents is not None else legacy_documents(_workflow_data(workflow)))
+        ),
+    )
+
+
+class PlanCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._plans: Dict[str, Tuple[ExecutionPlan, float]] = {}
+        self._min_versions: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stack_id: str) -> Optional[ExecutionPlan]:
+        entry = self._plans.get(stack_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def put(self, plan: ExecutionPlan):
+        # A reader that loaded the row before a concurrent update must not
+        # re-cache the version that update just invalidated.
+        if plan.version < self._min_versions.get(plan.stack_id, 0):
+            return
+        self._plans[plan.stack_id] = (plan, time.monotonic())
+
+    def invalidate(self, stack_id: str, version: Optional[int] = None):
+        self._plans.pop(stack_id, None)
+        if version is not None:
+            self._min_versions[stack_id] = version
+
+    def stats(self) -> Dict[str, Any]:
+        return {"plans": len(self._plans), "hits": self.hits, "misses": self.misses}
+
+
+plan_cache = PlanCache(ttl=PLAN_CACHE_TTL)
+
+
+async def load_documents(stack_id: str, db) -> List[Dict[str, Any]]:
+    """The stack's documents straight from the table, never from the cache."""
+    result = await db.execute(
+        select(Document).where(Document.stack_id == stack_id).order_by(Document.created_at, Document.id)
+    )
+    return [d.as_source() for d in result.scalars().all()]
+
+
+async def get_plan(stack_id: str, db) -> Optional[ExecutionPlan]:
+    plan = plan_cache.get(stack_id)
+    if plan is not None:
+        return plan
+    with stage("db_fetch"):
+        result = await db.execute(select(Workflow).where(Workflow.stack_id == stack_id))
+        workflow = result.scalar_one_or_none()
+        if workflow is None:
+            return None
+        documents = await load_documents(stack_id, db)
+    plan = compile_plan(workflow, documents)
+    plan_cache.put(plan)
+    return plan
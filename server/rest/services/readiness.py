@@ -0,0 +1,81 @@
+import os
+import time
+import asyncio
+import logging
+import importlib
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Heavy modules imported in the background after startup when
+# WARMUP_IMPORTS=true, so the first request that needs them doesn't pay.
+HEAVY_MODULES = ("fitz", "sentence_transformers")
+
+
+def warmup_imports_enabled() -> bool:
+    return os.getenv("WARMUP_IMPORTS", "false").lower() == "true"
+
+
+def preload_modules(names=HEAVY_MODULES):
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"⚠️ Could not preload {name}: {e}")
+
+
+class Readiness:
+    """Tracks startup and optional background warm-ups for /system/ready.
+
+    The process is live as soon as the lifespan startup finishes; it is ready
+    once every warm-up registered with ``spawn`` has finished (failed
+    warm-ups are reported but don't hold readiness back).
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.startup_seconds: Optional[float] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._durations: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+
+    def mark_started(self):
+        self.startup_seconds = time.monotonic() - self.started_at
+
+    def spawn(self, name: str, fn: Callable, *args: Any):
+        async def run():
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(fn, *args)
+            except Exception as e:
+                self._errors[name] = str(e)
+                logger.error(f"❌ Warm-up {name} failed: {e}")
+            self._durations[name] = time.perf_counter() - started
+            logger.info(f"🔥 Warm-up {name} done in {self._durations[name]:.2f}s")
+
+        self._tasks[name] = asyncio.create_task(run())
+
+    def pending(self) -> List[str]:
+        return [name for name, task in self._tasks.items() if not task.done()]
+
+    @property
+    def ready(self) -> bool:
+        return self.startup_seconds is not None and not self.pending()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "startup_seconds": round(self.startup_seconds, 3) if self.startup_seconds is not None else None,
+            "pending": self.pending(),
+            "warmups": {name: round(seconds, 3) for name, seconds in self._durations.items()},
+            "errors": dict(self._errors),
+        }
+
+    async def stop(self):
+        # Threads can't be interrupted; just stop waiting on them.
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+readiness = Readiness()
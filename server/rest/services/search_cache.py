@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from services.executor import run_io
+
+logger = logging.getLogger(__name__)
+
+# Parameters that select the result set; credentials are deliberately left
+# out so every key for the same query shares one entry.
+KEY_PARAMS = ("engine", "q", "gl", "hl", "location", "num", "safe", "start")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    normalized = {k: params[k] for k in KEY_PARAMS if params.get(k) not in (None, "")}
+    if "q" in normalized:
+        normalized["q"] = normalize_query(str(normalized["q"]))
+    raw = json.dumps(normalized, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """TTL + LRU cache for web-search results with single-flight lookups.
+
+    Concurrent misses for the same key share one upstream call. With a
+    ``path`` the entries are also written to a JSON file (at most every
+    ``flush_interval`` seconds, from the IO pool) and reloaded on startup.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, path: Optional[str] = None, flush_interval: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.flush_interval = flush_interval
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Future] = None
+        self._last_flush = 0.0
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetch_seconds_total = 0.0
+        self.saved_seconds_total = 0.0
+        self._load()
+
+    def _avg_fetch_seconds(self) -> float:
+        return self.fetch_seconds_total / self.misses if self.misses else 0.0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                self._dirty = True
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    async def get_or_fetch(self, params: Dict[str, Any], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        key = cache_key(params)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            self.saved_seconds_total += self._avg_fetch_seconds()
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            # Its own task, like admission.SingleFlight: a caller that is
+            # cancelled (client gone) must not cancel the fetch for the rest.
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(key, fetch))
+            task.add_done_callback(lambda t: self._fetched(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        try:
+            value = await fetch()
+        finally:
+            self.fetch_seconds_total += time.perf_counter() - started
+        self.put(key, value)
+        self._schedule_flush()
+        return value
+
+    def _fetched(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # every waiter may be gone; don't warn about it
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                raw = json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable search cache {self.path}: {e}")
+            return
+        now = time.time()
+        for key, stored_at, value in raw:
+            if now - stored_at <= self.ttl:
+                self._entries[key] = (stored_at, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logger.info(f"🗄️ Loaded {len(self._entries)} cached web searches")
+
+    def _flush_due(self) -> bool:
+        return bool(self.path) and self._dirty and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _schedule_flush(self):
+        # Serialising the whole cache can take a while; keep it off the event loop.
+        if self._flush_task is None and self._flush_due():
+            self._flush_task = asyncio.ensure_future(run_io(self._maybe_flush))
+            self._flush_task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Future):
+        self._flush_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"⚠️ Failed to write search cache {self.path}: {task.exception()}")
+
+    def _maybe_flush(self, force: bool = False):
+        with self._write_lock:
+            if not self.path or not self._dirty:
+                return
+            if not force and time.monotonic() - self._last_flush < self.flush_interval:
+                return
+            with self._lock:
+                snapshot = [[k, stored_at, v] for k, (stored_at, v) in self._entries.items()]
+                self._dirty = False
+                self._last_flush = time.monotonic()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self.path)
+
+    def flush(self):
+        self._maybe_flush(force=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds_total": round(self.saved_seconds_total, 3),
+        }
+
+
+search_cache = SearchCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2048")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+    path=os.getenv("SEARCH_CACHE_PATH") or None,
+)
@@ -0,0 +1,115 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.95
+
+
+def context_fingerprint(docs: List[str], web_context: str, extra: List[str], output_text: Optional[str]) -> str:
+    h = hashlib.sha256()
+    for part in [*docs, "\x00", web_context, "\x00", *extra, "\x00", output_text or ""]:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    embedding: np.ndarray
+    answer: str
+    fingerprint: str
+    version: int
+    stored_at: float
+
+
+class SemanticCache:
+    """Per-stack cache of LLM answers looked up by query-embedding similarity.
+
+    A hit needs cosine similarity above the node's threshold *and* the same
+    retrieved-context fingerprint and workflow version, so a reworded
+    question only reuses an answer that was produced from identical context.
+    """
+
+    def __init__(self, max_entries_per_stack: int, ttl: float):
+        self.max_entries = max_entries_per_stack
+        self.ttl = ttl
+        self._stacks: Dict[str, "OrderedDict[int, CachedAnswer]"] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.llm_seconds_total = 0.0
+        self.saved_seconds_total = 0.0
+
+    def lookup(
+        self, stack_id: str, embedding: np.ndarray, fingerprint: str, version: int, threshold: float
+    ) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entries = self._stacks.get(stack_id)
+            candidates = []
+            if entries:
+                for entry_id, entry in list(entries.items()):
+                    if now - entry.stored_at > self.ttl:
+                        del entries[entry_id]
+                    elif entry.fingerprint == fingerprint and entry.version == version:
+                        candidates.append((entry_id, entry))
+            if candidates:
+                matrix = np.vstack([entry.embedding for _, entry in candidates])
+                scores = matrix @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= threshold:
+                    entry_id, entry = candidates[best]
+                    entries.move_to_end(entry_id)
+                    self.hits += 1
+                    if self.misses:
+                        self.saved_seconds_total += self.llm_seconds_total / self.misses
+                    return entry.answer
+            self.misses += 1
+            return None
+
+    def store(
+        self, stack_id: str, embedding: np.ndarray, fingerprint: str, version: int, answer: str,
+        llm_seconds: float = 0.0,
+    ):
+        with self._lock:
+            self.llm_seconds_total += llm_seconds
+            entries = self._stacks.setdefault(stack_id, OrderedDict())
+            self._next_id += 1
+            entries[self._next_id] = CachedAnswer(embedding, answer, fingerprint, version, time.time())
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, stack_id: str):
+        with self._lock:
+            if self._stacks.pop(stack_id, None):
+                self.invalidations += 1
+                logger.info(f"♻️ Cleared semantic answer cache for {stack_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "stacks": len(self._stacks),
+            "entries": sum(len(e) for e in self._stacks.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds_total": round(self.saved_seconds_total, 3),
+        }
+
+
+semantic_cache = SemanticCache(
+    max_entries_per_stack=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")),
+)
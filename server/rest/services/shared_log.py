@@ -0,0 +1,137 @@
+import os
+import json
+import uuid
+import shutil
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single worker only
+    fcntl = None
+
+
+class SharedLog:
+    """Append-only JSON-lines log plus ``meta.json`` in one directory, shared
+    by every worker process on the host.
+
+    Writers hold an exclusive ``flock`` on ``lock_path`` (kept outside the
+    directory so dropping it doesn't drop the lock). ``poll`` returns only
+    the entries appended since the previous call, or everything with
+    ``reset=True`` when the log was rewritten: ``create`` and ``rewrite``
+    put a new epoch in ``meta.json``, which makes other processes reload.
+    """
+
+    def __init__(self, directory: str, log_name: str, lock_path: str):
+        self.directory = directory
+        self.log_path = os.path.join(directory, log_name)
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._epoch: Optional[str] = None
+        self._inode: Optional[int] = None
+        self._offset = 0
+
+    @contextmanager
+    def file_lock(self, exclusive: bool = True):
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            self._lock_file = open(self.lock_path, "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def forget(self):
+        self._epoch, self._inode, self._offset = None, None, 0
+
+    def _disk_state(self):
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            return meta, os.stat(self.log_path)
+        except FileNotFoundError:
+            return None, None
+
+    @property
+    def position(self) -> Tuple[Optional[str], int]:
+        """Epoch and byte offset read up to so far."""
+        return self._epoch, self._offset
+
+    def poll(
+        self, locked: bool = False, restore: Optional[Callable[[str, int], int]] = None
+    ) -> Optional[Tuple[bool, List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+        """``None`` if nothing changed, else ``(reset, new_entries, meta)``;
+        ``meta`` is ``None`` when the log no longer exists.
+
+        On a reset, ``restore(epoch, size)`` (if given) may load a snapshot
+        of the log up to some offset and return it; reading resumes there
+        instead of at the start.
+        """
+        meta, log = self._disk_state()
+        if meta is None or log is None:
+            if self._epoch is None:
+                return None
+            self.forget()
+            return True, [], None
+        if meta.get("epoch") == self._epoch and log.st_ino == self._inode and log.st_size == self._offset:
+            return None
+        if not locked:
+            # Something changed: read it under a shared lock so a writer is
+            # never caught half-way through an append.
+            with self.file_lock(exclusive=False):
+                return self.poll(locked=True, restore=restore)
+
+        reset = meta.get("epoch") != self._epoch or log.st_ino != self._inode or log.st_size < self._offset
+        if reset:
+            self.forget()
+            if restore is not None:
+                self._offset = restore(meta.get("epoch"), log.st_size)
+        self._epoch, self._inode = meta.get("epoch"), log.st_ino
+        with open(self.log_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(log.st_size - self._offset)
+        complete = data.rfind(b"\n") + 1
+        self._offset += complete
+        entries = [json.loads(line) for line in data[:complete].decode("utf-8").splitlines()]
+        return reset, entries, meta
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        with open(f"{self.meta_path}.tmp", "w") as f:
+            json.dump({**meta, "epoch": uuid.uuid4().hex}, f)
+        os.replace(f"{self.meta_path}.tmp", self.meta_path)
+
+    # Everything below is for writers holding ``file_lock()``.
+
+    def create(self, meta: Dict[str, Any], truncate: Sequence[str] = ()):
+        os.makedirs(self.directory, exist_ok=True)
+        for path in (*truncate, self.log_path):
+            open(path, "wb").close()
+        self._write_meta(meta)
+
+    def append(self, entries: Iterable[Dict[str, Any]]):
+        with open(self.log_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def rewrite(self, entries: Iterable[Dict[str, Any]], meta: Dict[str, Any]):
+        with open(f"{self.log_path}.tmp", "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(f"{self.log_path}.tmp", self.log_path)
+        # New epoch last: other processes reload once they see it.
+        self._write_meta(meta)
+        self.forget()
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.forget()
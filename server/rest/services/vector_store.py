@@ -0,0 +1,532 @@
+import os
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.shared_log import SharedLog
+
+logger = logging.getLogger(__name__)
+
+# "chroma" keeps using a Chroma PersistentClient; "chroma-http" talks to a
+# Chroma server shared by all workers; "numpy" uses the memory-mapped index
+# below, which is safe to share between worker processes on one host.
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma_db")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+VECTOR_DIR = os.getenv("VECTOR_DIR", os.path.join(os.getenv("INDEX_DIR", "kb_index"), "vectors"))
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+# IVF partitioning kicks in for stacks with at least this many rows (0 disables it).
+VECTOR_IVF_MIN_ROWS = int(os.getenv("VECTOR_IVF_MIN_ROWS", "50000"))
+VECTOR_IVF_PROBES = int(os.getenv("VECTOR_IVF_PROBES", "8"))
+
+QUERY_BLOCK_ROWS = 65536
+
+
+# (ids, texts, normalised vectors), one entry/row per chunk.
+Hits = Tuple[List[str], List[str], np.ndarray]
+
+
+def collection_name(stack_id: str) -> str:
+    return f"kb-{stack_id}"
+
+
+class VectorStore:
+    """Per-stack chunk index used by ingestion and retrieval.
+
+    Methods are blocking; callers run them through ``run_io``.
+    """
+
+    name = "base"
+
+    def upsert(self, stack_id: str, ids: List[str], documents: List[str], embeddings: np.ndarray):
+        raise NotImplementedError
+
+    def delete(self, stack_id: str, ids: List[str]):
+        raise NotImplementedError
+
+    def drop(self, stack_id: str):
+        raise NotImplementedError
+
+    def query(self, stack_id: str, embedding: np.ndarray, n_results: int) -> List[str]:
+        raise NotImplementedError
+
+    def query_many(self, stack_id: str, embeddings: np.ndarray, n_results: int) -> List[List[str]]:
+        return [self.query(stack_id, embedding, n_results) for embedding in embeddings]
+
+    def query_vectors(self, stack_id: str, embedding: np.ndarray, n_results: int) -> Hits:
+        """Like ``query`` but also returns chunk ids and the stored vectors,
+        for re-ranking without re-encoding."""
+        raise NotImplementedError
+
+    def query_vectors_many(self, stack_id: str, embeddings: np.ndarray, n_results: int) -> List[Hits]:
+        return [self.query_vectors(stack_id, embedding, n_results) for embedding in embeddings]
+
+    def fetch(self, stack_id: str, ids: List[str]) -> Hits:
+        """Texts and vectors of the given chunk ids; unknown ids are skipped."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class ChromaVectorStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, path: Optional[str] = None, host: Optional[str] = None, port: int = 8000):
+        import chromadb
+
+        if host:
+            # A shared Chroma server: the safe option with several workers.
+            self.client = chromadb.HttpClient(host=host, port=port)
+            return
+        if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            logger.warning(
+                "⚠️ Embedded Chroma is opened by every worker process; "
+                "use VECTOR_STORE=chroma-http or VECTOR_STORE=numpy with several workers"
+            )
+        self.client = chromadb.PersistentClient(path=path)
+
+    def upsert(self, stack_id, ids, documents, embeddings):
+        collection = self.client.get_or_create_collection(name=collection_name(stack_id))
+        collection.upsert(ids=ids, documents=documents, embeddings=np.asarray(embeddings).tolist())
+
+    def delete(self, stack_id, ids):
+        self.client.get_or_create_collection(name=collection_name(stack_id)).delete(ids=ids)
+
+    def drop(self, stack_id):
+        try:
+            self.client.delete_collection(name=collection_name(stack_id))
+        except Exception:
+            pass
+
+    def query(self, stack_id, embedding, n_results):
+        collection = self.client.get_collection(name=collection_name(stack_id))
+        results = collection.query(query_embeddings=[np.asarray(embedding).tolist()], n_results=n_results)
+        return results["documents"][0]
+
+    def query_many(self, stack_id, embeddings, n_results):
+        collection = self.client.get_collection(name=collection_name(stack_id))
+        results = collection.query(query_embeddings=np.asarray(embeddings).tolist(), n_results=n_results)
+        return results["documents"]
+
+    def query_vectors_many(self, stack_id, embeddings, n_results):
+        collection = self.client.get_collection(name=collection_name(stack_id))
+        results = collection.query(
+            query_embeddings=np.asarray(embeddings).tolist(), n_results=n_results, include=["documents", "embeddings"]
+        )
+        return [
+            _hits(ids, documents, vectors)
+            for ids, documents, vectors in zip(results["ids"], results["documents"], results["embeddings"])
+        ]
+
+    def query_vectors(self, stack_id, embedding, n_results):
+        return self.query_vectors_many(stack_id, [embedding], n_results)[0]
+
+    def fetch(self, stack_id, ids):
+        collection = self.client.get_collection(name=collection_name(stack_id))
+        results = collection.get(ids=list(ids), include=["documents", "embeddings"])
+        return _hits(results["ids"], results["documents"], results["embeddings"])
+
+
+def _hits(ids, documents, vectors) -> Hits:
+    if len(ids) == 0:
+        return [], [], np.zeros((0, 0), dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+    return list(ids), list(documents), vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+class _StackIndex:
+    """Append-only vectors + row log for one stack.
+
+    ``vectors.bin`` holds L2-normalised rows; ``rows.jsonl`` logs inserts
+    (``{"id", "text"}``, one per vector row) and deletes (``{"del": id}``).
+    An upsert of an existing id tombstones the old row and appends a new one;
+    the files are compacted once more than half the rows are dead.
+
+    Several processes (uvicorn workers) can share one directory through a
+    ``SharedLog``: writers hold its exclusive lock, and every call first
+    ``refresh``es, replaying only the log lines appended since the last call
+    (or everything, after another process compacted the stack).
+    """
+
+    def __init__(self, directory: str, dtype: str, lock_path: str):
+        self.directory = directory
+        self.default_dtype = np.dtype(dtype)
+        self.dtype = self.default_dtype
+        self.lock = threading.Lock()
+        self.log = SharedLog(directory, "rows.jsonl", lock_path)
+        self.dim: Optional[int] = None
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.live = np.zeros(0, dtype=bool)
+        self.matrix: Optional[np.ndarray] = None
+        self._ivf = None
+        self.reloads = 0
+        self.tail_reads = 0
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.directory, "vectors.bin")
+
+    def close(self):
+        self.matrix = None
+        self.log.close()
+
+    def _reset(self):
+        self.dim = None
+        self.dtype = self.default_dtype
+        self.ids, self.texts, self.rows = [], [], {}
+        self.live = np.zeros(0, dtype=bool)
+        self.matrix = None
+        self._ivf = None
+
+    def refresh(self, locked: bool = False):
+        """Catch up with whatever other processes wrote since the last call."""
+        change = self.log.poll(locked)
+        if change is None:
+            return
+        reset, entries, meta = change
+        if reset:
+            self._reset()
+            self.reloads += 1
+        else:
+            self.tail_reads += 1
+        if meta is None:
+            return
+        self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+        self._apply(entries)
+        self._remap(len(self.ids))
+
+    def _apply(self, entries: List[Dict]):
+        start = len(self.ids)
+        appended: List[bool] = []
+
+        def kill(row: int):
+            if row >= start:
+                appended[row - start] = False
+            else:
+                self.live[row] = False
+
+        for entry in entries:
+            if "del" in entry:
+                row = self.rows.pop(entry["del"], None)
+                if row is not None:
+                    kill(row)
+                continue
+            old = self.rows.get(entry["id"])
+            if old is not None:
+                kill(old)
+            self.rows[entry["id"]] = len(self.ids)
+            self.ids.append(entry["id"])
+            self.texts.append(entry["text"])
+            appended.append(True)
+        self.live = np.concatenate([self.live, np.array(appended, dtype=bool)])
+
+    def _remap(self, rows: int):
+        if rows == 0 or self.dim is None:
+            self.matrix = None
+            return
+        self.matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str], embeddings: np.ndarray):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or len(embeddings) != len(ids):
+            raise ValueError("embeddings must be a (len(ids), dim) matrix")
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        with self.log.file_lock():
+            self.refresh(locked=True)
+            if self.dim is None:
+                self.log.create(
+                    {"dim": embeddings.shape[1], "dtype": self.default_dtype.name}, truncate=[self.vectors_path]
+                )
+                self.refresh(locked=True)
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-d embeddings, got {embeddings.shape[1]}")
+            embeddings = (embeddings / np.clip(norms, 1e-12, None)).astype(self.dtype)
+
+            # Vectors are appended before their log lines, so a crash in
+            # between leaves trailing vectors with no row; drop them first.
+            row_bytes = self.dim * self.dtype.itemsize
+            if os.path.getsize(self.vectors_path) > len(self.ids) * row_bytes:
+                with open(self.vectors_path, "r+b") as f:
+                    f.truncate(len(self.ids) * row_bytes)
+            with open(self.vectors_path, "ab") as f:
+                f.write(embeddings.tobytes())
+            self.log.append({"id": chunk_id, "text": text} for chunk_id, text in zip(ids, documents))
+            self.refresh(locked=True)
+            self._maybe_compact()
+
+    def delete(self, ids: Sequence[str]):
+        with self.log.file_lock():
+            self.refresh(locked=True)
+            removed = [i for i in ids if i in self.rows]
+            if not removed:
+                return
+            self.log.append({"del": chunk_id} for chunk_id in removed)
+            self.refresh(locked=True)
+            self._maybe_compact()
+
+    def drop(self):
+        with self.log.file_lock():
+            self.log.remove()
+            self._reset()
+
+    def _maybe_compact(self):
+        dead = len(self.ids) - int(self.live.sum())
+        if dead < 1024 or dead * 2 < len(self.ids):
+            return
+        keep = np.flatnonzero(self.live)
+        with open(f"{self.vectors_path}.tmp", "wb") as f:
+            for start in range(0, len(keep), QUERY_BLOCK_ROWS):
+                f.write(np.asarray(self.matrix[keep[start:start + QUERY_BLOCK_ROWS]]).tobytes())
+        self.matrix = None
+        os.replace(f"{self.vectors_path}.tmp", self.vectors_path)
+        self.log.rewrite(
+            ({"id": self.ids[i], "text": self.texts[i]} for i in keep),
+            {"dim": self.dim, "dtype": self.dtype.name},
+        )
+        self.refresh(locked=True)
+        logger.info(f"🧹 Compacted {self.directory} to {len(keep)} rows")
+
+    def _scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), QUERY_BLOCK_ROWS):
+            block = rows[start:start + QUERY_BLOCK_ROWS]
+            scores[start:start + len(block)] = np.asarray(self.matrix[block], dtype=np.float32) @ query
+        return scores
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        live_rows = np.flatnonzero(self.live)
+        if VECTOR_IVF_MIN_ROWS <= 0 or len(live_rows) < VECTOR_IVF_MIN_ROWS:
+            return live_rows
+        ivf = self._ivf
+        # Rebuild once a tenth of the index has been written since the last build.
+        if ivf is None or len(self.ids) - ivf["rows"] > ivf["rows"] // 10:
+            ivf = self._ivf = self._build_ivf(live_rows)
+        nearest = np.argsort(-(ivf["centroids"] @ query))[:VECTOR_IVF_PROBES]
+        probed = np.concatenate([ivf["lists"][c] for c in nearest] + [np.arange(ivf["rows"], len(self.ids))])
+        return probed[self.live[probed]]
+
+    def _build_ivf(self, live_rows: np.ndarray, iterations: int = 8) -> Dict:
+        n_lists = max(1, int(np.sqrt(len(live_rows))))
+        rng = np.random.default_rng(0)
+        sample = rng.choice(live_rows, size=min(len(live_rows), n_lists * 64), replace=False)
+        data = np.asarray(self.matrix[np.sort(sample)], dtype=np.float32)
+        centroids = data[rng.choice(len(data), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = data[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        assignments = np.empty(len(live_rows), dtype=np.int64)
+        for start in range(0, len(live_rows), QUERY_BLOCK_ROWS):
+            block = live_rows[start:start + QUERY_BLOCK_ROWS]
+            assignments[start:start + len(block)] = np.argmax(
+                np.asarray(self.matrix[block], dtype=np.float32) @ centroids.T, axis=1
+            )
+        lists = [live_rows[assignments == c] for c in range(n_lists)]
+        logger.info(f"🗂️ Built IVF index for {self.directory} ({n_lists} lists)")
+        return {"centroids": centroids, "lists": lists, "rows": len(self.ids)}
+
+    def _top_rows_many(self, embeddings: np.ndarray, n_results: int) -> List[np.ndarray]:
+        if self.matrix is None:
+            return [np.zeros(0, dtype=np.int64) for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        live_rows = np.flatnonzero(self.live)
+        if len(live_rows) == 0 or (VECTOR_IVF_MIN_ROWS > 0 and len(live_rows) >= VECTOR_IVF_MIN_ROWS):
+            return [self._top_rows(q, n_results) for q in queries]
+        # Brute force: one (rows x dim) @ (dim x queries) product per block.
+        scores = np.empty((len(live_rows), len(queries)), dtype=np.float32)
+        for start in range(0, len(live_rows), QUERY_BLOCK_ROWS):
+            block = live_rows[start:start + QUERY_BLOCK_ROWS]
+            scores[start:start + len(block)] = np.asarray(self.matrix[block], dtype=np.float32) @ queries.T
+        k = min(n_results, len(live_rows))
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            results.append(live_rows[top[np.argsort(-column[top])]])
+        return results
+
+    def _top_rows(self, embedding: np.ndarray, n_results: int) -> np.ndarray:
+        if self.matrix is None:
+            return np.zeros(0, dtype=np.int64)
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        rows = self._candidates(query)
+        if len(rows) == 0:
+            return rows
+        scores = self._scores(rows, query)
+        k = min(n_results, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return rows[top[np.argsort(-scores[top])]]
+
+    def _with_vectors(self, rows) -> Hits:
+        if len(rows) == 0:
+            return [], [], np.zeros((0, self.dim or 0), dtype=np.float32)
+        rows = np.asarray(rows)
+        return [self.ids[i] for i in rows], [self.texts[i] for i in rows], np.asarray(self.matrix[rows], dtype=np.float32)
+
+    def query(self, embedding: np.ndarray, n_results: int) -> List[str]:
+        return [self.texts[i] for i in self._top_rows(embedding, n_results)]
+
+    def query_many(self, embeddings: np.ndarray, n_results: int) -> List[List[str]]:
+        return [[self.texts[i] for i in rows] for rows in self._top_rows_many(embeddings, n_results)]
+
+    def query_vectors(self, embedding: np.ndarray, n_results: int) -> Hits:
+        return self._with_vectors(self._top_rows(embedding, n_results))
+
+    def query_vectors_many(self, embeddings: np.ndarray, n_results: int) -> List[Hits]:
+        return [self._with_vectors(rows) for rows in self._top_rows_many(embeddings, n_results)]
+
+    def fetch(self, ids: Sequence[str]) -> Hits:
+        return self._with_vectors([self.rows[i] for i in ids if i in self.rows])
+
+    def stats(self) -> Dict:
+        live = int(self.live.sum())
+        return {"rows": live, "dead_rows": len(self.ids) - live, "ivf": self._ivf is not None}
+
+
+class NumpyVectorStore(VectorStore):
+    """Memory-mapped, in-process vector index (one directory per stack).
+
+    Scores are cosine similarities from a vectorised dot product, and top-k
+    uses ``argpartition``. Stacks above ``VECTOR_IVF_MIN_ROWS`` rows are
+    searched through a coarse k-means (IVF) partition, probing the
+    ``VECTOR_IVF_PROBES`` nearest lists.
+    """
+
+    name = "numpy"
+
+    def __init__(self, directory: str, dtype: str = "float32"):
+        self.directory = directory
+        self.dtype = dtype
+        self._indexes: Dict[str, _StackIndex] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _index(self, stack_id: str) -> _StackIndex:
+        with self._lock:
+            index = self._indexes.get(stack_id)
+            if index is None:
+                name = collection_name(stack_id)
+                index = self._indexes[stack_id] = _StackIndex(
+                    os.path.join(self.directory, name), self.dtype, os.path.join(self.directory, ".locks", f"{name}.lock")
+                )
+            return index
+
+    def _read(self, stack_id: str, method: str, *args):
+        index = self._index(stack_id)
+        with index.lock:
+            index.refresh()
+            return getattr(index, method)(*args)
+
+    def upsert(self, stack_id, ids, documents, embeddings):
+        index = self._index(stack_id)
+        with index.lock:
+            index.upsert(ids, documents, embeddings)
+
+    def delete(self, stack_id, ids):
+        index = self._index(stack_id)
+        with index.lock:
+            index.delete(ids)
+
+    def drop(self, stack_id):
+        index = self._index(stack_id)
+        with index.lock:
+            index.drop()
+
+    def query(self, stack_id, embedding, n_results):
+        return self._read(stack_id, "query", embedding, n_results)
+
+    def query_many(self, stack_id, embeddings, n_results):
+        return self._read(stack_id, "query_many", embeddings, n_results)
+
+    def query_vectors(self, stack_id, embedding, n_results):
+        return self._read(stack_id, "query_vectors", embedding, n_results)
+
+    def query_vectors_many(self, stack_id, embeddings, n_results):
+        return self._read(stack_id, "query_vectors_many", embeddings, n_results)
+
+    def fetch(self, stack_id, ids):
+        return self._read(stack_id, "fetch", ids)
+
+    def close(self):
+        with self._lock:
+            indexes, self._indexes = list(self._indexes.values()), {}
+        for index in indexes:
+            with index.lock:
+                index.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            indexes = dict(self._indexes)
+        return {
+            "backend": self.name,
+            "dtype": self.dtype,
+            "stacks_loaded": len(indexes),
+            "rows": sum(index.stats()["rows"] for index in indexes.values()),
+            # Picked up from other processes: full reloads vs. incremental log reads.
+            "reloads": sum(index.reloads for index in indexes.values()),
+            "tail_reads": sum(index.tail_reads for index in indexes.values()),
+        }
+
+
+def create_vector_store(backend: str = VECTOR_STORE) -> VectorStore:
+    if backend == "numpy":
+        return NumpyVectorStore(VECTOR_DIR, VECTOR_DTYPE)
+    if backend == "chroma":
+        return ChromaVectorStore(CHROMA_PATH)
+    if backend == "chroma-http":
+        return ChromaVectorStore(host=CHROMA_HOST, port=CHROMA_PORT)
+    raise ValueError(f"Unknown VECTOR_STORE {backend!r}")
+
+
+class VectorStoreHandle:
+    """Module-level stand-in for the configured store.
+
+    Nothing is opened at import time: the app lifespan calls ``open`` (off
+    the event loop), and scripts that skip the lifespan open it on first use.
+    """
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self._store: Optional[VectorStore] = None
+        self._lock = threading.Lock()
+
+    def open(self) -> VectorStore:
+        with self._lock:
+            if self._store is None:
+                self._store = create_vector_store(self.backend)
+                logger.info(f"🗄️ Opened {self.backend} vector store")
+            return self._store
+
+    def close(self):
+        with self._lock:
+            if self._store is not None:
+                self._store.close()
+            self._store = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._store is not None
+
+    def __getattr__(self, name: str):
+        return getattr(self.open(), name)
+
+    def stats(self) -> Dict:
+        if self._store is None:
+            return {"backend": self.backend, "open": False}
+        return {**self._store.stats(), "open": True}
+
+
+vector_store = VectorStoreHandle(VECTOR_STORE)
@@ -0,0 +1,40 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import pytest
+
+# Services read their settings at import time; point everything at a
+# throwaway directory before any of them is imported.
+_root = tempfile.mkdtemp(prefix="rest-tests-")
+os.environ.setdefault("INDEX_DIR", os.path.join(_root, "kb_index"))
+os.environ.setdefault("VECTOR_STORE", "numpy")
+os.environ.setdefault("PG_CONNECTION", f"sqlite+aiosqlite:///{os.path.join(_root, 'test.db')}")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Runs ``test(session_factory)`` on its own event loop against a fresh
+    SQLite database with every table created."""
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from db import Base
+    import models.document, models.ingestion_job, models.stack, models.workflow  # noqa: F401
+
+    def run(test):
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            try:
+                return await test(sessionmaker(engine, expire_on_commit=False, class_=AsyncSession))
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
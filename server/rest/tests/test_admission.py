@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from api import workflows
+from services.admission import AdmissionControl, Overloaded, SingleFlight
+
+
+def control(**limits):
+    settings = dict(max_active=2, max_queue=0, max_active_per_stack=1, max_queue_per_stack=0, queue_timeout=1.0)
+    settings.update(limits)
+    return AdmissionControl(**settings)
+
+
+def test_stack_over_its_share_gets_429():
+    async def main():
+        admission = control()
+        ticket = await admission.acquire("a")
+        with pytest.raises(Overloaded) as error:
+            await admission.acquire("a")
+        # Another stack still gets in.
+        other = await admission.acquire("b")
+        ticket.release()
+        again = await admission.acquire("a")
+        for t in (other, again):
+            t.release()
+        return error.value, admission.stats()
+
+    error, stats = asyncio.run(main())
+    assert error.status_code == 429
+    assert 1 <= error.retry_after <= 60
+    assert stats["rejected_stack"] == 1
+    assert stats["active"] == 0 and stats["stacks_active"] == 0
+
+
+def test_full_server_gets_503():
+    async def main():
+        admission = control()
+        tickets = [await admission.acquire("a"), await admission.acquire("b")]
+        with pytest.raises(Overloaded) as error:
+            await admission.acquire("c")
+        for t in tickets:
+            t.release()
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 503
+    assert 1 <= error.retry_after <= 60
+
+
+def test_queue_timeout_gets_503():
+    async def main():
+        admission = control(max_queue=1, queue_timeout=0.05)
+        tickets = [await admission.acquire("a"), await admission.acquire("b")]
+        with pytest.raises(Overloaded) as error:
+            await admission.acquire("c")
+        for t in tickets:
+            t.release()
+        return error.value, admission.stats()
+
+    error, stats = asyncio.run(main())
+    assert error.status_code == 503
+    assert stats["timed_out"] == 1 and stats["waiting"] == 0
+
+
+def test_queued_request_is_admitted_on_release():
+    async def main():
+        admission = control(max_queue_per_stack=1)
+        first = await admission.acquire("a")
+        waiting = asyncio.ensure_future(admission.acquire("a"))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        first.release()
+        (await waiting).release()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("busy, status", [("a", 429), ("b", 503)])
+def test_admit_sets_retry_after(monkeypatch, busy, status):
+    monkeypatch.setattr(workflows, "admission", control(max_active=1))
+
+    async def main():
+        ticket = await workflows.admit(busy)
+        try:
+            with pytest.raises(HTTPException) as error:
+                await workflows.admit("a")
+        finally:
+            ticket.release()
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.status_code == status
+    assert int(error.headers["Retry-After"]) >= 1
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    async def build():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "plan"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("s", build) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["plan"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 4}
+
+
+def test_single_flight_survives_a_cancelled_leader():
+    flight = SingleFlight()
+
+    async def build():
+        await asyncio.sleep(0.02)
+        return "plan"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("s", build))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("s", build))
+        await asyncio.sleep(0)
+        leader.cancel()
+        result = await follower
+        return leader, result
+
+    leader, result = asyncio.run(main())
+    assert leader.cancelled()
+    assert result == "plan"
+    assert flight.executions == 1
+
+
+def test_single_flight_shares_errors_and_forgets_the_key():
+    flight = SingleFlight()
+
+    async def broken():
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    async def ok():
+        return "plan"
+
+    async def main():
+        results = await asyncio.gather(flight.do("s", broken), flight.do("s", broken), return_exceptions=True)
+        return results, await flight.do("s", ok)
+
+    results, retried = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert retried == "plan"
+    assert flight.stats() == {"in_flight": 0, "executions": 2, "coalesced": 1}
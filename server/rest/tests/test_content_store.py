@@ -0,0 +1,52 @@
+import os
+import asyncio
+
+from models.document import Document
+from services.content_store import ContentStore
+
+HASH = "ab" * 32
+
+
+def write_upload(directory, name="upload.part", body=b"%PDF-1.4 test"):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(body)
+    return path
+
+
+def test_adopt_stores_identical_bytes_once(tmp_path):
+    store = ContentStore(str(tmp_path / "blobs"), str(tmp_path / "parsed"))
+    first = store.adopt(write_upload(tmp_path, "a.part"), HASH, "a.pdf")
+    second = store.adopt(write_upload(tmp_path, "b.part"), HASH, "b.PDF")
+    assert first == second and first.endswith(f"{HASH}.pdf")
+    assert os.listdir(tmp_path / "blobs" / "ab") == [f"{HASH}.pdf"]
+    assert store.blob_hits == 1
+
+
+def test_release_waits_for_an_upload_holding_the_blob(tmp_path, database):
+    store = ContentStore(str(tmp_path / "blobs"), str(tmp_path / "parsed"))
+    os.makedirs(os.path.dirname(store.chunks_path(HASH)))
+    open(store.chunks_path(HASH), "wb").close()
+
+    async def test(sessions):
+        async with sessions() as deleting, sessions() as uploading:
+            async with store.hold(HASH):
+                path = store.adopt(write_upload(tmp_path), HASH, "a.pdf")
+                # A stack deletion releasing the same hash has to wait...
+                release = asyncio.ensure_future(store.release_unreferenced(deleting, [HASH]))
+                await asyncio.sleep(0.05)
+                assert not release.done()
+                uploading.add(Document(stack_id="s", id="d", path=path, content_hash=HASH))
+                await uploading.commit()
+            # ...and then sees the new row, so the blob stays.
+            await release
+            assert os.path.exists(path)
+
+            await uploading.delete(await uploading.get(Document, {"stack_id": "s", "id": "d"}))
+            await uploading.commit()
+            await store.release_unreferenced(deleting, [HASH, None])
+            assert not os.path.exists(path)
+            assert not store.has_chunks(HASH)
+        assert store._locks == {}
+
+    database(test)
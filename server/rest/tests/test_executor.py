@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from services.executor import BoundedPool
+from services.metrics import begin_request, end_request, stage
+
+
+def timed_work():
+    with stage("lexical_query"):
+        time.sleep(0.01)
+    return "done"
+
+
+def test_stages_timed_in_pool_threads_reach_the_request():
+    pool = BoundedPool("test", kind="thread", max_workers=2, max_queue=2)
+
+    async def main():
+        token = begin_request()
+        assert await pool.run(timed_work) == "done"
+        return end_request(token)
+
+    try:
+        server_timing = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert server_timing.startswith("lexical_query;dur=")
+    assert 'desc="1x"' in server_timing
+
+
+def test_pool_bounds_calls_in_flight():
+    pool = BoundedPool("test", kind="thread", max_workers=1, max_queue=1)
+    peak = []
+
+    def work():
+        peak.append(pool.in_flight)
+        time.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(pool.run(work) for _ in range(5)))
+
+    try:
+        asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert max(peak) <= 2
+    assert pool.completed == 5
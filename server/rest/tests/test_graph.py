@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from models.workflow import Workflow
+from services import graph
+from services.graph import GraphRun, execute_plan
+from services.plan import compile_plan
+
+
+def node(node_id, node_type):
+    return {"id": node_id, "data": {"type": node_type, "nodeData": {}}}
+
+
+def diamond():
+    # in → (kb, search) → llm → out
+    nodes = [node("in", "user-input"), node("kb", "knowledge-base"), node("search", "web-search"),
+             node("llm", "llm"), node("out", "output")]
+    edges = [("in", "kb"), ("in", "search"), ("kb", "llm"), ("search", "llm"), ("llm", "out")]
+    return compile_plan(
+        Workflow(id="w", stack_id="s", nodes=nodes, edges=[{"source": s, "target": t} for s, t in edges], version=1),
+        documents=[],
+    )
+
+
+@pytest.fixture
+def events(monkeypatch):
+    events = []
+
+    def fake(delay):
+        async def handler(run, node):
+            events.append(("start", node.id))
+            await asyncio.sleep(delay)
+            events.append(("end", node.id))
+            if node.type == "output":
+                return {"answer": "done"}
+            return {}
+        return handler
+
+    monkeypatch.setattr(graph, "HANDLERS", {
+        "user-input": fake(0), "knowledge-base": fake(0.05), "web-search": fake(0.05), "llm": fake(0), "output": fake(0),
+    })
+    return events
+
+
+def test_execute_plan_runs_nodes_after_their_dependencies(events):
+    plan = diamond()
+    result = asyncio.run(execute_plan(GraphRun(plan=plan, query="q")))
+
+    assert result["answer"] == "done"
+    assert set(result["timings"]) == {n.id for n in plan.nodes}
+    for n in plan.nodes:
+        for dep in n.depends_on:
+            assert events.index(("end", dep)) < events.index(("start", n.id))
+    # Independent branches overlap instead of running one after the other.
+    assert events.index(("start", "search")) < events.index(("end", "kb"))
+    assert events.index(("start", "kb")) < events.index(("end", "search"))
+
+
+def test_execute_plan_cancels_the_rest_when_a_node_fails(events, monkeypatch):
+    async def broken(run, node):
+        raise RuntimeError("search down")
+
+    monkeypatch.setitem(graph.HANDLERS, "web-search", broken)
+
+    with pytest.raises(RuntimeError, match="search down"):
+        asyncio.run(execute_plan(GraphRun(plan=diamond(), query="q")))
+
+    assert ("start", "kb") in events
+    assert ("end", "kb") not in events
+    assert not any(node_id in ("llm", "out") for _, node_id in events)
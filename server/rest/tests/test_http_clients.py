@@ -0,0 +1,55 @@
+import asyncio
+import logging
+
+import httpx
+import pytest
+
+from services import http_clients as hc
+from services.http_clients import HttpClients, RedactKeys, RetryPolicy
+
+SECRET = "SECRET123"
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(401 if request.url.params["q"] == "denied" else 200, json={})
+
+    transport = httpx.MockTransport(handler)
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(hc.httpx, "AsyncClient", lambda **kwargs: real_client(transport=transport, **kwargs))
+
+    clients = HttpClients()
+    clients.register("search", "https://search.example", RetryPolicy(deadline=5, retries=0), key_param="api_key")
+    logger = logging.getLogger("httpx")
+    redact = RedactKeys(clients)
+    logger.addFilter(redact)
+    yield clients
+    logger.removeFilter(redact)
+    asyncio.run(clients.aclose())
+
+
+def test_api_key_never_reaches_the_logs(clients, caplog):
+    async def search(q):
+        return await clients.request("search", SECRET, "GET", "/search.json", params={"q": q})
+
+    with caplog.at_level(logging.DEBUG):
+        response = asyncio.run(search("x"))
+        with pytest.raises(httpx.HTTPStatusError) as error:
+            asyncio.run(search("denied"))
+
+    assert response.request.url.params["api_key"] == SECRET
+    assert "HTTP Request: GET https://search.example/search.json?api_key=***&q=x" in caplog.text
+    assert SECRET not in caplog.text
+    assert SECRET in str(error.value)
+    assert SECRET not in clients.redact(str(error.value))
+
+
+def test_redact_leaves_other_params_alone(clients):
+    assert clients.redact("https://a/?q=api_key&key=1&api_key=abc#x") == "https://a/?q=api_key&key=1&api_key=***#x"
+    assert HttpClients().redact("https://a/?api_key=abc") == "https://a/?api_key=abc"
+
+
+def test_shared_clients_redact_httpx_logs():
+    filters = logging.getLogger("httpx").filters
+    assert any(isinstance(f, RedactKeys) and f.clients is hc.http_clients for f in filters)
@@ -0,0 +1,106 @@
+import os
+import asyncio
+
+import numpy as np
+import pytest
+
+from services import indexing, pipeline
+from services.context import fuse_rankings, select_mmr
+from services.lexical_index import LexicalIndex
+from services.vector_store import NumpyVectorStore
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    vectors = NumpyVectorStore(str(tmp_path / "vectors"))
+    lexical = LexicalIndex(str(tmp_path / "lexical"))
+    for module in (pipeline, indexing):
+        monkeypatch.setattr(module, "vector_store", vectors)
+        monkeypatch.setattr(module, "lexical_index", lexical)
+    monkeypatch.setattr(indexing, "INDEX_DIR", str(tmp_path / "index"))
+    yield vectors, lexical
+    vectors.close()
+    lexical.close()
+
+
+def test_fuse_rankings_rewards_agreement():
+    fused = fuse_rankings([(["a", "b", "c"], 1.0), (["c", "d"], 1.0)], k=60)
+    assert [item for item, _ in fused] == ["c", "a", "b", "d"]
+    assert fused[0][1] == pytest.approx(1 / 63 + 1 / 61)
+
+
+def test_fuse_rankings_weights_and_zero_weight():
+    assert [i for i, _ in fuse_rankings([(["a"], 1.0), (["b"], 2.0)])] == ["b", "a"]
+    assert fuse_rankings([(["a"], 1.0), (["b"], 0.0)]) == [("a", pytest.approx(1 / 61))]
+
+
+def test_select_mmr_uses_given_relevance():
+    vectors = np.stack([unit(1, 0), unit(0, 1)])
+    query = unit(1, 0)
+    assert select_mmr(query, ["x", "y"], vectors, 1) == ["x"]
+    assert select_mmr(query, ["x", "y"], vectors, 1, relevance=np.array([0.1, 1.0])) == ["y"]
+
+
+def test_select_adds_lexical_only_hits(stores):
+    vectors, lexical = stores
+    ids = ["near", "code"]
+    texts = ["pump overview", "Fault ERR-4012: sensor disconnected"]
+    embeddings = np.stack([unit(1, 0, 0), unit(0, 0, 1)])
+    vectors.upsert("s", ids, texts, embeddings)
+    lexical.upsert("s", ids, texts)
+
+    query = unit(1, 0.1, 0)
+    dense = vectors.query_vectors("s", query, 1)
+    assert dense[0] == ["near"]
+    picked = pipeline._select("s", "what is ERR-4012", query, dense, 2, 1.0, 1.0)
+    assert set(picked) == set(texts)
+    # Lexical weight 0 is plain dense retrieval.
+    assert pipeline._select("s", "what is ERR-4012", query, dense, 2, 1.0, 0.0) == ["pump overview"]
+
+
+def test_select_ignores_lexical_hits_missing_from_vector_store(stores):
+    vectors, lexical = stores
+    lexical.upsert("s", ["gone"], ["ERR-4012 only in the lexical index"])
+    empty = ([], [], np.zeros((0, 0), dtype=np.float32))
+    assert pipeline._select("s", "ERR-4012", unit(1, 0), empty, 3, 1.0, 1.0) == []
+
+    vectors.upsert("s", ["kept"], ["pump overview"], np.stack([unit(1, 0)]))
+    dense = vectors.query_vectors("s", unit(1, 0), 3)
+    assert pipeline._select("s", "ERR-4012", unit(1, 0), dense, 3, 1.0, 1.0) == ["pump overview"]
+
+
+def test_reconcile_backfills_lexical_index(stores):
+    vectors, lexical = stores
+    vectors.upsert("s", ["a", "b"], ["alpha ERR-1", "beta ZX-2"], np.eye(2, 4, dtype=np.float32))
+    manifest = indexing.empty_manifest("test-model")
+    manifest["documents"]["h" * 64] = {"file_name": "a.pdf", "chunk_ids": ["a", "b"], "document_ids": ["d1"]}
+    indexing.save_manifest("s", manifest)
+
+    report = asyncio.run(indexing.reconcile_knowledge_base("s", [{"id": "d1"}], "test-model"))
+
+    assert report["chunks"] == 2
+    assert lexical.query("s", "zx-2", 2) == ["b"]
+    assert indexing.load_manifest("s")["documents"]["h" * 64]["lexical"] is True
+
+    asyncio.run(indexing.reconcile_knowledge_base("s", [], "test-model"))
+    assert lexical.query("s", "zx-2", 2) == []
+
+
+def test_drop_knowledge_base_removes_everything_on_disk(stores):
+    vectors, lexical = stores
+    vectors.upsert("s", ["a"], ["alpha ERR-1"], np.eye(1, 4, dtype=np.float32))
+    lexical.upsert("s", ["a"], ["alpha ERR-1"])
+    indexing.save_manifest("s", indexing.empty_manifest("test-model"))
+
+    asyncio.run(indexing.drop_knowledge_base("s"))
+
+    assert not os.path.exists(os.path.dirname(indexing.manifest_path("s")))
+    assert not os.path.exists(os.path.join(vectors.directory, "kb-s"))
+    assert not os.path.exists(os.path.join(lexical.directory, "kb-s"))
+    assert lexical.query("s", "err-1", 1) == []
+    assert vectors.query_vectors("s", np.eye(1, 4, dtype=np.float32)[0], 1)[0] == []
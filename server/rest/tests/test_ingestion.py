@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+from models.document import Document
+from models.ingestion_job import IngestionJob
+from models.stack import Stack
+from services import ingestion
+from services.ingestion import IngestionQueue
+
+
+def test_expired_lease_is_requeued_and_reclaimed(database, monkeypatch, tmp_path):
+    path = tmp_path / "d1.pdf"
+    path.write_bytes(b"%PDF")
+    indexed = []
+
+    async def index_document(stack_id, source, model_name, on_progress=None):
+        indexed.append(source["id"])
+        return 3
+
+    monkeypatch.setattr(ingestion, "index_document", index_document)
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=ingestion.INGEST_STALE_SECONDS + 60)
+
+    async def test(sessions):
+        monkeypatch.setattr(ingestion, "SessionLocal", sessions)
+        async with sessions() as db:
+            db.add_all([
+                Stack(id="s", name="stack"),
+                Document(stack_id="s", id="d1", path=str(path), status="running"),
+                Document(stack_id="s", id="d2", path=str(path), status="running"),
+                # Held by a process that died an age ago, and by one still alive.
+                IngestionJob(id="dead", stack_id="s", document_id="d1", path=str(path), status="running",
+                             worker_id="dead-worker", heartbeat_at=stale),
+                IngestionJob(id="alive", stack_id="s", document_id="d2", path=str(path), status="running",
+                             worker_id="live-worker", heartbeat_at=now),
+            ])
+            await db.commit()
+
+        queue = IngestionQueue(workers=1)
+        assert await queue._sweep() == 1
+        assert queue.requeued_stale == 1
+        assert queue._enqueued == {"dead"}
+
+        # A second sweep doesn't enqueue the job again.
+        assert await queue._sweep() == 0
+
+        await queue._run("dead")
+        # The claim is atomic: running it twice doesn't index twice.
+        await queue._run("dead")
+        await queue._run("alive")
+
+        async with sessions() as db:
+            dead = await db.get(IngestionJob, "dead")
+            alive = await db.get(IngestionJob, "alive")
+            document = await db.get(Document, {"stack_id": "s", "id": "d1"})
+            return queue.worker_id, dead, alive, document
+
+    worker_id, dead, alive, document = database(test)
+    assert indexed == ["d1"]
+    assert (dead.status, dead.worker_id, dead.chunks) == ("succeeded", worker_id, 3)
+    assert dead.heartbeat_at is not None
+    assert (alive.status, alive.worker_id) == ("running", "live-worker")
+    assert (document.status, document.chunks) == ("indexed", 3)
@@ -0,0 +1,163 @@
+import pytest
+
+from services import lexical_index as lx
+from services.lexical_index import LexicalIndex, term_frequencies, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    yield index
+    index.close()
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Error ERR-4012 in v2.3.1, see max_retries.") == [
+        "error", "err-4012", "err", "4012", "in", "v2.3.1", "v2", "3", "1", "see", "max_retries", "max", "retries",
+    ]
+
+
+def test_tokenize_drops_punctuation():
+    assert tokenize("--- a / b ...") == ["a", "b"]
+
+
+def test_term_frequencies_counts_tokens():
+    tf, length = term_frequencies("pump pump valve")
+    assert tf == {"pump": 2, "valve": 1}
+    assert length == 3
+
+
+def test_exact_identifier_ranks_first(index):
+    index.upsert("s", ["a", "b", "c"], [
+        "The pump reports a pressure fault",
+        "Fault code ERR-4012 means the pressure sensor is disconnected",
+        "Valve assembly and torque settings",
+    ])
+    assert index.query("s", "what does ERR-4012 mean", 3)[0] == "b"
+    assert index.query("s", "4012", 3) == ["b"]
+
+
+def test_bm25_prefers_more_occurrences_and_shorter_chunks(index):
+    index.upsert("s", ["once", "twice", "long"], [
+        "sensor calibration",
+        "sensor calibration sensor",
+        "sensor " + " ".join(f"filler{i}" for i in range(50)),
+    ])
+    assert index.query("s", "sensor", 3) == ["twice", "once", "long"]
+
+
+def test_small_stack_keeps_common_exact_terms(index):
+    # ERR-4012 is in 2 of 3 chunks: far above the df ratio, but the stack
+    # is too small for the cutoff to apply.
+    index.upsert("s", ["a", "b", "c"], ["Fault ERR-4012 in pump", "ERR-4012 again", "unrelated valve"])
+    assert set(index.query("s", "what is ERR-4012", 3)) == {"a", "b"}
+
+
+def test_common_terms_skipped_on_large_stacks_unless_nothing_else_matches(index, monkeypatch):
+    monkeypatch.setattr(lx, "LEXICAL_MAX_DF_MIN_CHUNKS", 4)
+    index.upsert("s", ["a", "b", "c", "d"], ["pump alpha", "pump beta", "pump gamma", "valve delta"])
+    # "pump" is in 3 of 4 chunks, so only "delta" is scored...
+    assert index.query("s", "pump delta", 4) == ["d"]
+    # ...but alone, or when the rest matches nothing, it still counts.
+    assert set(index.query("s", "pump", 4)) == {"a", "b", "c"}
+    assert set(index.query("s", "pump zeta", 4)) == {"a", "b", "c"}
+
+
+def test_upsert_replaces_and_delete_removes(index):
+    index.upsert("s", ["a", "b"], ["alpha code AB-1", "beta"])
+    index.upsert("s", ["a"], ["alpha code CD-2"])
+    assert index.query("s", "ab-1", 2) == []
+    assert index.query("s", "cd-2", 2) == ["a"]
+
+    index.delete("s", ["a"])
+    assert index.query("s", "alpha", 2) == []
+    assert index.stats()["chunks"] == 1
+
+
+def test_compaction_keeps_live_postings(index):
+    ids = [f"c{i}" for i in range(3000)]
+    index.upsert("s", ids, [f"chunk number n{i} shared" for i in range(3000)])
+    index.delete("s", ids[:2000])
+
+    stack = index._index("s")
+    assert len(stack.ids) == 1000  # compacted
+    assert index.query("s", "n2500", 3) == ["c2500"]
+    assert index.query("s", "n5", 3) == []
+
+
+def test_other_instances_see_writes(tmp_path, index):
+    index.upsert("s", ["a"], ["first AB-1"])
+    other = LexicalIndex(str(tmp_path))
+    assert other.query("s", "ab-1", 1) == ["a"]
+
+    index.upsert("s", ["b"], ["second CD-2"])
+    index.delete("s", ["a"])
+    assert other.query("s", "cd-2", 1) == ["b"]
+    assert other.query("s", "ab-1", 1) == []
+    assert other.stats()["tail_reads"] >= 1
+
+    index.drop("s")
+    assert other.query("s", "cd-2", 1) == []
+    other.close()
+
+
+def test_reload_starts_from_snapshot_and_replays_the_tail(tmp_path, index, monkeypatch):
+    monkeypatch.setattr(lx, "LEXICAL_SNAPSHOT_MIN_BYTES", 1)
+    index.upsert("s", ["a", "b"], ["first AB-1 pump", "second CD-2 valve"])
+    stack = index._index("s")
+    assert stack.snapshot_offset == stack.log.position[1]
+
+    monkeypatch.setattr(lx, "LEXICAL_SNAPSHOT_MIN_BYTES", 1 << 30)
+    index.upsert("s", ["c", "a"], ["third EF-3 pump", "first again GH-4"])
+    index.delete("s", ["b"])
+
+    other = LexicalIndex(str(tmp_path))
+    for query in ("pump", "ab-1", "gh-4", "cd-2", "ef-3 valve"):
+        assert other.query("s", query, 3) == index.query("s", query, 3)
+    assert other.stats()["snapshot_loads"] == 1
+    assert other.stats()["chunks"] == 2
+    other.close()
+
+
+def test_stale_or_broken_snapshots_are_ignored(tmp_path, index, monkeypatch):
+    monkeypatch.setattr(lx, "LEXICAL_SNAPSHOT_MIN_BYTES", 1)
+    index.upsert("s", ["a"], ["first AB-1"])
+    stack = index._index("s")
+    # A rewrite (compaction) starts a new epoch the old snapshot doesn't cover.
+    with stack.log.file_lock():
+        stack.log.rewrite([{"id": "b", "tf": {"cd-2": 1}, "len": 1}], {})
+
+    other = LexicalIndex(str(tmp_path))
+    assert other.query("s", "ab-1", 1) == []
+    assert other.query("s", "cd-2", 1) == ["b"]
+    assert other.stats()["snapshot_loads"] == 0
+    other.close()
+
+    with open(stack.snapshot_path, "wb") as f:
+        f.write(b"not a snapshot")
+    other = LexicalIndex(str(tmp_path))
+    assert other.query("s", "cd-2", 1) == ["b"]
+    other.close()
+
+
+def test_compaction_leaves_a_snapshot(tmp_path, index, monkeypatch):
+    monkeypatch.setattr(lx, "LEXICAL_SNAPSHOT_MIN_BYTES", 1)
+    ids = [f"c{i}" for i in range(3000)]
+    index.upsert("s", ids, [f"chunk number n{i} shared" for i in range(3000)])
+    index.delete("s", ids[:2000])
+
+    other = LexicalIndex(str(tmp_path))
+    assert other.query("s", "n2500", 3) == ["c2500"]
+    assert other.stats()["snapshot_loads"] == 1
+    assert len(other._index("s").ids) == 1000
+    other.close()
+
+
+def test_warm_up_loads_every_stack_on_disk(tmp_path, index):
+    index.upsert("one", ["a"], ["alpha"])
+    index.upsert("two", ["b"], ["beta"])
+    other = LexicalIndex(str(tmp_path))
+    other.warm_up()
+    assert other.stats()["stacks_loaded"] == 2
+    assert other.stats()["chunks"] == 2
+    other.close()
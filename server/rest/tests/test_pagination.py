@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy.future import select
+
+from models.stack import Stack
+from utils import pagination
+from utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, finish_page, keyset_page, page_size
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(created_at, "stack-1")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "stack-1")
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor(datetime(2024, 1, 1), "x")[:-3], "WzFd"])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_page_size_is_clamped():
+    assert page_size(None) == pagination.DEFAULT_PAGE_SIZE
+    assert page_size(0) == 1
+    assert page_size(10 ** 6) == pagination.MAX_PAGE_SIZE
+
+
+def test_keyset_pages_walk_every_row_once(database):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # Pairs of rows share a timestamp, so pages have to break ties on id.
+    stacks = [Stack(id=f"s{i}", name=f"stack {i}", created_at=start + timedelta(seconds=i // 2)) for i in range(7)]
+
+    async def test(sessions):
+        async with sessions() as db:
+            db.add_all(reversed(stacks))
+            await db.commit()
+
+            pages, cursor = [], None
+            while True:
+                response = Response()
+                result = await db.execute(keyset_page(select(Stack), Stack.created_at, Stack.id, cursor, 2))
+                pages.append([s.id for s in finish_page(result.scalars().all(), 2, response)])
+                cursor = response.headers.get(NEXT_CURSOR_HEADER)
+                if cursor is None:
+                    return pages
+
+    assert database(test) == [["s0", "s1"], ["s2", "s3"], ["s4", "s5"], ["s6"]]
@@ -0,0 +1,76 @@
+import pytest
+
+from models.document import Document
+from models.stack import Stack
+from models.workflow import Workflow
+from services import plan as plans
+
+
+def test_load_documents_bypasses_the_plan_cache(database, monkeypatch):
+    monkeypatch.setattr(plans, "plan_cache", plans.PlanCache(ttl=30))
+
+    async def test(sessions):
+        async with sessions() as db:
+            db.add_all([
+                Stack(id="s", name="stack"),
+                Workflow(id="w", stack_id="s", nodes=[], edges=[], data={}),
+                Document(stack_id="s", id="d1", path="/tmp/d1.pdf"),
+            ])
+            await db.commit()
+            cached = await plans.get_plan("s", db)
+
+            # Uploaded through another worker while this one holds the plan.
+            db.add(Document(stack_id="s", id="d2", path="/tmp/d2.pdf"))
+            await db.commit()
+
+            assert await plans.get_plan("s", db) is cached
+            assert [d["id"] for d in cached.document_list()] == ["d1"]
+            assert {d["id"] for d in await plans.load_documents("s", db)} == {"d1", "d2"}
+
+    database(test)
+
+
+def node(node_id, node_type, **data):
+    return {"id": node_id, "data": {"type": node_type, "nodeData": data}}
+
+
+def workflow(nodes, edges=()):
+    return Workflow(id="w", stack_id="s", nodes=nodes, edges=[{"source": s, "target": t} for s, t in edges], version=1)
+
+
+def test_compile_plan_orders_nodes_topologically():
+    plan = plans.compile_plan(workflow(
+        [
+            node("out", "output"),
+            node("llm", "llm", webSearch=True, serpApi="key"),
+            node("kb", "knowledge-base"),
+            node("in", "user-input"),
+        ],
+        # Listed backwards on purpose.
+        [("llm", "out"), ("kb", "llm"), ("in", "llm"), ("in", "kb")],
+    ), documents=[])
+
+    order = [n.id for n in plan.nodes]
+    assert order == ["llm:web-search", "in", "kb", "llm", "out"]
+    deps = {n.id: set(n.depends_on) for n in plan.nodes}
+    assert deps == {"in": set(), "kb": {"in"}, "llm:web-search": set(), "llm": {"kb", "in", "llm:web-search"}, "out": {"llm"}}
+    for i, n in enumerate(plan.nodes):
+        assert set(n.depends_on) <= set(order[:i])
+
+
+def test_compile_plan_keeps_the_first_of_duplicate_nodes():
+    plan = plans.compile_plan(workflow(
+        [node("in", "user-input", query="first"), node("in", "user-input", query="second"), node("out", "output")],
+        [("in", "out")],
+    ), documents=[])
+
+    assert [n.id for n in plan.nodes] == ["in", "out"]
+    assert plan.user_query == "first"
+
+
+def test_compile_plan_rejects_cycles():
+    with pytest.raises(plans.PlanError, match="cycle"):
+        plans.compile_plan(workflow(
+            [node("in", "user-input"), node("a", "llm"), node("b", "llm"), node("out", "output")],
+            [("in", "a"), ("a", "b"), ("b", "a"), ("b", "out")],
+        ), documents=[])
@@ -0,0 +1,88 @@
+import time
+import asyncio
+
+import pytest
+
+from services.search_cache import SearchCache, cache_key
+
+
+def make_fetch(calls, value="results", delay=0.05, error=None):
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return value
+    return fetch
+
+
+def test_cache_key_ignores_credentials_and_query_spacing():
+    assert cache_key({"q": "Pump  Fault", "api_key": "a"}) == cache_key({"q": "pump fault", "api_key": "b"})
+    assert cache_key({"q": "pump"}) != cache_key({"q": "pump", "start": 10})
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache, calls = SearchCache(max_entries=8, ttl=60), []
+
+    async def main():
+        fetch = make_fetch(calls)
+        results = await asyncio.gather(*(cache.get_or_fetch({"q": "x"}, fetch) for _ in range(3)))
+        assert results == ["results"] * 3
+        assert await cache.get_or_fetch({"q": "x"}, fetch) == "results"
+
+    asyncio.run(main())
+    assert len(calls) == 1
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 2, 1)
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    cache, calls = SearchCache(max_entries=8, ttl=60), []
+
+    async def main():
+        fetch = make_fetch(calls)
+        leader = asyncio.ensure_future(cache.get_or_fetch({"q": "x"}, fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get_or_fetch({"q": "x"}, fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == "results"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(main())
+    assert len(calls) == 1
+    assert cache.get(cache_key({"q": "x"})) == "results"
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    cache, calls = SearchCache(max_entries=8, ttl=60), []
+
+    async def main():
+        fetch = make_fetch(calls, error=RuntimeError("quota"))
+        results = await asyncio.gather(*(cache.get_or_fetch({"q": "x"}, fetch) for _ in range(2)), return_exceptions=True)
+        assert [str(r) for r in results] == ["quota", "quota"]
+        assert await cache.get_or_fetch({"q": "x"}, make_fetch(calls)) == "results"
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_entries_expire_and_evict_least_recently_used(monkeypatch):
+    cache = SearchCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("a") is None
+
+
+def test_flush_round_trips_through_the_file(tmp_path):
+    path = str(tmp_path / "search.json")
+    cache = SearchCache(max_entries=8, ttl=60, path=path)
+    cache.put("a", {"organic_results": []})
+    cache.flush()
+    assert SearchCache(max_entries=8, ttl=60, path=path).get("a") == {"organic_results": []}
@@ -0,0 +1,40 @@
+import numpy as np
+
+from services.semantic_cache import SemanticCache, context_fingerprint
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_hit_needs_similarity_fingerprint_and_version():
+    cache = SemanticCache(max_entries_per_stack=8, ttl=60)
+    fingerprint = context_fingerprint(["doc"], "", [], None)
+    cache.store("s", unit(1, 0), fingerprint, 1, "answer")
+
+    assert cache.lookup("s", unit(1, 0.05), fingerprint, 1, 0.95) == "answer"
+    assert cache.lookup("s", unit(1, 1), fingerprint, 1, 0.95) is None
+    assert cache.lookup("s", unit(1, 0), context_fingerprint(["other"], "", [], None), 1, 0.95) is None
+    assert cache.lookup("s", unit(1, 0), fingerprint, 2, 0.95) is None
+    assert cache.lookup("t", unit(1, 0), fingerprint, 1, 0.95) is None
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_entries_expire_evict_and_invalidate():
+    cache = SemanticCache(max_entries_per_stack=2, ttl=60)
+    for i, vector in enumerate([unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)]):
+        cache.store("s", vector, "f", 1, f"a{i}")
+    # The oldest entry was evicted.
+    assert cache.lookup("s", unit(1, 0, 0), "f", 1, 0.95) is None
+    assert cache.lookup("s", unit(0, 0, 1), "f", 1, 0.95) == "a2"
+
+    cache.ttl = -1
+    assert cache.lookup("s", unit(0, 0, 1), "f", 1, 0.95) is None
+    assert cache.stats()["entries"] == 0
+
+    cache.ttl = 60
+    cache.store("s", unit(1, 0, 0), "f", 1, "a")
+    cache.invalidate("s")
+    assert cache.lookup("s", unit(1, 0, 0), "f", 1, 0.95) is None
+    assert cache.invalidations == 1
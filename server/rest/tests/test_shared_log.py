@@ -0,0 +1,86 @@
+import os
+
+from services.shared_log import SharedLog
+
+
+def make_logs(tmp_path, count=2):
+    directory = str(tmp_path / "stack")
+    lock = str(tmp_path / ".locks" / "stack.lock")
+    return [SharedLog(directory, "rows.jsonl", lock) for _ in range(count)]
+
+
+def test_poll_without_log_reports_nothing(tmp_path):
+    log, = make_logs(tmp_path, 1)
+    assert log.poll() is None
+
+
+def test_reader_gets_only_appended_entries(tmp_path):
+    writer, reader = make_logs(tmp_path)
+    with writer.file_lock():
+        writer.create({"dim": 3})
+        writer.append([{"id": "a"}, {"id": "b"}])
+
+    reset, entries, meta = reader.poll()
+    assert reset
+    assert entries == [{"id": "a"}, {"id": "b"}]
+    assert meta["dim"] == 3
+    assert reader.poll() is None
+
+
+def test_tail_read_is_incremental(tmp_path):
+    writer, reader = make_logs(tmp_path)
+    with writer.file_lock():
+        writer.create({})
+        writer.append([{"id": "a"}])
+    reader.poll()
+    with writer.file_lock():
+        writer.append([{"del": "a"}, {"id": "b"}])
+
+    reset, entries, _ = reader.poll()
+    assert not reset
+    assert entries == [{"del": "a"}, {"id": "b"}]
+
+
+def test_partial_line_waits_for_the_rest(tmp_path):
+    writer, reader = make_logs(tmp_path)
+    with writer.file_lock():
+        writer.create({})
+    with open(writer.log_path, "a") as f:
+        f.write('{"id": "a"}\n{"id": ')
+
+    _, entries, _ = reader.poll()
+    assert entries == [{"id": "a"}]
+    with open(writer.log_path, "a") as f:
+        f.write('"b"}\n')
+    _, entries, _ = reader.poll()
+    assert entries == [{"id": "b"}]
+
+
+def test_rewrite_starts_a_new_epoch(tmp_path):
+    writer, reader = make_logs(tmp_path)
+    with writer.file_lock():
+        writer.create({})
+        writer.append([{"id": "a"}, {"id": "b"}, {"del": "a"}])
+    reader.poll()
+
+    with writer.file_lock():
+        writer.rewrite([{"id": "b"}], {})
+
+    reset, entries, _ = reader.poll()
+    assert reset
+    assert entries == [{"id": "b"}]
+
+
+def test_remove_resets_readers(tmp_path):
+    writer, reader = make_logs(tmp_path)
+    with writer.file_lock():
+        writer.create({})
+        writer.append([{"id": "a"}])
+    reader.poll()
+
+    with writer.file_lock():
+        writer.remove()
+
+    assert not os.path.exists(writer.directory)
+    assert reader.poll() == (True, [], None)
+    assert reader.poll() is None
@@ -0,0 +1,48 @@
+import io
+import os
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+
+from api import workflows
+
+
+@pytest.fixture
+def client(monkeypatch):
+    opened = []
+
+    async def get_db():
+        opened.append(1)
+        yield None
+
+    monkeypatch.setattr(workflows, "MAX_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(workflows, "UPLOAD_FORM_OVERHEAD", 512)
+    app = FastAPI()
+    app.include_router(workflows.router)
+    app.dependency_overrides[workflows.get_db] = get_db
+    with TestClient(app) as client:
+        client.opened = opened
+        yield client
+
+
+def test_oversized_upload_is_rejected_on_content_length(client):
+    response = client.post("/workflows/s/upload", files={"file": ("big.pdf", b"x" * 4096, "application/pdf")})
+    assert response.status_code == 413
+    # Turned away before the form was parsed or the endpoint ran.
+    assert client.opened == []
+
+
+def test_save_upload_still_stops_bodies_without_a_length(tmp_path, monkeypatch):
+    monkeypatch.setattr(workflows, "MAX_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(workflows, "UPLOAD_CHUNK_SIZE", 256)
+    path = str(tmp_path / "upload.part")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(workflows.save_upload(UploadFile(io.BytesIO(b"x" * 2048)), path))
+    assert error.value.status_code == 413
+    assert not os.path.exists(path)
+
+    size, digest = asyncio.run(workflows.save_upload(UploadFile(io.BytesIO(b"x" * 1000)), path))
+    assert size == 1000 and len(digest) == 64
@@ -0,0 +1,102 @@
+import os
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+# PyMuPDF is imported on first use so processes that never parse a PDF
+# (or import this module just for the constants) don't load it.
+def pdf_page_count(path: str) -> int:
+    import fitz
+
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def read_pages(path: str, start: int, count: int) -> List[str]:
+    # Top-level so it can be shipped to the CPU process pool; only `count`
+    # pages of text are ever held at once.
+    import fitz
+
+    with fitz.open(path) as doc:
+        end = min(start + count, doc.page_count)
+        return [doc[i].get_text("text") for i in range(start, end)]
+
+
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    import fitz
+
+    with fitz.open(path) as doc:
+        for page in doc:
+            yield page.get_text("text")
+
+
+def parse_pdf(path: str) -> str:
+    return "".join(iter_pdf_pages(path))
+
+
+class Chunker:
+    """Incremental word-window chunker.
+
+    Text is fed page by page and only the words that have not been emitted
+    yet are buffered. Produces the same windows as ``chunk_text`` on the
+    concatenated text.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.step = chunk_size - overlap
+        self._words: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        self._words.extend(text.split())
+        chunks = []
+        while len(self._words) >= self.chunk_size:
+            chunks.append(" ".join(self._words[:self.chunk_size]))
+            del self._words[:self.step]
+        return chunks
+
+    def flush(self) -> List[str]:
+        chunks = [
+            " ".join(self._words[start:start + self.chunk_size])
+            for start in range(0, len(self._words), self.step)
+        ]
+        self._words = []
+        return chunks
+
+
+def iter_chunks(pages: Iterable[str], chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP) -> Iterator[str]:
+    chunker = Chunker(chunk_size, overlap)
+    for text in pages:
+        yield from chunker.feed(text)
+    yield from chunker.flush()
+
+
+def iter_batches(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def next_batch(items: Iterator[T], size: int) -> List[T]:
+    return list(islice(items, size))
+
+
+def chunk_text(text: str, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    return list(iter_chunks([text], chunk_size, overlap))
+
+
+def extract_chunks(path: str) -> List[str]:
+    return list(iter_chunks(iter_pdf_pages(path)))
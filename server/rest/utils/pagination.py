@@ -0,0 +1,61 @@
+import os
+import json
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = int(os.getenv("LIST_DEFAULT_LIMIT", "100"))
+MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_LIMIT", "500"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    payload = json.dumps([created_at.isoformat(), row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def page_size(limit: Optional[int]) -> int:
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, created_col, id_col, cursor: Optional[str], limit: int):
+    """Order by (created_at, id) and resume strictly after ``cursor``.
+
+    Fetches one extra row so the caller can tell whether another page exists.
+    The plain ascending order matches the ``(created_at, id)`` indexes, so
+    the database walks the index instead of sorting; migrations backfill
+    NULL ``created_at`` values for this.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            created_col > created_at,
+            and_(created_col == created_at, id_col > row_id),
+        ))
+    return query.order_by(created_col.asc(), id_col.asc()).limit(limit + 1)
+
+
+def finish_page(rows: Sequence[Any], limit: int, response: Response) -> List[Any]:
+    """Trim the look-ahead row and expose the next cursor as a header, so list
+    endpoints keep returning a plain JSON array."""
+    rows = list(rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
+    return rows